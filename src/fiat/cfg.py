@@ -21,7 +21,7 @@ MODEL_ENTRIES = (
     MANDATORY_MODEL_ENTRIES
     + MANDATORY_GEOM_ENTRIES
     + MANDATORY_GRID_ENTRIES
-    + ["exposure.csv.file"]  # Check for the only non mandatory file
+    + ["exposure.csv.file", "output.zones.file"]  # The non mandatory files
 )
 
 
@@ -54,13 +54,6 @@ class Configurations(dict):
         # Load the config as a simple flat dictionary
         dict.__init__(self, flatten_dict(settings, "", "."))
 
-        # Set the cache size per GDAL object
-        # _cache_size = self.get("model.gdal_cache")
-        # if _cache_size is not None:
-        #     gdal.SetCacheMax(_cache_size * 1024**2)
-        # else:
-        #     gdal.SetCacheMax(50 * 1024**2)
-
         # Do some checking concerning the file paths in the settings file
         for key, item in self.items():
             if not any([re.match(f"^{pattern}$", key) for pattern in MODEL_ENTRIES]):
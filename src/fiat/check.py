@@ -226,6 +226,17 @@ def check_exp_columns(
         raise FIATDataError(msg)
 
 
+def check_exp_aggregate_fields(
+    fields: tuple | list,
+    columns: tuple | list,
+):
+    """Check whether the fields to aggregate by are present in the exposure data."""
+    _missing = [item for item in fields if item not in columns]
+    if _missing:
+        msg = f"Fields to aggregate by not found in the exposure data: {_missing}"
+        raise FIATDataError(msg)
+
+
 def check_exp_derived_types(
     type: str,
     found: tuple | list,
@@ -104,7 +104,13 @@ def run(args):
     )
     obj = _models[model_type]["model"](cfg)
     if args.profile is not None:
-        run_profiler(obj.run, profile=args.profile, cfg=cfg, logger=logger)
+        run_profiler(
+            obj.run,
+            profile=args.profile,
+            cfg=cfg,
+            logger=logger,
+            jobs=args.profile_jobs,
+        )
     else:
         run_log(obj.run, logger=logger)
 
@@ -200,6 +206,14 @@ def args_parser():
         action="store_const",
         const="profile",
     )
+    run_parser.add_argument(
+        "--profile-jobs",
+        metavar="<N>",
+        help="Only profile the first N jobs executed by the workers",
+        type=int,
+        action="store",
+        default=None,
+    )
     run_parser.set_defaults(func=run)
     return parser
 
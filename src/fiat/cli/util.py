@@ -47,25 +47,45 @@ def run_profiler(
     profile: str,
     cfg: Configurations,
     logger: Logger,
+    jobs: int = None,
 ):
-    """Run the profiler from cli."""
+    """Run the profiler from cli.
+
+    Jobs that are executed in worker processes are profiled by the workers
+    themselves. Their stats are merged with those of the main process.
+    """
     logger.warning("Running profiler...")
 
+    # Let the models know where the worker processes should dump their stats
+    profile_out = cfg.get("output.path") / profile
+    for item in cfg.get("output.path").glob(f"{profile}_job*.prof"):
+        item.unlink()
+    cfg.set("_profile", profile_out)
+    cfg.set("_profile_jobs", jobs)
+
     # Setup the profiler and run the function
     profiler = cProfile.Profile()
     profiler.enable()
     run_log(func, logger=logger)
     profiler.disable()
 
+    # Merge the stats of the worker processes (if any)
+    stats = pstats.Stats(profiler)
+    worker_files = sorted(cfg.get("output.path").glob(f"{profile}_job*.prof"))
+    if worker_files:
+        stats.add(*[str(item) for item in worker_files])
+        logger.info(f"Merged profiling stats of {len(worker_files)} worker job(s)")
+        for item in worker_files:
+            item.unlink()
+
     # Save all the stats
-    profile_out = cfg.get("output.path") / profile
-    profiler.dump_stats(profile_out)
+    stats.dump_stats(profile_out)
     logger.info(f"Saved profiling stats to: {profile_out}")
 
     # Save a human readable portion to a text file
     txt_out = cfg.get("output.path") / "profile.txt"
     with open(txt_out, "w") as _w:
         _w.write(f"Delft-FIAT profile ({cfg.filepath}):\n\n")
-        stats = pstats.Stats(profiler, stream=_w)
+        stats.stream = _w
         _ = stats.sort_stats("tottime").print_stats()
         logger.info(f"Saved profiling stats in human readable format: {txt_out}")
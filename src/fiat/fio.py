@@ -2,20 +2,49 @@
 
 import atexit
 import gc
+import hashlib
+import mmap
 import os
+import pickle
 import weakref
 from abc import ABCMeta, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BufferedReader, BytesIO, FileIO
-from math import floor, log10
+from itertools import islice
+from math import ceil, floor, log10
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
 from multiprocessing.synchronize import Lock
 from pathlib import Path
 from typing import Any
 
-from numpy import arange, array, column_stack, interp, ndarray
+from numpy import (
+    arange,
+    argsort,
+    array,
+    asarray,
+    column_stack,
+    concatenate,
+    cumsum,
+    flatnonzero,
+    float64,
+    full,
+    int64,
+    interp,
+    load,
+    ndarray,
+    save,
+    searchsorted,
+    unique,
+    zeros,
+)
 from osgeo import gdal, ogr, osr
 from osgeo_utils.ogrmerge import process as ogr_merge
 
 from fiat.error import DriverNotFoundError
+from fiat.job import execute_pool, generate_jobs
+from fiat.log import spawn_logger
 from fiat.util import (
     DD_NEED_IMPLEMENTED,
     DD_NOT_IMPLEMENTED,
@@ -28,17 +57,28 @@ from fiat.util import (
     DummyLock,
     _dtypes_from_string,
     _dtypes_reversed,
+    convert_array,
+    create_windows,
+    deter_dec,
     deter_type,
     find_duplicates,
+    find_newlines,
     get_srs_repr,
+    parse_text_chunk,
     read_gridsource_layers,
     regex_pattern,
     replace_empty,
+    scan_text_chunk,
     text_chunk_gen,
 )
+from fiat.version import __version__
+
+logger = spawn_logger("fiat.io")
 
 _IOS = weakref.WeakValueDictionary()
 _IOS_COUNT = 1
+_SHARED = {}
+CSV_ENGINES = ("python", "numpy")
 
 gdal.AllRegister()
 
@@ -56,6 +96,15 @@ def _DESTRUCT():
         del item
 
 
+def _attach_shared(name: str, shape: tuple, dtype: str):
+    """Attach to an array in shared memory, e.g. in a worker process."""
+    shm = _SHARED.get(name)
+    if shm is None:
+        shm = SharedMemory(name=name)
+        _SHARED[name] = shm
+    return ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
 atexit.register(_DESTRUCT)
 
 
@@ -200,9 +249,11 @@ class BufferHandler:
         return f"<{self.__class__.__name__} file='{self.path}' encoding=''>"
 
     def __getstate__(self):
-        if self.stream is not None:
-            self.close_stream()
-        return self.__dict__
+        # Leave the stream of this object untouched
+        d = self.__dict__.copy()
+        d["stream"] = None
+        d["size"] = None
+        return d
 
     def __setstate__(self, d):
         self.__dict__ = d
@@ -228,6 +279,33 @@ class BufferHandler:
         self.stream = None
         self.size = None
 
+    def row_offsets(
+        self,
+        nrow: int,
+    ):
+        """Return the offsets of the rows (after the skipped part).
+
+        Parameters
+        ----------
+        nrow : int
+            Number of rows.
+
+        Returns
+        -------
+        list
+            The offsets in bytes.
+        """
+        offsets = [None] * nrow
+        _c = 0
+
+        with self as h:
+            while True:
+                offsets[_c] = h.tell()
+                _c += 1
+                if not h.readline() or _c == nrow:
+                    break
+        return offsets
+
     def setup_stream(self):
         """Set up the steam to the file."""
         self.stream = BufferedReader(FileIO(self.path))
@@ -249,6 +327,80 @@ class BufferHandler:
         self.stream.seek(0)
 
 
+class MmapHandler(BufferHandler):
+    """Handle a memory mapped file.
+
+    The offsets of the newline characters are determined once (vectorized) and
+    kept as a compact array. They are carried along when pickling the handler,
+    so they are not recomputed in other processes.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file.
+    skip : int, optional
+        Amount of characters to skip at the beginning of the file, by default 0
+    offsets : ndarray | Path | str, optional
+        Offsets directly after the newline characters, either as an array or as a
+        path to a file created with `save_offsets`. By default None
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        skip: int = 0,
+        offsets: ndarray | Path | str = None,
+    ):
+        if isinstance(offsets, (Path, str)):
+            offsets = load(offsets)
+        self.offsets = offsets
+        BufferHandler.__init__(self, path, skip)
+
+    def row_offsets(
+        self,
+        nrow: int,
+    ):
+        """Return the offsets of the rows (after the skipped part).
+
+        Parameters
+        ----------
+        nrow : int
+            Number of rows.
+
+        Returns
+        -------
+        ndarray
+            The offsets in bytes.
+        """
+        offsets = self.offsets[self.offsets > self.skip]
+        return concatenate(([self.skip], offsets))[:nrow].astype(int64)
+
+    def save_offsets(
+        self,
+        path: Path | str,
+    ):
+        """Save the offsets of the newline characters to a file.
+
+        Parameters
+        ----------
+        path : Path | str
+            Path to the (numpy) file.
+        """
+        save(path, self.offsets)
+
+    def setup_stream(self):
+        """Set up the steam to the file."""
+        with open(self.path, "rb") as _r:
+            if os.fstat(_r.fileno()).st_size == 0:
+                raise ValueError(f"Cannot memory map an empty file: {self.path}")
+            self.stream = mmap.mmap(_r.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sniffer()
+        if self.offsets is None:
+            self.offsets = find_newlines(self.stream, nchar=self.nchar)
+        self.size = len(self.offsets)
+        self.stream.seek(self.skip)
+
+
 class BufferedGeomWriter:
     """Write geometries from a buffer.
 
@@ -262,6 +414,14 @@ class BufferedGeomWriter:
         The definition of the layer, by default None
     buffer_size : int, optional
         The size of the buffer, by default 100000
+    buffer_bytes : int, optional
+        The (approximate) memory footprint of the buffer in bytes. When set, the
+        buffer is also flushed when this is exceeded, by default None
+    keep_fid : bool, optional
+        Whether the feature ids of the added features are kept, also in the file.
+        Reading the file in the order of the feature ids (e.g. GeoPackage) then
+        gives the original order, regardless of the order in which the features
+        were added, by default False
     """
 
     def __init__(
@@ -271,6 +431,8 @@ class BufferedGeomWriter:
         layer_defn: ogr.FeatureDefn = None,
         buffer_size: int = 100000,  # geometries
         lock: Lock = None,
+        buffer_bytes: int = None,
+        keep_fid: bool = False,
     ):
         # Ensure pathlib.Path
         file = Path(file)
@@ -305,10 +467,13 @@ class BufferedGeomWriter:
             layer_defn,
         )
         # Set some check vars
-        # TODO: do this based om memory foodprint
-        # Needs some reseach into ogr's memory tracking
+        # The memory foodprint is estimated from the geometry and field data,
+        # as ogr does not track the memory of the in-memory dataset
         self.max_size = buffer_size
+        self.max_bytes = buffer_bytes
+        self.keep_fid = keep_fid
         self.size = 0
+        self.nbytes = 0
 
     def __del__(self):
         self.buffer = None
@@ -337,6 +502,24 @@ class BufferedGeomWriter:
 
         # Reset current size
         self.size = 0
+        self.nbytes = 0
+
+    def _check_size(
+        self,
+        ft: ogr.Feature,
+    ):
+        """Flush the buffer to the drive when it's full."""
+        if self.max_bytes is not None:
+            geom = ft.GetGeometryRef()
+            self.nbytes += 16 * ft.GetFieldCount()
+            if geom is not None:
+                self.nbytes += geom.WkbSize()
+            geom = None
+
+        if self.size + 1 > self.max_size or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            self.to_drive()
 
     def close(self):
         """Close the buffer."""
@@ -357,10 +540,7 @@ class BufferedGeomWriter:
             The feature.
         """
         self.buffer.add_feature(ft)
-
-        if self.size + 1 > self.max_size:
-            self.to_drive()
-
+        self._check_size(ft)
         self.size += 1
 
     def add_feature_with_map(
@@ -381,11 +561,9 @@ the fields in the buffer.
         self.buffer.add_feature_with_map(
             ft,
             fmap=fmap,
+            keep_fid=self.keep_fid,
         )
-
-        if self.size + 1 > self.max_size:
-            self.to_drive()
-
+        self._check_size(ft)
         self.size += 1
 
     def create_fields(
@@ -409,6 +587,7 @@ the fields in the buffer.
             self.file.as_posix(),
             f"/vsimem/{self.file.stem}.gpkg",
             out_layer_name=self.file.stem,
+            preserve_fid=self.keep_fid,
         )
         self.lock.release()
 
@@ -499,6 +678,69 @@ class BufferedTextWriter(BytesIO):
         self.write(by)
 
 
+class AsyncWriter:
+    """Write chunks of gridded data in a background thread (write-behind).
+
+    The writes are done in order by one thread, so the datasets are never
+    accessed by multiple threads at once. Only a limited amount of writes is
+    pending, after which writing blocks until the oldest one is done.
+
+    Parameters
+    ----------
+    depth : int, optional
+        The maximum amount of pending writes, by default 4
+    """
+
+    def __init__(
+        self,
+        depth: int = 4,
+    ):
+        self.depth = max(depth, 1)
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        """Wait for the pending writes and stop the thread."""
+        if self._pool is None:
+            return
+        self.flush()
+        self._pool.shutdown()
+        self._pool = None
+
+    def flush(self):
+        """Wait for all the pending writes."""
+        while self._pending:
+            self._pending.popleft().result()
+
+    def write(
+        self,
+        band: gdal.Band,
+        chunk: array,
+        upper_left: tuple | list,
+    ):
+        """Write a chunk of data to a band.
+
+        Parameters
+        ----------
+        band : gdal.Band
+            The band to write to.
+        chunk : array
+            Array of data. This should not be altered afterwards.
+        upper_left : tuple | list
+            Upper left corner of the chunk (indices).
+        """
+        if len(self._pending) >= self.depth:
+            self._pending.popleft().result()
+        self._pending.append(self._pool.submit(band.WriteArray, chunk, *upper_left))
+
+
 ## Parsing
 class CSVParser:
     """Parse a csv file.
@@ -513,6 +755,15 @@ class CSVParser:
         Whether there is a header or not.
     index : str, optional
         Index of the csv file (row wise), by default None
+    engine : str, optional
+        The parsing engine, either 'python' or 'numpy', by default 'python'.
+        The 'numpy' engine splits, infers the types of and converts whole columns
+        at once.
+    threads : int, optional
+        Number of processes used by the 'numpy' engine, by default 1
+    lazy : bool, optional
+        Whether the data is read lazily. If so, the 'numpy' engine only scans
+        the file for the types and the index. By default False
     """
 
     def __init__(
@@ -521,8 +772,18 @@ class CSVParser:
         delimiter: str,
         header: bool,
         index: str = None,
+        engine: str = "python",
+        threads: int = 1,
+        lazy: bool = False,
     ):
+        if engine not in CSV_ENGINES:
+            raise ValueError(
+                f"Unknown csv engine: '{engine}', choose from {CSV_ENGINES}"
+            )
         self.delimiter = delimiter
+        self.engine = engine
+        self.threads = threads
+        self.lazy = lazy
         self.data = handler
         self.meta = {}
         self.meta["index_col"] = -1
@@ -532,6 +793,7 @@ class CSVParser:
         self.meta["nchar"] = self.data.nchar
         self.index = None
         self.columns = None
+        self._fields = None
         self._nrow = self.data.size
         self._ncol = 0
 
@@ -630,6 +892,10 @@ class CSVParser:
             _dtypes = None
             _get_dtypes = False
 
+        if self.engine == "numpy":
+            self._parse_fields(idcol if _get_index else None, _get_dtypes)
+            return
+
         if _get_dtypes or _get_index:
             if _get_dtypes:
                 _dtypes = [0] * self._ncol
@@ -653,6 +919,66 @@ class CSVParser:
                     func = self.meta["dtypes"][idcol]
                     self.index = [func(item.decode()) for item in _index]
 
+    def _parse_fields(
+        self,
+        idcol: int | None,
+        get_dtypes: bool,
+    ):
+        """Parse the csv file into an array of fields (numpy engine).
+
+        The file is split into parts that are parsed in parallel when multiple
+        threads are set. For a lazy read, the parts are only scanned in chunks
+        for the types and the index, i.e. the fields are not kept.
+        """
+        # Split the file in parts on the line endings
+        nchar = self.data.nchar
+        stream = self.data.stream
+        bounds = [self.data.skip]
+        stream.seek(0, 2)
+        size = stream.tell()
+        step = (size - self.data.skip) // max(self.threads, 1)
+        for idx in range(1, self.threads):
+            stream.seek(self.data.skip + idx * step)
+            stream.readline()
+            bounds.append(max(stream.tell(), bounds[-1]))
+        bounds.append(size)
+        stream.seek(self.data.skip)
+
+        # Parse the parts
+        kwargs = {
+            "path": self.data.path,
+            "start": bounds[:-1],
+            "end": bounds[1:],
+            "delimiter": self.delimiter,
+            "ncol": self._ncol,
+            "nchar": nchar,
+        }
+        if self.lazy:
+            kwargs["idcol"] = idcol
+        res = execute_pool(
+            ctx=get_context("spawn"),
+            func=scan_text_chunk if self.lazy else parse_text_chunk,
+            jobs=generate_jobs(kwargs, tied=["start", "end"]),
+            threads=min(self.threads, len(bounds) - 1),
+        )
+
+        if get_dtypes:
+            _dtypes = [max(item) for item in zip(*[item[1] for item in res])]
+            self.meta["dtypes"] = [_dtypes_reversed[item] for item in _dtypes]
+        if self.lazy:
+            if idcol is not None:
+                _index = concatenate([item[0] for item in res])
+        else:
+            self._fields = concatenate([item[0] for item in res])
+            if idcol is not None:
+                _index = self._fields[:, idcol]
+        if idcol is not None:
+            self.index = convert_array(
+                _index,
+                self.meta["dtypes"][idcol],
+                fill=None,
+            ).tolist()
+
     def resolve_column_headers(self):
         """Resolve the column headers."""
         _cols = self.columns
@@ -673,6 +999,7 @@ class CSVParser:
     def read(
         self,
         lazy: bool = False,
+        columnar: bool = False,
     ):
         """Read the parsed csv file into a data structure.
 
@@ -680,6 +1007,8 @@ class CSVParser:
         ----------
         lazy : bool, optional
             Whether to read the data lazily or not, by default False
+        columnar : bool, optional
+            Whether to store the data per column (typed), by default False
 
         Returns
         -------
@@ -687,6 +1016,7 @@ class CSVParser:
             Data structure.
         """
         if lazy:
+            self._fields = None
             return TableLazy(
                 data=self.data,
                 index=self.index,
@@ -694,15 +1024,84 @@ class CSVParser:
                 **self.meta,
             )
 
+        if self._fields is not None:
+            fields = self._fields
+            self._fields = None
+            return Table.from_fields(
+                fields=fields,
+                index=self.index,
+                columns=self.columns,
+                columnar=columnar,
+                **self.meta,
+            )
+
         return Table.from_stream(
             data=self.data,
             index=self.index,
             columns=self.columns,
+            columnar=columnar,
             **self.meta,
         )
 
 
 ## Structs
+def _grid_window(
+    shape: tuple,
+    chunk: tuple,
+    row: int,
+    col: int,
+):
+    """Return the window (x, y, width, height) of a chunk by its position."""
+    return (
+        col * chunk[1],
+        row * chunk[0],
+        min(chunk[1], shape[1] - col * chunk[1]),
+        min(chunk[0], shape[0] - row * chunk[0]),
+    )
+
+
+def read_ahead(
+    func: callable,
+    items: list | tuple,
+    depth: int = 2,
+):
+    """Read ahead in a background thread.
+
+    The (reading) function is called for the next items while the current one
+    is processed. GDAL releases the GIL while reading, so reading and
+    processing overlap.
+
+    Parameters
+    ----------
+    func : callable
+        Function that reads the data of an item.
+    items : list | tuple
+        The items, e.g. windows.
+    depth : int, optional
+        The amount of items read ahead, by default 2. No reading ahead
+        when smaller than 1.
+
+    Yields
+    ------
+    tuple
+        The item and the data returned by the function.
+    """
+    if depth < 1:
+        for item in items:
+            yield item, func(item)
+        return
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = deque(
+            [(item, pool.submit(func, item)) for item in islice(items, depth)]
+        )
+        while pending:
+            item, future = pending.popleft()
+            for nxt in islice(items, 1):
+                pending.append((nxt, pool.submit(func, nxt)))
+            yield item, future.result()
+
+
 class Grid(
     _BaseIO,
     _BaseStruct,
@@ -740,6 +1139,7 @@ class Grid(
         self.dtype_size = gdal.GetDataTypeSize(self.dtype)
 
         self._last_chunk = None
+        self._writer = None
 
         if chunk is None:
             self._chunk = self.shape
@@ -754,7 +1154,7 @@ class Grid(
         return self
 
     def __next__(self):
-        if self._u > self._y:
+        if self._u >= self._y:
             self.flush()
             raise StopIteration
 
@@ -770,7 +1170,7 @@ class Grid(
         chunk = self[window]
 
         self._l += self._chunk[1]
-        if self._l > self._x:
+        if self._l >= self._x:
             self._l = 0
             self._u += self._chunk[0]
 
@@ -795,6 +1195,8 @@ class Grid(
 
     def flush(self):
         """Flush the grid object."""
+        if self._writer is not None:
+            self._writer.flush()
         if self.src is not None:
             self.src.FlushCache()
 
@@ -816,6 +1218,20 @@ class Grid(
         """
         return self._y, self._x
 
+    @property
+    def block_size(self):
+        """Return the native block size of the band.
+
+        According to normal reading, i.e. rows, columns.
+
+        Returns
+        -------
+        tuple
+            Size in y direction, size in x direction
+        """
+        x, y = self.src.GetBlockSize()
+        return y, x
+
     @property
     def shape_xy(self):
         """Return the shape of the grid.
@@ -848,6 +1264,73 @@ class Grid(
         res = str(self.src.GetMetadataItem(entry))
         return res
 
+    def occupancy(
+        self,
+        chunk: tuple = None,
+        threshold: float = None,
+    ) -> ndarray:
+        """Determine per window whether it contains any data.
+
+        Windows that are not stored at all (sparse files) are not read.
+
+        Parameters
+        ----------
+        chunk : tuple, optional
+            The size of the windows (rows, columns). If not set, the chunk size
+            of the grid is used.
+        threshold : float, optional
+            Only count the cells with a value above this threshold, e.g. to find
+            the wet windows of hazard data. By default None, i.e. all data.
+
+        Returns
+        -------
+        ndarray
+            Boolean array with a value per window (row, column), True if any of
+            the cells is not nodata (and above the threshold).
+        """
+        chunk = chunk or self._chunk
+        rows = ceil(self._y / chunk[0])
+        cols = ceil(self._x / chunk[1])
+        res = zeros((rows, cols), dtype=bool)
+        for row in range(rows):
+            for col in range(cols):
+                window = _grid_window(self.shape, chunk, row, col)
+                # Blocks that are not stored are read as nodata
+                flags, _ = self.src.GetDataCoverageStatus(*window)
+                if (
+                    self.nodata is not None
+                    and flags == gdal.GDAL_DATA_COVERAGE_STATUS_EMPTY
+                ):
+                    continue
+                data = self[window]
+                mask = data != self.nodata
+                if threshold is not None:
+                    mask &= data > threshold
+                res[row, col] = mask.any()
+        return res
+
+    def prefetch(
+        self,
+        depth: int = 2,
+    ):
+        """Iterate over the windows while reading ahead in a background thread.
+
+        See [read_ahead](/api/fio/read_ahead.qmd).
+
+        Parameters
+        ----------
+        depth : int, optional
+            The amount of windows read ahead, by default 2
+
+        Yields
+        ------
+        tuple
+            The window and the data.
+        """
+        self.flush()
+        windows = create_windows(self.shape_xy, self._chunk[::-1])
+        yield from read_ahead(self.__getitem__, windows, depth)
+
     def set_chunk_size(
         self,
         chunk: tuple,
@@ -861,6 +1344,19 @@ class Grid(
         """
         self._chunk = chunk
 
+    def set_writer(
+        self,
+        writer: AsyncWriter,
+    ):
+        """Set a writer for writing the chunks in the background.
+
+        Parameters
+        ----------
+        writer : AsyncWriter
+            The writer, shared by all bands of a dataset (or all datasets).
+        """
+        self._writer = writer
+
     @_BaseIO._check_mode
     def write_chunk(
         self,
@@ -869,7 +1365,8 @@ class Grid(
     ):
         """Write a chunk of data to the band.
 
-        Only in write (`'w'`) mode.
+        Only in write (`'w'`) mode. When a writer is set (`set_writer`), the
+        chunk is written in the background.
 
         Parameters
         ----------
@@ -879,6 +1376,9 @@ class Grid(
             Upper left corner of the chunk.
             N.b. these are not coordinates, but indices.
         """
+        if self._writer is not None:
+            self._writer.write(self.src, chunk, upper_left)
+            return
         self.src.WriteArray(chunk, *upper_left)
 
 
@@ -1031,7 +1531,9 @@ class GeomSource(_BaseIO, _BaseStruct):
     ):
         """Yield items on an interval.
 
-        Creates a python generator.
+        Creates a python generator. Reading starts at the starting index
+        (`SetNextByIndex`) and stops after the ending index, so only the
+        features of the interval are read.
 
         Parameters
         ----------
@@ -1045,11 +1547,45 @@ class GeomSource(_BaseIO, _BaseStruct):
         ogr.Feature
             Features from the vector layer.
         """
-        _c = 1
-        for ft in self.layer:
-            if si <= _c <= ei:
-                yield ft
-            _c += 1
+        si = max(si, 1)
+        self.layer.ResetReading()
+        if si > 1 and self.layer.SetNextByIndex(si - 1) != ogr.OGRERR_NONE:
+            return
+        for _ in range(ei - si + 1):
+            ft = self.layer.GetNextFeature()
+            if ft is None:
+                break
+            yield ft
+
+    def fid_iter(
+        self,
+        fids: list | ndarray,
+        missing: list = None,
+    ):
+        """Yield the features in the order of their feature ids.
+
+        Creates a python generator. Every feature is read separately, which is
+        only fast for layers with random access (`ogr.OLCRandomRead`).
+
+        Parameters
+        ----------
+        fids : list | ndarray
+            The feature ids.
+        missing : list, optional
+            A list to which the feature ids that are not found are appended.
+
+        Returns
+        -------
+        ogr.Feature
+            Features from the vector layer.
+        """
+        for fid in fids:
+            ft = self.layer.GetFeature(int(fid))
+            if ft is None:
+                if missing is not None:
+                    missing.append(int(fid))
+                continue
+            yield ft
 
     def reopen(
         self,
@@ -1172,6 +1708,7 @@ class GeomSource(_BaseIO, _BaseStruct):
         self,
         in_ft: ogr.Feature,
         fmap: zip,
+        keep_fid: bool = False,
     ):
         """Add a feature with extra field data.
 
@@ -1182,9 +1719,13 @@ class GeomSource(_BaseIO, _BaseStruct):
         fmap : zip
             Extra fields data, i.e. a zip object of fields id's
             and the correspondingv alues
+        keep_fid : bool, optional
+            Whether to keep the feature id of the feature, by default False
         """
         ft = ogr.Feature(self.layer.GetLayerDefn())
         ft.SetFrom(in_ft)
+        if keep_fid:
+            ft.SetFID(in_ft.GetFID())
 
         for key, item in fmap:
             ft.SetField(key, item)
@@ -1825,6 +2366,338 @@ multiple variables.
         self.src.SetSpatialRef(srs)
 
 
+class SparseGrid:
+    """Gridded data of which only the cells with data are stored.
+
+    Per band the flat indices of the cells (row * columns + column) and their
+    values are stored, grouped per chunk (window) of the grid. The cells of a
+    window are therefore found directly, without reading or searching the
+    (mostly empty) window itself.
+
+    The arrays can be saved to files and memory mapped (`save`), in which case
+    only the path is pickled.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the grid (rows, columns).
+    chunk : tuple
+        Chunk (window) size (rows, columns).
+    indices : list
+        Flat indices of the cells per band.
+    values : list
+        Values of the cells per band.
+    offsets : list
+        Per band the start of every window in the indices and values.
+    nodata : list
+        Nodata value per band.
+    """
+
+    def __init__(
+        self,
+        shape: tuple,
+        chunk: tuple,
+        indices: list,
+        values: list,
+        offsets: list,
+        nodata: list,
+    ):
+        self.shape = tuple(shape)
+        self.chunk = tuple(chunk)
+        self.nodata = list(nodata)
+        self.path = None
+        self._indices = list(indices)
+        self._values = list(values)
+        self._offsets = list(offsets)
+        self._nx = ceil(self.shape[1] / self.chunk[1])
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        if self.path is not None:
+            d["_indices"] = d["_values"] = d["_offsets"] = None
+        return d
+
+    def __len__(self):
+        return sum([item.size for item in self._indices])
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} shape={self.shape} cells={len(self)}>"
+
+    def __setstate__(self, d):
+        self.__dict__ = d
+        if self.path is not None:
+            self._load()
+
+    def _files(self, idx: int):
+        return [
+            Path(self.path, f"band{idx}_{item}.npy")
+            for item in ("indices", "values", "offsets")
+        ]
+
+    def _load(self):
+        arrays = [
+            [load(item, mmap_mode="r") for item in self._files(idx + 1)]
+            for idx in range(self.size)
+        ]
+        self._indices, self._values, self._offsets = map(list, zip(*arrays))
+
+    @classmethod
+    def from_grid(
+        cls,
+        src: "GridSource",
+        chunk: tuple = None,
+    ):
+        """Create the sparse representation of a GridSource.
+
+        Parameters
+        ----------
+        src : GridSource
+            The gridded data.
+        chunk : tuple, optional
+            Chunk (window) size (rows, columns), by default the chunk size of the
+            GridSource.
+
+        Returns
+        -------
+        SparseGrid
+            The sparse grid.
+        """
+        shape = src.shape
+        chunk = tuple(chunk or src.chunk)
+        rows = ceil(shape[0] / chunk[0])
+        cols = ceil(shape[1] / chunk[1])
+        indices, values, offsets, nodata = [], [], [], []
+        for idx in range(1, src.size + 1):
+            band = src[idx]
+            counts = zeros(rows * cols + 1, dtype=int64)
+            _indices = [array([], dtype=int64)]
+            _values = [band[(0, 0, 1, 1)].ravel()[:0]]
+            for row in range(rows):
+                for col in range(cols):
+                    window = _grid_window(shape, chunk, row, col)
+                    data = band[window]
+                    local = flatnonzero(data != band.nodata)
+                    counts[row * cols + col + 1] = local.size
+                    if local.size == 0:
+                        continue
+                    cells = (local // window[2] + window[1]) * shape[1]
+                    _indices.append(cells + local % window[2] + window[0])
+                    _values.append(data.ravel()[local])
+            indices.append(concatenate(_indices).astype(int64))
+            values.append(concatenate(_values))
+            offsets.append(cumsum(counts))
+            nodata.append(band.nodata)
+        return cls(shape, chunk, indices, values, offsets, nodata)
+
+    @property
+    def size(self):
+        """Return the number of bands."""
+        return len(self.nodata)
+
+    def cells(
+        self,
+        idx: int,
+        window: tuple,
+    ):
+        """Return the cells with data within a window.
+
+        Parameters
+        ----------
+        idx : int
+            The band number (starting at 1).
+        window : tuple
+            The window (upper left x, upper left y, width, height), aligned to the
+            chunks.
+
+        Returns
+        -------
+        tuple
+            The rows and columns (relative to the window) and the values.
+        """
+        n = (window[1] // self.chunk[0]) * self._nx + window[0] // self.chunk[1]
+        start, end = self._offsets[idx - 1][n : n + 2]
+        flat = asarray(self._indices[idx - 1][start:end])
+        rows = flat // self.shape[1] - window[1]
+        cols = flat % self.shape[1] - window[0]
+        return rows, cols, asarray(self._values[idx - 1][start:end])
+
+    def count(
+        self,
+        idx: int,
+        window: tuple,
+    ):
+        """Return the number of cells with data within a window.
+
+        Parameters
+        ----------
+        idx : int
+            The band number (starting at 1).
+        window : tuple
+            The window (upper left x, upper left y, width, height), aligned to the
+            chunks.
+
+        Returns
+        -------
+        int
+            The number of cells.
+        """
+        n = (window[1] // self.chunk[0]) * self._nx + window[0] // self.chunk[1]
+        start, end = self._offsets[idx - 1][n : n + 2]
+        return int(end - start)
+
+    def save(
+        self,
+        path: Path | str,
+    ):
+        """Save the arrays to (numpy) files and memory map them.
+
+        Parameters
+        ----------
+        path : Path | str
+            Path to the directory.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for idx in range(self.size):
+            for file, data in zip(
+                self._files(idx + 1),
+                (self._indices[idx], self._values[idx], self._offsets[idx]),
+            ):
+                save(file, data)
+        self._load()
+
+
+class ArrayIndex:
+    """Compact index based on sorted arrays.
+
+    The keys are stored as a sorted array together with the (int64) positions.
+    Lookups are done via a binary search (`searchsorted`). Duplicate keys resolve
+    to the last position, like a dictionary would.
+
+    Small indices additionally keep a dictionary for fast scalar lookups.
+
+    Parameters
+    ----------
+    keys : list | tuple | ndarray
+        The keys of the index.
+    positions : list | tuple | ndarray, optional
+        The positions corresponding to the keys. By default their order.
+    """
+
+    _dict_size = 2**16
+
+    def __init__(
+        self,
+        keys: list | tuple | ndarray,
+        positions: list | tuple | ndarray = None,
+    ):
+        keys = asarray(keys)
+        if positions is None:
+            positions = arange(keys.size, dtype=int64)
+        _n = min(keys.size, len(positions))
+        keys = keys[:_n]
+        positions = asarray(positions[:_n], dtype=int64)
+
+        # Sort the keys, stable to keep the last of duplicate keys at the end
+        order = argsort(keys, kind="stable")
+        self._sorted = keys[order]
+        self._positions = positions[order]
+
+        # The unique keys in order of appearance
+        self._keys = keys
+        if _n > 1 and (self._sorted[1:] == self._sorted[:-1]).any():
+            _, first = unique(keys, return_index=True)
+            first.sort()
+            self._keys = keys[first]
+
+        self._lookup = None
+        self._set_lookup()
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, key):
+        if self._lookup is not None:
+            return self._lookup[key]
+        try:
+            idx = searchsorted(self._sorted, key, side="right") - 1
+            if idx < 0 or self._sorted[idx] != key:
+                raise KeyError(key)
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        return int(self._positions[idx])
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d["_lookup"] = None
+        return d
+
+    def __len__(self):
+        return self._keys.size
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} size={len(self)}>"
+
+    def __setstate__(self, d):
+        self.__dict__ = d
+        self._set_lookup()
+
+    def _get_each(self, keys: ndarray, res: ndarray):
+        """Resolve the keys one by one, -1 for those not present."""
+        for n, key in enumerate(keys.tolist()):
+            try:
+                res[n] = self[key]
+            except (KeyError, TypeError):
+                continue
+        return res
+
+    def _set_lookup(self):
+        """Set a dictionary for the lookups of small indices."""
+        if self._sorted.size > self._dict_size:
+            return
+        self._lookup = dict(zip(self._sorted.tolist(), self._positions.tolist()))
+
+    def get_many(
+        self,
+        keys: list | tuple | ndarray,
+    ):
+        """Get the positions of multiple keys at once.
+
+        Parameters
+        ----------
+        keys : list | tuple | ndarray
+            The keys.
+
+        Returns
+        -------
+        ndarray
+            The positions (int64), -1 where a key is not present.
+        """
+        keys = asarray(keys)
+        res = full(keys.size, -1, dtype=int64)
+        if keys.size == 0 or self._sorted.size == 0:
+            return res
+        # Mixed or missing keys (e.g. None), resolve these one by one
+        if keys.dtype == object:
+            return self._get_each(keys, res)
+        try:
+            idx = searchsorted(self._sorted, keys, side="right") - 1
+        except (TypeError, ValueError):
+            return self._get_each(keys, res)
+        found = idx >= 0
+        found[found] = self._sorted[idx[found]] == keys[found]
+        res[found] = self._positions[idx[found]]
+        return res
+
+    def keys(self):
+        """Return the keys in order of appearance."""
+        return tuple(self._keys.tolist())
+
+
 class _Table(_BaseStruct, metaclass=ABCMeta):
     """Base class for table objects.
 
@@ -1868,7 +2741,7 @@ class _Table(_BaseStruct, metaclass=ABCMeta):
 
         if index is None:
             index = tuple(range(kwargs["nrow"]))
-        self._index = dict(zip(index, index_int))
+        self._index = ArrayIndex(index, index_int)
 
     def __del__(self):
         pass
@@ -1899,10 +2772,14 @@ class _Table(_BaseStruct, metaclass=ABCMeta):
 class Table(_Table):
     """Create a struct based on tabular data in a file.
 
+    The data is either stored as one 2D array (row-major) or as typed
+    arrays per column (columnar).
+
     Parameters
     ----------
-    data : ndarray
-        The data in numpy.ndarray format.
+    data : ndarray | list
+        The data in numpy.ndarray format. When a list of (1D) arrays is supplied,
+        the data is stored per column.
     index : list | tuple, optional
         The index column from which the values are taken and used to index the rows.
     columns : list | tuple, optional
@@ -1917,12 +2794,18 @@ class Table(_Table):
 
     def __init__(
         self,
-        data: ndarray,
+        data: ndarray | list,
         index: list | tuple = None,
         columns: list | tuple = None,
         **kwargs,
     ) -> object:
-        self.data = data
+        self._shm = []
+        self._refs = None
+        self.columnar = isinstance(data, (list, tuple))
+        if self.columnar:
+            self._arrays = [asarray(item) for item in data]
+        else:
+            self._arrays = [data]
 
         # Supercharge with _Table
         _Table.__init__(
@@ -1932,6 +2815,10 @@ class Table(_Table):
             **kwargs,
         )
 
+    def __del__(self):
+        if getattr(self, "_shm", None):
+            self.release()
+
     def __iter__(self):
         raise NotImplementedError(DD_NOT_IMPLEMENTED)
 
@@ -1941,6 +2828,12 @@ class Table(_Table):
     def __getitem__(self, keys):
         keys = list(keys)
 
+        if self.columnar and keys[1] != slice(None):
+            column = self._arrays[self._columns[keys[1]]]
+            if keys[0] == slice(None):
+                return column
+            return column[self._index[keys[0]]]
+
         if keys[0] != slice(None):
             keys[0] = self._index[keys[0]]
 
@@ -1950,17 +2843,145 @@ class Table(_Table):
         return self.data[keys[0], keys[1]]
 
     def __setitem__(self, key, value):
+        if self.columnar:
+            row, col = key
+            self._arrays[col][row] = value
+            return
         self.data[key] = value
 
     def __eq__(self, other):
         return NotImplemented
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = []
+        # Only send the references to the shared memory
+        if self._refs is not None:
+            state["_arrays"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._refs is not None:
+            self._arrays = [_attach_shared(*ref) for ref in self._refs]
+
+    @property
+    def data(self):
+        """Return the data as one 2D array.
+
+        In case of columnar storage, this creates a new array.
+        """
+        if self.columnar:
+            return column_stack(self._arrays)
+        return self._arrays[0]
+
+    @data.setter
+    def data(self, value: ndarray):
+        self.columnar = False
+        self._arrays = [value]
+
+    def column(
+        self,
+        key: str,
+    ):
+        """Return a column of the table.
+
+        This is a view of the data, i.e. no data is copied.
+
+        Parameters
+        ----------
+        key : str
+            The column header.
+
+        Returns
+        -------
+        ndarray
+            The column.
+        """
+        if self.columnar:
+            return self._arrays[self._columns[key]]
+        return self._arrays[0][:, self._columns[key]]
+
+    def take(
+        self,
+        keys: list | tuple | ndarray,
+    ):
+        """Select multiple rows from the table based on the index.
+
+        Parameters
+        ----------
+        keys : list | tuple | ndarray
+            The row identifiers.
+
+        Returns
+        -------
+        Table
+            A new table containing the selected rows (in order of the keys).
+        """
+        rows = self._index.get_many(keys)
+        if (rows < 0).any():
+            missing = asarray(keys)[rows < 0].tolist()
+            raise KeyError(f"Not present in the index: {missing}")
+
+        meta = self.meta.copy()
+        meta["nrow"] = rows.size
+        data = [item[rows] for item in self._arrays]
+        if not self.columnar:
+            data = data[0]
+        return Table(
+            data=data,
+            index=asarray(keys).tolist(),
+            columns=list(self.columns),
+            **meta,
+        )
+
+    def share(self):
+        """Move the data to shared memory.
+
+        When pickled (e.g. send to a worker process), only the references to the
+        shared memory are send instead of the data itself.
+        The memory is released by calling [release](/api/Table.qmd#release) or
+        when the table is destroyed.
+        """
+        if self._shm or any([item.dtype.hasobject for item in self._arrays]):
+            return
+        arrays = []
+        for item in self._arrays:
+            shm = SharedMemory(create=True, size=max(item.nbytes, 1))
+            view = ndarray(item.shape, dtype=item.dtype, buffer=shm.buf)
+            view[...] = item
+            arrays.append(view)
+            self._shm.append(shm)
+        self._arrays = arrays
+        self._refs = [
+            (shm.name, item.shape, item.dtype.str)
+            for shm, item in zip(self._shm, arrays)
+        ]
+
+    def release(self):
+        """Release the shared memory (if present).
+
+        The data is copied back into the memory of the process.
+        """
+        if not self._shm:
+            return
+        self._arrays = [item.copy() for item in self._arrays]
+        self._refs = None
+        for shm in self._shm:
+            try:
+                shm.close()
+            except BufferError:
+                pass
+            shm.unlink()
+        self._shm = []
+
     @classmethod
     def from_stream(
         cls,
         data: BufferHandler,
         columns: list | tuple,
         index: list | tuple = None,
+        columnar: bool = False,
         **kwargs,
     ):
         """Create the Table from a data steam (file).
@@ -1973,6 +2994,8 @@ class Table(_Table):
             Columns (headers) of the file.
         index : list | tuple, optional
             The index column.
+        columnar : bool, optional
+            Whether to store the data per column, by default False
         """
         dtypes = kwargs["dtypes"]
         ncol = kwargs["ncol"]
@@ -2004,7 +3027,50 @@ class Table(_Table):
         for c in cols:
             _f.append([dtypes[c](item) for item in replace_empty(_d[c::ncol])])
 
-        data = column_stack((*_f,))
+        if columnar:
+            data = [array(item) for item in _f]
+        else:
+            data = column_stack((*_f,))
+        return cls(data=data, index=index, columns=columns, **kwargs)
+
+    @classmethod
+    def from_fields(
+        cls,
+        fields: ndarray,
+        columns: list | tuple,
+        index: list | tuple = None,
+        columnar: bool = False,
+        **kwargs,
+    ):
+        """Create the Table from an array of fields.
+
+        Parameters
+        ----------
+        fields : ndarray
+            Array of bytes (numpy dtype 'S') with the shape rows, columns.
+        columns : list | tuple
+            Columns (headers) of the file.
+        index : list | tuple, optional
+            The index column.
+        columnar : bool, optional
+            Whether to store the data per column, by default False
+        """
+        dtypes = kwargs["dtypes"]
+        index_col = kwargs["index_col"]
+        cols = list(range(kwargs["ncol"]))
+
+        if kwargs["index_name"] is not None:
+            columns.remove(kwargs["index_name"])
+            kwargs["ncol"] -= 1
+
+        if index_col >= 0 and index_col in cols:
+            if index is not None:
+                index = convert_array(fields[:, index_col], dtypes[index_col]).tolist()
+            cols.remove(index_col)
+
+        _f = [convert_array(fields[:, c], dtypes[c]) for c in cols]
+
+        data = _f if columnar else column_stack((*_f,))
         return cls(data=data, index=index, columns=columns, **kwargs)
 
     def upscale(
@@ -2039,14 +3105,14 @@ class Table(_Table):
         _f = []
 
         for c in self.columns:
-            _f.append(interp(_x, self.index, self[:, c]).tolist())
+            _f.append(interp(_x, self.index, self[:, c]))
 
-        data = column_stack(_f)
+        data = _f if self.columnar else column_stack(_f)
 
         meta.update(
             {
                 "ncol": self.meta["ncol"],
-                "nrow": len(data),
+                "nrow": len(_x),
             }
         )
 
@@ -2067,6 +3133,118 @@ class Table(_Table):
         )
 
 
+class CurveTable(Table):
+    """Create a struct of curves that are evaluated by linear interpolation.
+
+    In contrary to an upscaled [Table](/api/Table.qmd), only the breakpoints
+    of the curves are stored. Values in between are interpolated on the fly.
+
+    Parameters
+    ----------
+    data : ndarray
+        The data in numpy.ndarray format.
+    index : list | tuple, optional
+        The index (i.e. the breakpoints) of the curves.
+    columns : list | tuple, optional
+        The column headers of the table.
+    step : float, optional
+        Snap the values to the number of decimals of this step size before
+        interpolating. This reproduces the lookup in an upscaled table.
+        By default None (no snapping)
+
+    Returns
+    -------
+    object
+        An object containing the curves.
+    """
+
+    def __init__(
+        self,
+        data: ndarray,
+        index: list | tuple = None,
+        columns: list | tuple = None,
+        step: float = None,
+        **kwargs,
+    ) -> object:
+        Table.__init__(
+            self,
+            data,
+            index,
+            columns,
+            **kwargs,
+        )
+
+        # Set the snapping
+        self.step = step
+        self.decimals = None
+        if step is not None:
+            self.decimals = deter_dec(step)
+
+        # Breakpoints in ascending order for the interpolation
+        _x = asarray(self.index, dtype=float64)
+        order = argsort(_x, kind="stable")
+        self._x = _x[order]
+        self._y = asarray(
+            self.data[self._index.get_many(self.index)[order]],
+            dtype=float64,
+        )
+
+    def __getitem__(self, keys):
+        keys = list(keys)
+        if keys[0] == slice(None):
+            return Table.__getitem__(self, keys)
+        return float(self.interp(keys[0], keys[1]))
+
+    @classmethod
+    def from_table(
+        cls,
+        table: Table,
+        step: float = None,
+    ):
+        """Create the CurveTable from a Table.
+
+        Parameters
+        ----------
+        table : Table
+            The table containing the (not upscaled) curves.
+        step : float, optional
+            The step size for snapping, by default None
+        """
+        return cls(
+            data=table.data,
+            index=table.index,
+            columns=list(table.columns),
+            step=step,
+            **table.meta,
+        )
+
+    def interp(
+        self,
+        values: float | list | ndarray,
+        column: str,
+    ):
+        """Evaluate a curve for one or multiple values.
+
+        Values outside of the range of the index are clipped to that range.
+
+        Parameters
+        ----------
+        values : float | list | ndarray
+            The values, e.g. water depths.
+        column : str
+            The column header of the curve.
+
+        Returns
+        -------
+        float | ndarray
+            The interpolated values, e.g. damage fractions.
+        """
+        values = asarray(values, dtype=float64)
+        if self.decimals is not None:
+            values = values.clip(self._x[0], self._x[-1]).round(self.decimals)
+        return interp(values, self._x, self._y[:, self._columns[column]])
+
+
 class TableLazy(_Table):
     """A lazy read of tabular data in a file.
 
@@ -2097,18 +3275,7 @@ class TableLazy(_Table):
         self.data = data
 
         # Get internal indexing
-        index_int = [None] * kwargs["nrow"]
-        _c = 0
-
-        with self.data as h:
-            while True:
-                index_int[_c] = h.tell()
-                _c += 1
-                if not h.readline() or _c == kwargs["nrow"]:
-                    break
-
-        kwargs["_index_int"] = index_int
-        del index_int
+        kwargs["_index_int"] = self.data.row_offsets(kwargs["nrow"])
 
         _Table.__init__(
             self,
@@ -2136,6 +3303,36 @@ class TableLazy(_Table):
 
         return self.data.stream.readline().strip()
 
+    def get_many(
+        self,
+        oids: list | tuple | ndarray,
+    ):
+        """Get multiple rows from the table based on the index.
+
+        Parameters
+        ----------
+        oids : list | tuple | ndarray
+            Row identifiers.
+
+        Returns
+        -------
+        list
+            The rows (in order of the identifiers), None for identifiers that
+            are not present.
+        """
+        offsets = self._index.get_many(oids)
+        res = [None] * offsets.size
+
+        # Read the rows in file order, i.e. sequential instead of random access
+        stream = self.data.stream
+        for pos in argsort(offsets, kind="stable").tolist():
+            idx = int(offsets[pos])
+            if idx < 0:
+                continue
+            stream.seek(idx)
+            res[pos] = stream.readline().strip()
+        return res
+
     def _build_lazy(self):
         raise NotImplementedError(NOT_IMPLEMENTED)
 
@@ -2198,6 +3395,7 @@ def merge_geom_layers(
     overwrite: bool = False,
     single_layer: bool = False,
     out_layer_name: str = None,
+    preserve_fid: bool = False,
 ):
     """Merge multiple vector layers into one file.
 
@@ -2222,11 +3420,28 @@ def merge_geom_layers(
         Output in a single layer.
     out_layer_name : str, optional
         The name of the resulting single layer.
+    preserve_fid : bool, optional
+        Whether to keep the feature ids of the input (single layer). The feature
+        ids have to be unique within the resulting layer.
     """
     # Create pathlib.Path objects
     out_fn = Path(out_fn)
     in_fn = Path(in_fn)
 
+    # Not supported by ogrmerge, translate the layer directly
+    if preserve_fid:
+        options = {"layerName": out_layer_name, "preserveFID": True}
+        if append:
+            options["accessMode"] = "append"
+        elif overwrite:
+            options["accessMode"] = "overwrite"
+        if not append and driver is not None:
+            options["format"] = driver
+        if "vsimem" in str(in_fn):
+            in_fn = in_fn.as_posix()
+        gdal.VectorTranslate(str(out_fn), str(in_fn), **options)
+        return
+
     # Sort the arguments
     args = []
     if not append and driver is not None:
@@ -2248,6 +3463,108 @@ def merge_geom_layers(
     ogr_merge([*args])
 
 
+## Cache
+def _cache_file(
+    file: Path | str,
+    cache_dir: Path | str = None,
+    **options,
+):
+    """Return the path to a cache file and the stale ones of the same file.
+
+    The name consists of the file stem, a key based on the path and the options
+    and a key based on the state (size and modification time) of the file.
+    """
+    file = Path(file).resolve()
+    if cache_dir is None:
+        cache_dir = Path(file.parent, ".fiat_cache")
+    stat = os.stat(file)
+    opt_key = hashlib.sha256(
+        repr((file.as_posix(), __version__, sorted(options.items()))).encode()
+    ).hexdigest()[:16]
+    state_key = hashlib.sha256(
+        repr((stat.st_size, stat.st_mtime_ns)).encode()
+    ).hexdigest()[:16]
+    path = Path(cache_dir, f"{file.stem}.{opt_key}.{state_key}.pkl")
+    stale = [
+        item
+        for item in Path(cache_dir).glob(f"{file.stem}.{opt_key}.*.pkl")
+        if item != path
+    ]
+    return path, stale
+
+
+def read_cache(
+    file: Path | str,
+    cache_dir: Path | str = None,
+    **options,
+) -> object:
+    """Read an object from the cache.
+
+    The cache is invalidated when the size or the modification time of the file
+    changes.
+
+    Parameters
+    ----------
+    file : Path | str
+        Path to the file from which the object was created.
+    cache_dir : Path | str, optional
+        The cache directory. If not set, the directory '.fiat_cache' next
+        to the file is used.
+    options : dict
+        The options used when creating the object (e.g. parse options).
+
+    Returns
+    -------
+    object
+        The cached object or None if not (validly) cached.
+    """
+    path, _ = _cache_file(file, cache_dir, **options)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as _r:
+            return pickle.load(_r)
+    except Exception as e:
+        logger.debug(f"Discarded the cache of '{Path(file).name}' ({e})")
+        return None
+
+
+def write_cache(
+    obj: object,
+    file: Path | str,
+    cache_dir: Path | str = None,
+    **options,
+):
+    """Write an object to the cache.
+
+    Stale cache files of the same file (and options) are removed. Failing to
+    write the cache (e.g. a read-only directory) only results in a warning.
+
+    Parameters
+    ----------
+    obj : object
+        The object to be cached.
+    file : Path | str
+        Path to the file from which the object was created.
+    cache_dir : Path | str, optional
+        The cache directory. If not set, the directory '.fiat_cache' next
+        to the file is used.
+    options : dict
+        The options used when creating the object (e.g. parse options).
+    """
+    path, stale = _cache_file(file, cache_dir, **options)
+    tmp = Path(path.parent, f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for item in stale:
+            item.unlink(missing_ok=True)
+        with open(tmp, "wb") as _w:
+            pickle.dump(obj, _w, protocol=5)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not cache '{Path(file).name}' ({e})")
+
+
 ## Open
 def open_csv(
     file: Path | str,
@@ -2255,6 +3572,11 @@ def open_csv(
     header: bool = True,
     index: str = None,
     lazy: bool = False,
+    engine: str = "python",
+    threads: int = 1,
+    memory_map: bool = False,
+    columnar: bool = False,
+    cache: bool | Path | str = False,
 ) -> object:
     """Open a csv file.
 
@@ -2270,23 +3592,70 @@ def open_csv(
         Name of the index column.
     lazy : bool, optional
         If `True`, a lazy read is executed.
+    engine : str, optional
+        The parsing engine, either 'python' or 'numpy', by default 'python'.
+    threads : int, optional
+        Number of processes used for parsing by the 'numpy' engine, by default 1
+    memory_map : bool, optional
+        Whether to memory map the file, see [MmapHandler](/api/MmapHandler.qmd).
+        By default False
+    columnar : bool, optional
+        Whether to store the data per column as typed arrays, by default False
+    cache : bool | Path | str, optional
+        Whether to cache the parsed data, see [read_cache](/api/fio/read_cache.qmd).
+        Either `True` (cache next to the file) or the cache directory.
+        By default False
 
     Returns
     -------
     Table | TableLazy
         Object holding parsed csv data.
     """
-    _handler = BufferHandler(file)
+    if cache:
+        cache_dir = None if cache is True else cache
+        options = {
+            "delimiter": delimiter,
+            "header": header,
+            "index": index,
+            "lazy": lazy,
+            "memory_map": memory_map,
+        }
+        if columnar:
+            options["columnar"] = columnar
+        obj = read_cache(file, cache_dir, **options)
+        if obj is None:
+            obj = open_csv(
+                file,
+                delimiter,
+                header,
+                index,
+                lazy=lazy,
+                engine=engine,
+                threads=threads,
+                memory_map=memory_map,
+                columnar=columnar,
+            )
+            write_cache(obj, file, cache_dir, **options)
+        return obj
+
+    if memory_map:
+        _handler = MmapHandler(file)
+    else:
+        _handler = BufferHandler(file)
 
     parser = CSVParser(
         _handler,
         delimiter,
         header,
         index,
+        engine=engine,
+        threads=threads,
+        lazy=lazy,
     )
 
     return parser.read(
         lazy=lazy,
+        columnar=columnar,
     )
 
 
@@ -1,11 +1,22 @@
 """Only vector methods for FIAT."""
 
 import gc
+from multiprocessing import get_context
 from pathlib import Path
 
+from numpy import argsort, array, concatenate, int64, ndarray
 from osgeo import ogr, osr
 
-from fiat.fio import BufferedGeomWriter, GeomSource, open_geom
+from fiat.fio import (
+    ArrayIndex,
+    BufferedGeomWriter,
+    GeomSource,
+    merge_geom_layers,
+    open_geom,
+)
+from fiat.gis.util import hilbert_keys
+from fiat.job import execute_pool, generate_jobs
+from fiat.util import GEOM_WRITE_DRIVER_MAP, create_1d_chunk
 
 
 def point_in_geom(
@@ -63,57 +74,96 @@ def reproject_feature(
     transform = None
 
 
-def reproject(
-    gs: GeomSource,
-    crs: str,
-    chunk: int = 200000,
-    out_dir: Path | str = None,
-):
-    """Reproject a geometry layer.
+def create_transform(
+    src_srs: osr.SpatialReference,
+    dst_crs: str,
+) -> tuple:
+    """Create a coordinate transformation between two reference systems.
+
+    Both reference systems are set to the traditional gis order (x, y).
 
     Parameters
     ----------
-    gs : GeomSource
-        Input object.
-    crs : str
-        Coodinates reference system (projection). An accepted format is: `EPSG:3857`.
-    chunk : int, optional
-        The size of the chunks used during reprojecting.
-    out_dir : Path | str, optional
-        Output directory. If not defined, if will be inferred from the input object.
+    src_srs : osr.SpatialReference
+        The source spatial reference system.
+    dst_crs : str
+        Coordinate reference system to which will be transformed.
+        An accepted format is: `EPSG:3857`.
 
     Returns
     -------
-    GeomSource
-        Output object. A lazy reading of the just creating geometry file.
+    tuple
+        The transformation and the destination spatial reference system.
     """
-    if not Path(str(out_dir)).is_dir():
-        out_dir = gs.path.parent
+    src_srs = src_srs.Clone()
+    src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    dst_srs = osr.SpatialReference()
+    dst_srs.SetFromUserInput(dst_crs)
+    dst_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
 
-    fname = Path(out_dir, f"{gs.path.stem}_repr{gs.path.suffix}")
+    transform = osr.CoordinateTransformation(src_srs, dst_srs)
+    return transform, dst_srs
 
-    out_srs = osr.SpatialReference()
-    out_srs.SetFromUserInput(crs)
-    out_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
-    layer_defn = gs.layer.GetLayerDefn()
 
-    transform = osr.CoordinateTransformation(
-        gs.srs,
-        out_srs,
+def reproject_bounds(
+    bounds: tuple | list,
+    transform: osr.CoordinateTransformation,
+) -> tuple:
+    """Transform the bounds of a geometry layer.
+
+    Parameters
+    ----------
+    bounds : tuple | list
+        The bounds in the form of [left, right, bottom, top].
+    transform : osr.CoordinateTransformation
+        The transformation.
+
+    Returns
+    -------
+    tuple
+        The transformed bounds (same form).
+    """
+    minx, miny, maxx, maxy = transform.TransformBounds(
+        bounds[0], bounds[2], bounds[1], bounds[3], 21
     )
+    return minx, maxx, miny, maxy
 
+
+def _create_empty(
+    fname: Path,
+    srs: osr.SpatialReference,
+    layer_defn: ogr.FeatureDefn,
+):
+    """Create an empty geometry file with the same layer definition."""
     with open_geom(fname, mode="w", overwrite=True) as new_gs:
-        new_gs.create_layer(out_srs, layer_defn.GetGeomType())
+        new_gs.create_layer(srs, layer_defn.GetGeomType())
         new_gs.set_layer_from_defn(layer_defn)
 
+
+def _reproject_part(
+    gs: GeomSource,
+    crs: str,
+    fname: Path,
+    chunk: int,
+    si: int = None,
+    ei: int = None,
+):
+    """Reproject (a part of) a geometry layer to a new file."""
+    transform, out_srs = create_transform(gs.srs, crs)
+    layer_defn = gs.layer.GetLayerDefn()
+    _create_empty(fname, out_srs, layer_defn)
+
     mem_gs = BufferedGeomWriter(
         fname,
         srs=out_srs,
-        layer_defn=gs.layer.GetLayerDefn(),
+        layer_defn=layer_defn,
         buffer_size=chunk,
     )
 
-    for ft in gs.layer:
+    features = gs.layer
+    if si is not None:
+        features = gs.reduced_iter(si, ei)
+    for ft in features:
         geom = ft.GetGeometryRef()
         geom.Transform(transform)
 
@@ -131,8 +181,220 @@ def reproject(
 
     mem_gs.close()
     mem_gs = None
+
+
+def reproject(
+    gs: GeomSource,
+    crs: str,
+    chunk: int = 200000,
+    out_dir: Path | str = None,
+    threads: int = 1,
+):
+    """Reproject a geometry layer.
+
+    With multiple threads, the layer is split in parts that are reprojected
+    in seperate processes. The parts are merged (in order) afterwards.
+
+    Parameters
+    ----------
+    gs : GeomSource
+        Input object.
+    crs : str
+        Coodinates reference system (projection). An accepted format is: `EPSG:3857`.
+    chunk : int, optional
+        The size of the chunks used during reprojecting.
+    out_dir : Path | str, optional
+        Output directory. If not defined, if will be inferred from the input object.
+    threads : int, optional
+        The number of processes, by default 1
+
+    Returns
+    -------
+    GeomSource
+        Output object. A lazy reading of the just creating geometry file.
+    """
+    if not Path(str(out_dir)).is_dir():
+        out_dir = gs.path.parent
+
+    fname = Path(out_dir, f"{gs.path.stem}_repr{gs.path.suffix}")
+    threads = max(min(threads, gs.size), 1)
+
+    if threads == 1:
+        _reproject_part(gs, crs, fname, chunk)
+    else:
+        # Reproject the parts of the layer in parallel
+        intervals = create_1d_chunk(gs.size, threads)
+        parts = [
+            Path(out_dir, f"{gs.path.stem}_repr_{idx}{gs.path.suffix}")
+            for idx in range(len(intervals))
+        ]
+        jobs = generate_jobs(
+            {
+                "gs": gs,
+                "crs": crs,
+                "fname": parts,
+                "chunk": chunk,
+                "si": [item[0] for item in intervals],
+                "ei": [item[1] for item in intervals],
+            },
+            tied=["fname", "si", "ei"],
+        )
+        execute_pool(get_context("spawn"), _reproject_part, jobs, len(parts))
+
+        # Merge them in order
+        _, out_srs = create_transform(gs.srs, crs)
+        _create_empty(fname, out_srs, gs.layer.GetLayerDefn())
+        driver = ogr.GetDriverByName(GEOM_WRITE_DRIVER_MAP[gs.path.suffix])
+        for part in parts:
+            merge_geom_layers(fname, part, out_layer_name=fname.stem)
+            driver.DeleteDataSource(str(part))
+        driver = None
+        out_srs = None
+
     gs.close()
     gs = None
     gc.collect()
 
     return open_geom(fname)
+
+
+def _points_part(
+    gs: GeomSource,
+    crs: str = None,
+    si: int = None,
+    ei: int = None,
+):
+    """Determine the representative points of (a part of) a geometry layer."""
+    transform = None
+    if crs is not None:
+        transform, _ = create_transform(gs.srs, crs)
+
+    fids = []
+    points = []
+    envelopes = []
+    features = gs.layer
+    if si is not None:
+        features = gs.reduced_iter(si, ei)
+    for ft in features:
+        geom = ft.GetGeometryRef()
+        if transform is not None:
+            geom.Transform(transform)
+        p = geom.PointOnSurface()
+        fids.append(ft.GetFID())
+        points.append((p.GetX(), p.GetY()))
+        envelopes.append(geom.GetEnvelope())
+
+    geom = None
+    ft = None
+    p = None
+    transform = None
+
+    return (
+        array(fids, dtype=int64),
+        array(points, dtype=float).reshape(-1, 2),
+        array(envelopes, dtype=float).reshape(-1, 4),
+    )
+
+
+def representative_points(
+    gs: GeomSource,
+    crs: str = None,
+    threads: int = 1,
+) -> dict:
+    """Determine the representative points of the features of a geometry layer.
+
+    The point is the same as the one of [point_in_geom](/api/geom/point_in_geom.qmd)
+    (a point on the surface), but determined for all features at once. With
+    multiple threads, the layer is split in parts that are done in seperate
+    processes.
+
+    Parameters
+    ----------
+    gs : GeomSource
+        Input object.
+    crs : str, optional
+        Coodinates reference system of the points, if it differs from the one
+        of the layer. An accepted format is: `EPSG:3857`.
+    threads : int, optional
+        The number of processes, by default 1
+
+    Returns
+    -------
+    dict
+        The feature ids ('fid'), the index of the feature ids ('index', an
+        [ArrayIndex](/api/ArrayIndex.qmd)), the x and y coordinates of the points
+        ('points') and the envelopes of the geometries ('envelope', i.e. minx, maxx,
+        miny, maxy) in the order of the layer.
+    """
+    threads = max(min(threads, gs.size), 1)
+
+    if threads == 1:
+        fids, points, envelopes = _points_part(gs, crs)
+    else:
+        # Determine the parts of the layer in parallel
+        intervals = create_1d_chunk(gs.size, threads)
+        jobs = generate_jobs(
+            {
+                "gs": gs,
+                "crs": crs,
+                "si": [item[0] for item in intervals],
+                "ei": [item[1] for item in intervals],
+            },
+            tied=["si", "ei"],
+        )
+        res = execute_pool(get_context("spawn"), _points_part, jobs, len(intervals))
+        fids, points, envelopes = [concatenate(item) for item in zip(*res)]
+
+    return {
+        "fid": fids,
+        "index": ArrayIndex(fids),
+        "points": points,
+        "envelope": envelopes,
+    }
+
+
+def spatial_order(
+    gs: GeomSource,
+    fids: ndarray = None,
+    envelopes: ndarray = None,
+    level: int = 16,
+) -> ndarray:
+    """Determine a spatially coherent order of the features of a geometry layer.
+
+    The features are sorted by the position of the center of their envelope along
+    a Hilbert curve. The layer itself is not changed.
+
+    Parameters
+    ----------
+    gs : GeomSource
+        Input object.
+    fids : ndarray, optional
+        The feature ids, together with `envelopes` when already known (e.g. from
+        [representative_points](/api/geom/representative_points.qmd)).
+    envelopes : ndarray, optional
+        The envelopes (minx, maxx, miny, maxy) of the features.
+    level : int, optional
+        The order of the Hilbert curve, by default 16.
+
+    Returns
+    -------
+    ndarray
+        The feature ids in the spatial order.
+    """
+    if fids is None or envelopes is None:
+        fids = []
+        envelopes = []
+        for ft in gs.layer:
+            fids.append(ft.GetFID())
+            envelopes.append(ft.GetGeometryRef().GetEnvelope())
+        ft = None
+        fids = array(fids, dtype=int64)
+        envelopes = array(envelopes, dtype=float).reshape(-1, 4)
+    if len(fids) == 0:
+        return fids
+
+    x = (envelopes[:, 0] + envelopes[:, 1]) / 2
+    y = (envelopes[:, 2] + envelopes[:, 3]) / 2
+    bounds = (x.min(), x.max(), y.min(), y.max())
+    keys = hilbert_keys(x, y, bounds, level=level)
+    return fids[argsort(keys, kind="stable")]
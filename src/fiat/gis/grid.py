@@ -6,7 +6,7 @@ from pathlib import Path
 
 from osgeo import gdal, osr
 
-from fiat.fio import Grid, GridSource, open_grid
+from fiat.fio import GeomSource, Grid, GridSource, open_grid
 from fiat.util import NOT_IMPLEMENTED
 
 
@@ -29,6 +29,80 @@ def clip(
     raise NotImplementedError(NOT_IMPLEMENTED)
 
 
+def rasterize(
+    gs: GeomSource,
+    field: str,
+    dst_crs: str,
+    dst_gtf: list | tuple,
+    dst_width: int,
+    dst_height: int,
+    out_dir: Path | str = None,
+    nodata: int = -(2**31),
+) -> GridSource:
+    """Rasterize (integer) values of the features of a vector dataset.
+
+    Parameters
+    ----------
+    gs : GeomSource
+        Input object.
+    field : str
+        The field containing the (integer) values, e.g. zone identifiers.
+    dst_crs : str
+        The coordinate reference system of the raster. This should be the same
+        as the one of the geometries, they are not transformed (see \
+[reproject](/api/geom/reproject.qmd)).
+    dst_gtf : list | tuple
+        The geotransform of the raster.
+    dst_width : int
+        The width of the raster.
+    dst_height : int
+        The height of the raster.
+    out_dir : Path | str, optional
+        Output directory. If not defined, it will be inferred from the input
+        object.
+    nodata : int, optional
+        The value of cells without features, by default -2147483648
+
+    Returns
+    -------
+    GridSource
+        Output object. A lazy reading of the just created raster file.
+    """
+    if not Path(str(out_dir)).is_dir():
+        out_dir = gs.path.parent
+    fname = Path(out_dir, f"{gs.path.stem}_rasterized.tif")
+
+    out_srs = osr.SpatialReference()
+    out_srs.SetFromUserInput(dst_crs)
+    out_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    dst_src = gdal.Rasterize(
+        str(fname),
+        str(gs.path),
+        format="GTiff",
+        outputType=gdal.GDT_Int32,
+        creationOptions=["TILED=YES", "COMPRESS=DEFLATE"],
+        attribute=field,
+        noData=nodata,
+        initValues=nodata,
+        outputSRS=out_srs,
+        outputBounds=(
+            dst_gtf[0],
+            dst_gtf[3] + dst_gtf[5] * dst_height,
+            dst_gtf[0] + dst_gtf[1] * dst_width,
+            dst_gtf[3],
+        ),
+        width=dst_width,
+        height=dst_height,
+    )
+    dst_src.FlushCache()
+    out_srs = None
+    dst_src = None
+    gc.collect()
+
+    return open_grid(fname)
+
+
 def reproject(
     gs: GridSource,
     dst_crs: str,
@@ -37,9 +111,15 @@ def reproject(
     dst_height: int = None,
     out_dir: Path | str = None,
     resample: int = 0,
+    lazy: bool = False,
+    threads: int = 1,
 ) -> object:
     """Reproject (warp) a grid.
 
+    Either the warped data is written to a new file or (`lazy`) a warped VRT is
+    created. The latter only describes the warping, which is then done on demand
+    when windows of the data are read.
+
     Parameters
     ----------
     gs : GridSource
@@ -60,6 +140,11 @@ def reproject(
         Resampling method during warping. Interger corresponds with a resampling
         method defined by GDAL. For more information: click \
 [here](https://gdal.org/api/gdalwarp_cpp.html#_CPPv415GDALResampleAlg).
+    lazy : bool, optional
+        Whether to create a warped VRT instead of a new file. Not applicable to
+        data read with 'var_as_band', by default False
+    threads : int, optional
+        Number of threads used for warping, by default 1
 
     Returns
     -------
@@ -95,6 +180,31 @@ def reproject(
             }
         )
 
+    if threads > 1:
+        warp_kw.update(
+            {
+                "multithread": True,
+                "warpOptions": [f"NUM_THREADS={threads}"],
+            }
+        )
+
+    # Only describe the warping, i.e. warped on demand
+    if lazy and not _gs_kwargs.get("var_as_band"):
+        fname_vrt = Path(out_dir, f"{gs.path.stem}_repr.vrt")
+        dst_src = gdal.Warp(
+            str(fname_vrt),
+            gs.src,
+            format="VRT",
+            srcSRS=gs.srs,
+            dstSRS=out_srs,
+            resampleAlg=resample,
+            **warp_kw,
+        )
+        out_srs = None
+        dst_src = None
+        gs.close()
+        return open_grid(fname_vrt)
+
     dst_src = gdal.Warp(
         str(fname_int),
         gs.src,
@@ -2,11 +2,22 @@
 
 from itertools import product
 
-from numpy import ndarray, ones
+from numpy import (
+    arange,
+    argsort,
+    array,
+    concatenate,
+    flatnonzero,
+    full,
+    nan,
+    ndarray,
+    ones,
+    zeros,
+)
 from osgeo import ogr
 
 from fiat.fio import Grid
-from fiat.gis.util import pixel2world, world2pixel
+from fiat.gis.util import pixel2world, world2pixel, world2pixel_many
 
 
 def intersect_cell(
@@ -103,6 +114,172 @@ def clip(
     return clip[mask == 1]
 
 
+def _polygon_edges(
+    geom: ogr.Geometry,
+) -> ndarray:
+    """Return the edges (x1, y1, x2, y2) of all the rings of a polygon geometry.
+
+    Returns None when the geometry is not (multi)polygonal.
+    """
+    flat = ogr.GT_Flatten(geom.GetGeometryType())
+    if flat == ogr.wkbPolygon:
+        parts = []
+        for idx in range(geom.GetGeometryCount()):
+            pts = array(geom.GetGeometryRef(idx).GetPoints(), dtype=float)
+            if len(pts) < 2:
+                continue
+            parts.append(concatenate([pts[:-1, :2], pts[1:, :2]], axis=1))
+    elif flat in (ogr.wkbMultiPolygon, ogr.wkbGeometryCollection):
+        parts = [
+            _polygon_edges(geom.GetGeometryRef(idx))
+            for idx in range(geom.GetGeometryCount())
+        ]
+        parts = [item for item in parts if item is not None]
+    else:
+        return None
+    if not parts:
+        return zeros((0, 4))
+    return concatenate(parts)
+
+
+def _fractions(
+    edges: ndarray,
+    x: float,
+    y: float,
+    w: int,
+    h: int,
+    gtf: tuple,
+    upscale: int,
+) -> ndarray:
+    """Return the fractions of the cells of a window covered by polygon edges.
+
+    The cells are supersampled (`upscale` by `upscale`) and the samples are tested
+    against all edges at once (even-odd rule), one edge at a time.
+    """
+    xs = x + (arange(w * upscale) + 0.5) * (gtf[1] / upscale)
+    ys = y + (arange(h * upscale) + 0.5) * (gtf[5] / upscale)
+    inside = zeros((h * upscale, w * upscale), dtype=bool)
+    for xa, ya, xb, yb in edges.tolist():
+        if ya == yb:
+            continue
+        rows = flatnonzero((ys < ya) != (ys < yb))
+        if rows.size == 0:
+            continue
+        xi = xa + (ys[rows] - ya) * ((xb - xa) / (yb - ya))
+        inside[rows] ^= xs[None, :] < xi[:, None]
+    return inside.reshape((h, upscale, w, upscale)).mean(axis=(1, 3))
+
+
+def coverage(
+    ft: ogr.Feature,
+    gtf: tuple,
+    shape_xy: tuple,
+    upscale: int = 5,
+) -> tuple:
+    """Determine the fractions of the grid cells that are covered by a feature.
+
+    Vectorized alternative to [clip_weighted](/api/overlay/clip_weighted.qmd).
+    The cells are supersampled and all samples are tested at once per edge of the
+    geometry. As it only depends on the grid definition, the result can be used
+    for all bands of a grid.
+
+    Parameters
+    ----------
+    ft : ogr.Feature
+        A Feature according to the \
+[ogr module](https://gdal.org/api/python/osgeo.ogr.html) of osgeo.
+        Can be optained by indexing a \
+[GeomSource](/api/GeomSource.qmd).
+    gtf : tuple
+        The geotransform of a grid dataset.
+        Has the following shape: (left, xres, xrot, upper, yrot, yres).
+    shape_xy : tuple
+        The shape of the grid (x direction first).
+    upscale : int, optional
+        The number of samples per cell in both directions, by default 5.
+
+    Returns
+    -------
+    tuple
+        The window (x, y, width, height) of the feature in the grid and the
+        fractions of the cells (2D array) within that window. None for the fractions
+        when the geometry is not polygonal.
+    """
+    geom = ft.GetGeometryRef()
+    ow, oh = shape_xy
+
+    # The window of the feature within the grid
+    minx, maxx, miny, maxy = geom.GetEnvelope()
+    ulx, uly = world2pixel(gtf, minx, maxy)
+    lrx, lry = world2pixel(gtf, maxx, miny)
+    ulx, uly = max(ulx, 0), max(uly, 0)
+    w = max(min(lrx, ow - 1) - ulx + 1, 0)
+    h = max(min(lry, oh - 1) - uly + 1, 0)
+
+    edges = _polygon_edges(geom)
+    if edges is None:
+        return (ulx, uly, w, h), None
+    if w == 0 or h == 0:
+        return (ulx, uly, w, h), zeros((h, w))
+    plx, ply = pixel2world(gtf, ulx, uly)
+    return (ulx, uly, w, h), _fractions(edges, plx, ply, w, h, gtf, upscale)
+
+
+def clip_area_weighted(
+    ft: ogr.Feature,
+    band: Grid,
+    gtf: tuple,
+    upscale: int = 5,
+    cover: tuple = None,
+) -> tuple:
+    """Clip a grid based on a feature (vector), weighted by the covered area.
+
+    Parameters
+    ----------
+    ft : ogr.Feature
+        A Feature according to the \
+[ogr module](https://gdal.org/api/python/osgeo.ogr.html) of osgeo.
+        Can be optained by indexing a \
+[GeomSource](/api/GeomSource.qmd).
+    band : Grid
+        An object that contains a connection the band within the dataset. For further
+        information, see [Grid](/api/Grid.qmd)!
+    gtf : tuple
+        The geotransform of a grid dataset.
+        Has the following shape: (left, xres, xrot, upper, yrot, yres).
+    upscale : int, optional
+        The number of samples per cell in both directions, by default 5.
+    cover : tuple, optional
+        The result of [coverage](/api/overlay/coverage.qmd) when already determined,
+        e.g. for another band of the same grid.
+
+    Returns
+    -------
+    tuple
+        A 1D array containing the clipped values and a 1D array containing the
+        fractions of the cells that are covered (the weights).
+        Geometries that are not polygonal get a weight of 1 for every cell they
+        touch.
+
+    See Also
+    --------
+    - [clip](/api/overlay/clip.qmd)
+    """
+    if cover is None:
+        cover = coverage(ft, gtf, band.shape_xy, upscale=upscale)
+    window, fractions = cover
+
+    # Not a polygon, then just the touched cells
+    if fractions is None:
+        values = clip(ft, band, gtf)
+        return values, ones(values.shape)
+
+    mask = fractions > 0
+    if not mask.any():
+        return zeros(0), zeros(0)
+    return band[window][mask], fractions[mask]
+
+
 def clip_weighted(
     ft: ogr.Feature,
     band: Grid,
@@ -207,3 +384,65 @@ def pin(
     mask = ones(value.shape)  # This really is a dummy mask, but makes my life easy
 
     return value[mask == 1]
+
+
+def pin_many(
+    points: ndarray,
+    band: Grid,
+    gtf: tuple,
+) -> tuple:
+    """Pin the values of cells based on multiple coordinates at once.
+
+    The points are grouped per block of the band. Every block that contains points
+    is read once and the values are taken from it in one go.
+
+    Parameters
+    ----------
+    points : ndarray
+        Array of x and y coordinates, with the shape (n, 2).
+    band : Grid
+        Input object. This holds a connection to the specified band.
+    gtf : tuple
+        The geotransform of a grid dataset.
+        Has the following shape: (left, xres, xrot, upper, yrot, yres).
+
+    Returns
+    -------
+    tuple
+        An array with the values (NaN outside of the grid) and a boolean array
+        whether the points are inside of the grid.
+
+    See Also
+    --------
+    - [pin](/api/overlay/pin.qmd)
+    """
+    # Get metadata
+    ow, oh = band.shape_xy
+    bh, bw = band.block_size
+
+    # Get the coordinates
+    values = full(len(points), nan)
+    cols, rows = world2pixel_many(gtf, points[:, 0], points[:, 1])
+    inside = (cols >= 0) & (cols < ow) & (rows >= 0) & (rows < oh)
+    idx = flatnonzero(inside)
+    if idx.size == 0:
+        return values, inside
+
+    # Group the points per block
+    blocks = (rows[idx] // bh) * -(-ow // bw) + cols[idx] // bw
+    order = argsort(blocks, kind="stable")
+    idx = idx[order]
+    blocks = blocks[order]
+    splits = flatnonzero(blocks[1:] != blocks[:-1]) + 1
+
+    # Read every block once
+    start = 0
+    for end in [*splits.tolist(), len(idx)]:
+        sel = idx[start:end]
+        x = int(cols[sel[0]] // bw) * bw
+        y = int(rows[sel[0]] // bh) * bh
+        data = band[x, y, min(bw, ow - x), min(bh, oh - y)]
+        values[sel] = data[rows[sel] - y, cols[sel] - x]
+        start = end
+
+    return values, inside
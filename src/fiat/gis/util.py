@@ -2,6 +2,9 @@
 
 from math import floor
 
+from numpy import asarray, clip, int64, ndarray, where, zeros
+from numpy import floor as npfloor
+
 
 def world2pixel(
     gtf: tuple,
@@ -48,6 +51,83 @@ def world2pixel(
     return (coorX, coorY)
 
 
+def world2pixel_many(
+    gtf: tuple,
+    x: ndarray | list,
+    y: ndarray | list,
+) -> tuple:
+    """Calculate the pixel locations of multiple coordinates at once.
+
+    Vectorized version of `world2pixel`.
+
+    Parameters
+    ----------
+    gtf : tuple
+        The geotransform of a grid dataset.
+        Has the following shape: (left, xres, xrot, upper, yrot, yres).
+    x : ndarray | list
+        The x coordinates of the points.
+    y : ndarray | list
+        The y coordinates of the points.
+
+    Returns
+    -------
+    tuple
+        Arrays of the column and row indices.
+    """
+    coorX = npfloor((asarray(x, dtype=float) - gtf[0]) / gtf[1])
+    coorY = npfloor((asarray(y, dtype=float) - gtf[3]) / gtf[5])
+    return coorX.astype(int), coorY.astype(int)
+
+
+def hilbert_keys(
+    x: ndarray | list,
+    y: ndarray | list,
+    bounds: tuple | list,
+    level: int = 16,
+) -> ndarray:
+    """Calculate the position of points along a Hilbert curve.
+
+    Points that are close to each other in space are mostly close to each other
+    along the curve, so sorting by these keys gives a spatially coherent order.
+
+    Parameters
+    ----------
+    x : ndarray | list
+        The x coordinates of the points.
+    y : ndarray | list
+        The y coordinates of the points.
+    bounds : tuple | list
+        The bounds of the area in the form of [left, right, bottom, top].
+    level : int, optional
+        The order of the curve, i.e. the area is divided in 2^level by 2^level
+        cells, by default 16.
+
+    Returns
+    -------
+    ndarray
+        The (int64) keys of the points.
+    """
+    n = 2**level
+    w = max(bounds[1] - bounds[0], 1e-12)
+    h = max(bounds[3] - bounds[2], 1e-12)
+    xi = clip(((asarray(x, dtype=float) - bounds[0]) / w * n).astype(int64), 0, n - 1)
+    yi = clip(((asarray(y, dtype=float) - bounds[2]) / h * n).astype(int64), 0, n - 1)
+    keys = zeros(xi.shape, dtype=int64)
+    s = n // 2
+    while s > 0:
+        rx = (xi & s) > 0
+        ry = (yi & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        flip = ~ry & rx
+        xi = where(flip, n - 1 - xi, xi)
+        yi = where(flip, n - 1 - yi, yi)
+        xi, yi = where(~ry, yi, xi), where(~ry, xi, yi)
+        s //= 2
+    return keys
+
+
 def pixel2world(
     gtf: tuple,
     x: int,
@@ -1,8 +1,11 @@
 """Creating run jobs in fiat."""
 
+import cProfile
+import os
 from concurrent.futures import ProcessPoolExecutor, wait
 from itertools import product
 from multiprocessing.context import SpawnContext
+from pathlib import Path
 from typing import Callable, Generator
 
 from fiat.log import spawn_logger
@@ -51,11 +54,45 @@ def generate_jobs(
         yield kwargs
 
 
+def profile_job(
+    func: Callable,
+    dst: Path | str,
+    **kwargs,
+):
+    """Execute a job while profiling it.
+
+    The stats are written to a file carrying the process id of the worker.
+
+    Parameters
+    ----------
+    func : Callable
+        To be executed function.
+    dst : Path | str
+        Path to the profiling stats file, without the process id.
+        E.g. 'output/profile_job1' results in 'output/profile_job1_pid1234.prof'.
+    kwargs : dict
+        Keyword arguments of the function.
+    """
+    dst = Path(dst)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        r = func(**kwargs)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(Path(dst.parent, f"{dst.name}_pid{os.getpid()}.prof"))
+    return r
+
+
 def execute_pool(
     ctx: SpawnContext,
     func: Callable,
     jobs: Generator,
     threads: int,
+    profile: Path | str = None,
+    profile_jobs: int = None,
+    initializer: Callable = None,
+    initargs: tuple = (),
 ):
     """Execute a python process pool.
 
@@ -69,6 +106,16 @@ def execute_pool(
         A job generator. Returns single dictionaries.
     threads : int
         Number of threads.
+    profile : Path | str, optional
+        Base path of the profiling stats of the worker processes. If set, every job
+        executed in a worker process is profiled separately. By default None
+    profile_jobs : int, optional
+        Only profile the first N jobs, by default None (i.e. all).
+    initializer : Callable, optional
+        Function that is called at the start of every worker process (not when
+        executed in the main process), by default None
+    initargs : tuple, optional
+        Arguments of the initializer, by default ()
     """
     # If there is only one thread needed, execute in the main process
     res = []
@@ -84,14 +131,24 @@ def execute_pool(
     pool = ProcessPoolExecutor(
         max_workers=threads,
         mp_context=ctx,
+        initializer=initializer,
+        initargs=initargs,
     )
 
     # Go through all the jobs
-    for job in jobs:
-        pr = pool.submit(
-            func,
-            **job,
-        )
+    for idx, job in enumerate(jobs):
+        if profile is not None and (profile_jobs is None or idx < profile_jobs):
+            pr = pool.submit(
+                profile_job,
+                func,
+                f"{profile}_job{idx + 1}",
+                **job,
+            )
+        else:
+            pr = pool.submit(
+                func,
+                **job,
+            )
         processes.append(pr)
 
     # wait for all jobs to conclude
@@ -2,6 +2,7 @@
 
 import atexit
 import io
+import json
 import os
 import queue
 import re
@@ -14,7 +15,7 @@ from enum import Enum
 from string import Formatter as StrFormatter
 from warnings import warn
 
-from fiat.util import NOT_IMPLEMENTED
+from fiat.util import NOT_IMPLEMENTED, progressbar
 
 DEFAULT_FMT = "{asctime:20s}{levelname:8s}{message}"
 DEFAULT_TIME_FMT = "%Y-%m-%d %H:%M:%S"
@@ -112,6 +113,35 @@ class LogItem:
         return str(self.msg)
 
 
+class ProgressItem:
+    """A progress item.
+
+    Parameters
+    ----------
+    pid : int
+        Process id of the worker.
+    count : int
+        The number of items processed since the previous progress item.
+    start : float
+        Time at which the worker started (in seconds since the epoch).
+    done : bool, optional
+        Whether the worker is done, by default False
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        count: int,
+        start: float,
+        done: bool = False,
+    ):
+        self.ct = time.time()
+        self.pid = pid
+        self.count = count
+        self.start = start
+        self.done = done
+
+
 class FormatStyler:
     """The underlying engine of the formatter.
 
@@ -380,6 +410,57 @@ class Sender(BaseHandler):
             self.handleError(record)
 
 
+class ProgressSender(Sender):
+    """Sender object for the progress of a worker.
+
+    Processed items are counted and periodically send as a
+    [ProgressItem](/api/ProgressItem.qmd).
+
+    Parameters
+    ----------
+    queue : object
+        The queue for the records. Specifically designed for use in multiprocessing.
+    interval : float, optional
+        Minimal time in seconds between two progress items, by default 1
+    """
+
+    def __init__(
+        self,
+        queue: object,
+        interval: float = 1,
+    ):
+        Sender.__init__(self, queue)
+        self.count = 0
+        self.interval = interval
+        self._pid = os.getpid()
+        self._start = time.time()
+        self._last = self._start
+
+    def add(
+        self,
+        n: int = 1,
+    ):
+        """Add processed items.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of processed items, by default 1
+        """
+        self.count += n
+        now = time.time()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        self.put(ProgressItem(self._pid, self.count, self._start))
+        self.count = 0
+
+    def finish(self):
+        """Send the remaining count and signal that the worker is done."""
+        self.put(ProgressItem(self._pid, self.count, self._start, done=True))
+        self.count = 0
+
+
 class CHandler(BaseHandler):
     """Output text to the console.
 
@@ -614,6 +695,151 @@ class Logmeta(type):
         return obj
 
 
+class Progress:
+    """Track the progress of the workers in the main process.
+
+    Shows a progress bar with the throughput and an estimated time of arrival.
+    Optionally, the progress is written to a json file.
+
+    Parameters
+    ----------
+    total : int
+        The total number of items to be processed.
+    unit : str, optional
+        The unit of the items, by default 'features'
+    show : bool, optional
+        Whether to show the progress bar, by default True
+    dst : Path | str, optional
+        Path to the progress file, by default None
+    """
+
+    def __init__(
+        self,
+        total: int,
+        unit: str = "features",
+        show: bool = True,
+        dst: str = None,
+    ):
+        self.total = total
+        self.unit = unit
+        self.show = show and total > 0
+        self.dst = dst
+        self.count = 0
+        self.done = False
+        self.workers = {}
+        self._start = time.time()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        _mem_loc = f"{id(self):#018x}".upper()
+        return f"<{self.__class__.__name__} object at {_mem_loc}>"
+
+    @property
+    def elapsed(self):
+        """Return the elapsed time in seconds."""
+        return time.time() - self._start
+
+    @property
+    def rate(self):
+        """Return the overall throughput in items per second."""
+        elapsed = self.elapsed
+        if elapsed == 0:
+            return 0
+        return self.count / elapsed
+
+    @property
+    def eta(self):
+        """Return the estimated time of arrival in seconds."""
+        rate = self.rate
+        if rate == 0:
+            return None
+        return max(self.total - self.count, 0) / rate
+
+    def _render(self):
+        """Render the progress bar."""
+        eta = self.eta
+        eta = "--:--:--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        rates = " ".join([f"{round(w['rate'])}" for w in self.workers.values()])
+        progressbar(
+            min(self.count, self.total),
+            self.total,
+            prefix="Progress:",
+            suffix=f"{round(self.rate, 1)} {self.unit}/s, ETA {eta} \
+(per worker: {rates})",
+        )
+
+    def _write(self):
+        """Write the progress to the progress file."""
+        info = {
+            "unit": self.unit,
+            "total": self.total,
+            "processed": self.count,
+            "elapsed": round(self.elapsed, 2),
+            "rate": round(self.rate, 2),
+            "eta": None if self.eta is None else round(self.eta, 2),
+            "done": self.done,
+            "workers": {str(pid): w for pid, w in self.workers.items()},
+        }
+        tmp = f"{self.dst}.tmp"
+        with open(tmp, "w") as _w:
+            json.dump(info, _w, indent=2)
+        os.replace(tmp, self.dst)
+
+    def stop(self):
+        """Stop the tracking of progress.
+
+        Ends the progress bar and writes the (final) state to the progress file.
+        """
+        self.acquire()
+        if self.show:
+            if self.count < self.total:
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+            self.show = False
+        self.done = True
+        if self.dst is not None:
+            self._write()
+        self.release()
+
+    def acquire(self):
+        """Acquire the lock."""
+        self._lock.acquire()
+
+    def release(self):
+        """Release the lock."""
+        self._lock.release()
+
+    def update(
+        self,
+        record: ProgressItem,
+    ):
+        """Update the progress with a record of a worker.
+
+        Parameters
+        ----------
+        record : ProgressItem
+            The progress item.
+        """
+        self.acquire()
+        self.count += record.count
+        w = self.workers.setdefault(
+            record.pid,
+            {"processed": 0, "rate": 0, "last_update": None, "done": False},
+        )
+        w["processed"] += record.count
+        w["last_update"] = record.ct
+        w["done"] = record.done
+        if record.ct > record.start:
+            w["rate"] = round(w["processed"] / (record.ct - record.start), 2)
+        if self.show:
+            self._render()
+            if self.count >= self.total:
+                self.show = False
+        if self.dst is not None:
+            self._write()
+        self.release()
+
+
 class Receiver:
     """Create a receiver for multiprocessing logging.
 
@@ -636,6 +862,7 @@ class Receiver:
         self._t = None
         self._handlers = []
         self.count = 0
+        self.progress = None
         self.q = queue
 
         global RECEIVER_COUNT
@@ -668,6 +895,10 @@ class Receiver:
                 record = self.get(True)
                 if record is self._sentinel:
                     break
+                if isinstance(record, ProgressItem):
+                    if self.progress is not None:
+                        self.progress.update(record)
+                    continue
                 self._log(record)
                 self.count += 1
             except queue.Empty:
@@ -716,6 +947,19 @@ class Receiver:
         """
         self._handlers.append(handler)
 
+    def set_progress(
+        self,
+        progress: Progress,
+    ):
+        """Set a progress tracker for the received progress items.
+
+        Parameters
+        ----------
+        progress : Progress
+            The progress tracker.
+        """
+        self.progress = progress
+
     def start(self):
         """Start the receiver.
 
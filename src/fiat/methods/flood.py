@@ -11,6 +11,54 @@ from fiat.methods.util import AREA_METHODS
 MANDATORY_COLUMNS = ["ground_flht", "ground_elevtn"]
 MANDATORY_ENTRIES = ["hazard.elevation_reference"]
 NEW_COLUMNS = ["inun_depth"]
+DRY_THRESHOLD = 0.0001
+
+
+def dry_threshold(
+    reference: str,
+) -> float | None:
+    """Return the hazard value up to which a cell is considered dry.
+
+    Parameters
+    ----------
+    reference : str
+        Reference, either 'dem' or 'datum'.
+
+    Returns
+    -------
+    float | None
+        The threshold or None when it depends on the ground elevation of the
+        objects (i.e. 'datum').
+    """
+    if str(reference).lower() == "dem":
+        return DRY_THRESHOLD
+    return None
+
+
+def _calculate_hazard_weighted(
+    hazard: list,
+    weights: list,
+    ground_elevtn: float,
+    ground_flht: float,
+    method: str,
+) -> tuple:
+    """Calculate the hazard value and reduction factor from weighted values."""
+    raw_w = sum(weights)
+    pairs = [(n - ground_elevtn, w) for n, w in zip(hazard, weights)]
+    pairs = [(n, w) for n, w in pairs if n > DRY_THRESHOLD and w > 0]
+
+    if not pairs or raw_w <= 0:
+        return math.nan, math.nan
+
+    wet_w = sum([w for _, w in pairs])
+    if method.lower() == "mean":
+        hazard = sum([n * w for n, w in pairs]) / wet_w
+        redf = wet_w / raw_w
+    else:
+        hazard = AREA_METHODS[method.lower()]([n for n, _ in pairs])
+        redf = 1
+
+    return hazard - ground_flht, redf
 
 
 def calculate_hazard(
@@ -19,6 +67,7 @@ def calculate_hazard(
     ground_flht: float,
     ground_elevtn: float = 0,
     method: str = "mean",
+    weights: list = None,
 ) -> float:
     """Calculate the hazard value for flood hazard.
 
@@ -36,6 +85,9 @@ def calculate_hazard(
     method : str, optional
         Chose 'max' or 'mean' for either the maximum value or the average,
         by default 'mean'.
+    weights : list, optional
+        Weights of the raw hazard values, e.g. the fractions of the cells that are
+        covered by the object. By default None, i.e. all equal.
 
     Returns
     -------
@@ -48,9 +100,13 @@ def calculate_hazard(
         # (e.g., for flooding this is the water elevation).
         _ge = ground_elevtn
 
+    # Weighted by e.g. the covered area of the cells
+    if weights is not None:
+        return _calculate_hazard_weighted(hazard, weights, _ge, ground_flht, method)
+
     # Remove the negative hazard values to 0.
     raw_l = len(hazard)
-    hazard = [n - _ge for n in hazard if (n - _ge) > 0.0001]
+    hazard = [n - _ge for n in hazard if (n - _ge) > DRY_THRESHOLD]
 
     if not hazard:
         return math.nan, math.nan
@@ -79,7 +135,7 @@ def calculate_damage(
     vuln: Table,
     vul_min: float | int,
     vul_max: float | int,
-    vul_round: int,
+    vul_round: int | None,
 ) -> tuple:
     """Calculate the damage corresponding with the hazard value.
 
@@ -102,7 +158,8 @@ def calculate_damage(
     vul_max : float | int
         Maximum value of the index of the vulnerability data.
     vul_round : int
-        Significant decimals to be used.
+        Significant decimals to be used. If None, the hazard value is not rounded
+        (e.g. for interpolation on the fly).
 
     Returns
     -------
@@ -124,7 +181,9 @@ def calculate_damage(
             val = "nan"
         else:
             hazard_value = max(min(vul_max, hazard_value), vul_min)
-            f = vuln[round(hazard_value, vul_round), ft[col]]
+            if vul_round is not None:
+                hazard_value = round(hazard_value, vul_round)
+            f = vuln[hazard_value, ft[col]]
             val = f * ft[maxv[key]] * red_fact
             val = round(val, 2)
             total += val
@@ -1,12 +1,13 @@
 """Base model of FIAT."""
 
 import importlib
+import sys
 from abc import ABCMeta, abstractmethod
 from multiprocessing import get_context
 from os import cpu_count
 from pathlib import Path
 
-from osgeo import osr
+from osgeo import gdal, osr
 
 from fiat.cfg import Configurations
 from fiat.check import (
@@ -17,10 +18,17 @@ from fiat.check import (
     check_internal_srs,
     check_vs_srs,
 )
-from fiat.fio import open_csv, open_grid
+from fiat.fio import CurveTable, open_csv, open_grid, read_cache, write_cache
 from fiat.gis import grid
-from fiat.log import spawn_logger
-from fiat.models.util import check_file_for_read
+from fiat.log import Progress, spawn_logger
+from fiat.models.util import (
+    GRID_REPROJECT,
+    VULNERABILITY_ENGINES,
+    check_file_for_read,
+    gdal_config,
+    memory_budget,
+    set_gdal_config,
+)
 from fiat.util import NEED_IMPLEMENTED, deter_dec, get_srs_repr
 
 logger = spawn_logger("fiat.model")
@@ -67,10 +75,14 @@ class BaseModel(metaclass=ABCMeta):
         self._queue = None
         self.threads = 1
         self.chunks = []
+        # Caching of parsed data
+        self.cache = False
 
         # Call the necessary methods at init
         self.set_model_srs()
         self.set_num_threads()
+        self.set_memory_budget()
+        self.set_cache()
         self.read_hazard_grid()
         self.read_vulnerability_data()
 
@@ -161,6 +173,172 @@ exceeds machine thread count ('{max_threads}')"
 
         logger.info(f"Using number of threads: {self.threads}")
 
+    def set_memory_budget(
+        self,
+        limit: float | int | None = None,
+    ) -> None:
+        """Set the memory budget per worker.
+
+        Derived from the global memory limit, divided by the number of threads.
+        The budget is used for sizing the GDAL cache, the writer buffers and
+        the grid windows.
+
+        Parameters
+        ----------
+        limit : float | int, optional
+            Global memory limit in megabytes, by default None
+        """
+        limit = limit or self.cfg.get("model.memory_limit")
+        if limit is None:
+            return
+        self.cfg.set("model.memory_limit", limit)
+        budget = memory_budget(limit, self.threads)
+        self.cfg.set("_memory", budget)
+
+        logger.info(
+            f"Using a memory budget per worker of: \
+{round(budget['worker'] / 1024**2, 2)} MB"
+        )
+
+    def set_gdal_config(
+        self,
+        threads: int | None = None,
+    ) -> dict:
+        """Set the GDAL configuration (`model.gdal`) of the run and the workers.
+
+        The configuration is applied to the current process and to every worker
+        process at startup.
+
+        Parameters
+        ----------
+        threads : int, optional
+            The number of worker processes over which the cache and cores are
+            divided, by default the number of threads of the model.
+
+        Returns
+        -------
+        dict
+            The previous configuration of the current process, to be restored
+            with `set_gdal_config` after the run.
+        """
+        config = gdal_config(self.cfg, threads or self.threads)
+        self.cfg.set("_gdal", config)
+        previous = set_gdal_config(config)
+
+        # Report the values as applied by GDAL
+        logger.info(
+            f"Using a GDAL cache per worker of: \
+{round(gdal.GetCacheMax() / 1024**2, 2)} MB"
+        )
+        options = ", ".join(
+            [f"{k}={gdal.GetConfigOption(k)}" for k in config["options"]]
+        )
+        logger.info(f"Using the GDAL configuration options: {options}")
+        return previous
+
+    def set_cache(
+        self,
+        cache: bool | Path | str | None = None,
+    ) -> None:
+        """Set the caching of parsed (tabular) data.
+
+        Parameters
+        ----------
+        cache : bool | Path | str, optional
+            Either `True` (cache next to the data files) or the cache directory,
+            by default None
+        """
+        cache = cache or self.cfg.get("model.cache", False)
+        if not cache:
+            return
+        if not isinstance(cache, bool):
+            cache = Path(self.cfg.path, cache)
+        self.cfg.set("model.cache", cache)
+        self.cache = cache
+        logger.info("Using cached data where possible")
+
+    def _log_worker_info(
+        self,
+        res: list,
+    ) -> None:
+        """Log the information returned by the workers.
+
+        A worker can execute multiple jobs, the peak memory usage is reported
+        once per worker.
+        """
+        peaks = {}
+        for item in res:
+            if not isinstance(item, dict) or item.get("peak_rss") is None:
+                continue
+            peaks[item["pid"]] = max(peaks.get(item["pid"], 0), item["peak_rss"])
+        for pid, peak in peaks.items():
+            logger.info(
+                f"Peak memory usage of worker ({pid}): {round(peak / 1024**2, 2)} MB"
+            )
+
+    def _setup_progress(
+        self,
+        total: int,
+        unit: str = "features",
+    ) -> Progress:
+        """Set up the tracker for the progress of the workers.
+
+        Parameters
+        ----------
+        total : int
+            The total number of items to be processed.
+        unit : str, optional
+            The unit of the items, by default 'features'
+
+        Returns
+        -------
+        Progress
+            The progress tracker.
+        """
+        show = self.cfg.get("model.progress.show", sys.stdout.isatty())
+        interval = self.cfg.get("model.progress.interval", 1)
+        self.cfg.set("model.progress.interval", interval)
+        dst = self.cfg.get("model.progress.file")
+        if dst is not None:
+            dst = Path(self.cfg.get("output.path"), dst)
+        return Progress(total, unit=unit, show=show, dst=dst)
+
+    def _reproject_grid(
+        self,
+        data: object,
+        dst_crs: str,
+        **kwargs,
+    ) -> object:
+        """Reproject a grid, either to a new file or lazily (warped VRT).
+
+        Parameters
+        ----------
+        data : GridSource
+            The grid.
+        dst_crs : str
+            The coordinate reference system to reproject to.
+        kwargs : dict, optional
+            Keyword arguments for [reproject](/api/gis/grid/reproject.qmd).
+
+        Returns
+        -------
+        GridSource
+            The reprojected grid.
+        """
+        method = self.cfg.get("model.grid.reproject", "file")
+        if method not in GRID_REPROJECT:
+            raise ValueError(
+                f"Unknown reprojection method: '{method}', \
+choose from {GRID_REPROJECT}"
+            )
+        return grid.reproject(
+            data,
+            dst_crs,
+            lazy=method == "lazy",
+            threads=self.threads,
+            **kwargs,
+        )
+
     ## Read data methods
     def read_hazard_grid(
         self,
@@ -224,7 +402,11 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
             )
             logger.info(f"Reprojecting '{path.name}' to '{get_srs_repr(self.srs)}'")
             _resalg = self.cfg.get("hazard.resampling_method", 0)
-            data = grid.reproject(data, self.srs.ExportToWkt(), _resalg)
+            data = self._reproject_grid(
+                data,
+                self.srs.ExportToWkt(),
+                resample=_resalg,
+            )
 
         # check risk return periods
         if self.risk:
@@ -283,7 +465,32 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
             self.cfg.generate_kwargs("vulnerability.settings"),
         )
         kw.update(kwargs)  # Update with user defined method input
-        data = open_csv(str(path), **kw)
+
+        # Set the step size for upscaling
+        if "vulnerability.step_size" in self.cfg:
+            self._vul_step_size = self.cfg.get("vulnerability.step_size")
+            self._rounding = deter_dec(self._vul_step_size)
+            self.cfg.set("vulnerability.round", self._rounding)
+
+        # Upscale the curves or interpolate them on the fly
+        engine = self.cfg.get("vulnerability.engine", "upscale")
+        if engine not in VULNERABILITY_ENGINES:
+            raise ValueError(
+                f"Unknown vulnerability engine: '{engine}', \
+choose from {VULNERABILITY_ENGINES}"
+            )
+        self.cfg.set("vulnerability.engine", engine)
+        snap = self.cfg.get("vulnerability.snap", False)
+
+        # Look for already parsed and upscaled data
+        data = None
+        cache_dir = None if self.cache is True else self.cache
+        cache_kw = {"step_size": self._vul_step_size, "engine": engine, "snap": snap}
+        if self.cache:
+            data = read_cache(path, cache_dir, **cache_kw, **kw)
+        cached = data is not None
+        if not cached:
+            data = open_csv(str(path), **kw)
         ## checks
         logger.info("Executing vulnerability checks...")
 
@@ -291,16 +498,22 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
         check_duplicate_columns(data.meta["dup_cols"])
 
         # upscale the data (can be done after the checks)
-        if "vulnerability.step_size" in self.cfg:
-            self._vul_step_size = self.cfg.get("vulnerability.step_size")
-            self._rounding = deter_dec(self._vul_step_size)
-            self.cfg.set("vulnerability.round", self._rounding)
-
-        logger.info(
-            f"Upscaling vulnerability curves, \
+        if cached:
+            logger.info("Using cached vulnerability curves")
+        elif engine == "interp":
+            logger.info("Interpolating vulnerability curves on the fly")
+            data = CurveTable.from_table(
+                data,
+                step=self._vul_step_size if snap else None,
+            )
+        else:
+            logger.info(
+                f"Upscaling vulnerability curves, \
 using a step size of: {self._vul_step_size}"
-        )
-        data.upscale(self._vul_step_size, inplace=True)
+            )
+            data.upscale(self._vul_step_size, inplace=True)
+        if self.cache and not cached:
+            write_cache(data, path, cache_dir, **cache_kw, **kw)
 
         # Reset to ensure the entry is present
         self.cfg.set(file_entry, path)
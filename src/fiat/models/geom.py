@@ -1,6 +1,7 @@
 """Geom model of FIAT."""
 
 import copy
+import importlib
 import os
 import re
 import sys
@@ -9,11 +10,13 @@ from multiprocessing import Manager
 from pathlib import Path
 from typing import List
 
+from numpy import logical_or
 from osgeo import ogr
 
 from fiat.cfg import Configurations
 from fiat.check import (
     check_duplicate_columns,
+    check_exp_aggregate_fields,
     check_exp_columns,
     check_exp_derived_types,
     check_exp_index_col,
@@ -22,8 +25,11 @@ from fiat.check import (
     check_vs_srs,
 )
 from fiat.fio import (
+    ArrayIndex,
     open_csv,
     open_geom,
+    read_cache,
+    write_cache,
 )
 from fiat.gis import geom
 from fiat.job import execute_pool, generate_jobs
@@ -32,9 +38,15 @@ from fiat.models import worker_geom
 from fiat.models.base import BaseModel
 from fiat.models.util import (
     EXPOSURE_FIELDS,
+    GEOM_DEFAULT_BATCH,
     GEOM_DEFAULT_CHUNK,
+    GEOM_ORDER,
+    GEOM_PREFILTER_CHUNK,
+    GEOM_REPROJECT,
+    Aggregates,
     check_file_for_read,
     csv_def_file,
+    set_gdal_config,
 )
 from fiat.util import (
     create_1d_chunk,
@@ -68,6 +80,8 @@ class GeomModel(BaseModel):
 
         # Set/ declare some variables
         self.exposure_types = self.cfg.get("exposure.types", ["damage"])
+        self.exposure_order = {}
+        self.exposure_points = {}
 
         # Setup the geometry model
         self.read_exposure()
@@ -142,6 +156,157 @@ class GeomModel(BaseModel):
         # Set the write size chunking
         chunk_int = self.cfg.get("model.geom.chunk", GEOM_DEFAULT_CHUNK)
         self.cfg.set("model.geom.chunk", chunk_int)
+        # Set the number of features joined with the exposure data at once
+        batch_int = self.cfg.get("model.geom.batch", GEOM_DEFAULT_BATCH)
+        self.cfg.set("model.geom.batch", batch_int)
+
+    def _set_prefilter(self):
+        """Determine which blocks of the hazard data are wet.
+
+        The workers skip the hazard extraction of the features that only touch
+        dry blocks (or are outside of the hazard data), as the result would be
+        the same. The mask is cached when caching is enabled (`model.cache`).
+        """
+        if not self.cfg.get("model.geom.prefilter", False):
+            return
+        module = importlib.import_module(f"fiat.methods.{self.cfg.get('hazard.type')}")
+        threshold = None
+        if hasattr(module, "dry_threshold"):
+            threshold = module.dry_threshold(self.cfg.get("hazard.elevation_reference"))
+        chunk = tuple(self.cfg.get("model.geom.prefilter_chunk", GEOM_PREFILTER_CHUNK))
+        cache_dir = None if self.cache is True else self.cache
+        path = self.hazard_grid.path
+        cache = self.cache and path.exists()
+        wet = []
+        for idx in range(1, self.hazard_grid.size + 1):
+            cache_kw = {
+                "wet": idx,
+                "chunk": chunk,
+                "threshold": threshold,
+                "subset": self.hazard_grid.subset,
+            }
+            mask = None
+            if cache:
+                mask = read_cache(path, cache_dir, **cache_kw)
+            if mask is None:
+                mask = self.hazard_grid[idx].occupancy(chunk, threshold=threshold)
+                if cache:
+                    write_cache(mask, path, cache_dir, **cache_kw)
+            wet.append(mask)
+        wet = logical_or.reduce(wet)
+        logger.info(f"Hazard data is wet in {int(wet.sum())} of {wet.size} blocks")
+        self.cfg.set("_hazard_wet", (chunk, wet))
+
+    def _set_order(self):
+        """Set the order in which the exposure geometries are processed.
+
+        Either the order of the file or a spatially coherent order (along a
+        Hilbert curve), so that consecutive features touch the same part of the
+        hazard data. The files themselves are not changed. The workers only
+        receive the feature ids of their own chunk (see `_chunk_parts`).
+        """
+        self.exposure_order = {}
+        order = self.cfg.get("model.geom.order", "file")
+        if order not in GEOM_ORDER:
+            raise ValueError(
+                f"Unknown processing order: '{order}', choose from {GEOM_ORDER}"
+            )
+        if order == "file":
+            return
+        cache_dir = None if self.cache is True else self.cache
+        points = self.exposure_points
+        _order = {}
+        for key, gm in self.exposure_geoms.items():
+            # Reading by feature id is (too) slow without random access
+            if not gm.layer.TestCapability(ogr.OLCRandomRead):
+                logger.warning(
+                    f"'{gm.path.name}' does not support random reading, \
+processing the features in file order"
+                )
+                continue
+            # Keyed on the source file, not on a reprojected copy of it
+            source = self.cfg.get(f"exposure.geom.file{key}", gm.path)
+            cache_kw = {"order": order, "srs": get_srs_repr(self.srs)}
+            fids = None
+            if self.cache:
+                fids = read_cache(source, cache_dir, **cache_kw)
+            if fids is None:
+                logger.info(f"Ordering the features of '{gm.path.name}' spatially")
+                fids = geom.spatial_order(
+                    gm,
+                    points.get(key, {}).get("fid"),
+                    points.get(key, {}).get("envelope"),
+                )
+                if self.cache:
+                    write_cache(fids, source, cache_dir, **cache_kw)
+            _order[key] = fids
+        self.exposure_order = _order
+
+    def _set_points(self):
+        """Set the representative points of the exposure geometries.
+
+        The points are determined (in parallel) once per run. With caching
+        (`model.cache`), they are read from the cache when the exposure
+        geometries did not change. The workers only receive the points of their
+        own chunk (see `_chunk_parts`).
+        """
+        self.exposure_points = {}
+        if not self.cfg.get("model.geom.points", False):
+            return
+        cache_dir = None if self.cache is True else self.cache
+        srs = self.srs.ExportToWkt()
+        _points = {}
+        for key, gm in self.exposure_geoms.items():
+            # Keyed on the source file, not on a reprojected copy of it
+            source = self.cfg.get(f"exposure.geom.file{key}", gm.path)
+            cache_kw = {"points": True, "srs": get_srs_repr(self.srs)}
+            points = None
+            if self.cache:
+                points = read_cache(source, cache_dir, **cache_kw)
+            if points is None:
+                logger.info(
+                    f"Determining the representative points of '{gm.path.name}'"
+                )
+                crs = srs if key in self.cfg.get("_exposure_reproject", []) else None
+                points = geom.representative_points(gm, crs, threads=self.threads)
+                if self.cache:
+                    write_cache(points, source, cache_dir, **cache_kw)
+            else:
+                logger.info(f"Using cached representative points of '{gm.path.name}'")
+            _points[key] = points
+        self.exposure_points = _points
+
+    def _chunk_parts(
+        self,
+        chunk: tuple | list,
+    ) -> dict:
+        """Return the parts of the exposure meta data needed for a chunk.
+
+        I.e. per exposure geometry file the feature ids of the chunk in spatial
+        order and the representative points of the features in the chunk,
+        instead of sending all of them to every worker.
+        """
+        parts = {}
+        for key in self.exposure_geoms:
+            part = {}
+            rows = slice(chunk[0] - 1, chunk[1])
+            order = self.exposure_order.get(key)
+            if order is not None:
+                part["order"] = order[rows]
+            points = self.exposure_points.get(key)
+            if points is not None:
+                if order is not None:
+                    rows = points["index"].get_many(part["order"])
+                    rows = rows[rows >= 0]
+                fids = points["fid"][rows]
+                part["points"] = {
+                    "fid": fids,
+                    "index": ArrayIndex(fids),
+                    "points": points["points"][rows],
+                    "envelope": points["envelope"][rows],
+                }
+            parts[key] = part
+        return parts
 
     def _setup_output_files(self):
         """Set up the output files.
@@ -159,13 +324,18 @@ class GeomModel(BaseModel):
             # Get the new fields per geometry file
             new_fields = tuple(self.cfg.get("_exposure_meta")[key]["new_fields"])
             # Open and write a layer with the necessary fields
-            with open_geom(
-                Path(self.cfg.get("output.path"), out_geom), mode="w", overwrite=True
-            ) as _w:
-                _w.create_layer(self.srs, gm.geom_type)
-                _w.create_fields(dict(zip(gm.fields, gm.dtypes)))
-                _w.create_fields(dict(zip(new_fields, [ogr.OFTReal] * len(new_fields))))
-            _w = None
+            if self.cfg.get("output.geom.write", True):
+                with open_geom(
+                    Path(self.cfg.get("output.path"), out_geom),
+                    mode="w",
+                    overwrite=True,
+                ) as _w:
+                    _w.create_layer(self.srs, gm.geom_type)
+                    _w.create_fields(dict(zip(gm.fields, gm.dtypes)))
+                    _w.create_fields(
+                        dict(zip(new_fields, [ogr.OFTReal] * len(new_fields)))
+                    )
+                _w = None
 
             # Check whether to do the same for the csv
             out_csv = self.cfg.get(f"output.csv.name{key}")
@@ -182,6 +352,19 @@ class GeomModel(BaseModel):
                     columns,
                 )
 
+    def _write_aggregates(
+        self,
+        res: list,
+    ):
+        """Merge the aggregates of the workers and write them to a csv file."""
+        aggregates = Aggregates()
+        for item in res:
+            if isinstance(item, dict) and item.get("aggregates") is not None:
+                aggregates.merge(item["aggregates"])
+        path = Path(self.cfg.get("output.path"), "aggregate.csv")
+        aggregates.write(path, self.cfg.get("output.aggregate"))
+        logger.info(f"Output aggregated to {len(aggregates)} groups ('{path.name}')")
+
     def get_exposure_meta(self):
         """Get the exposure meta regarding the data itself (fields etc.)."""
         # Get the relevant column headers
@@ -234,7 +417,7 @@ class GeomModel(BaseModel):
         logger.info(f"Reading exposure data ('{path.name}')")
 
         # Setting the keyword arguments from settings file
-        kw = {"index": "object_id"}
+        kw = {"index": "object_id", "cache": self.cache}
         kw.update(
             self.cfg.generate_kwargs("exposure.csv.settings"),
         )
@@ -291,6 +474,15 @@ class GeomModel(BaseModel):
         )
         kw.update(kwargs)
 
+        # Either reproject to a new file or on the fly in the workers
+        reproject = self.cfg.get("model.geom.reproject", "file")
+        if reproject not in GEOM_REPROJECT:
+            raise ValueError(
+                f"Unknown reprojection method: '{reproject}', \
+choose from {GEOM_REPROJECT}"
+            )
+        _reproject = []
+
         # For all that is found, try to read the data
         for file, path in zip(files, paths):
             suffix = int(re.findall(r"\d+", file.rsplit(".", 1)[1])[0])
@@ -311,18 +503,39 @@ class GeomModel(BaseModel):
             )
 
             # check if file srs is the same as the model srs
+            bounds = data.bounds
             if not check_vs_srs(self.srs, data.srs):
                 logger.warning(
                     f"Spatial reference of '{path.name}' \
 ('{get_srs_repr(data.srs)}') does not match \
 the model spatial reference ('{get_srs_repr(self.srs)}')"
                 )
-                logger.info(f"Reprojecting '{path.name}' to '{get_srs_repr(self.srs)}'")
-                data = geom.reproject(data, self.srs.ExportToWkt())
+                if reproject == "worker":
+                    logger.info(
+                        f"Reprojecting '{path.name}' to \
+'{get_srs_repr(self.srs)}' on the fly"
+                    )
+                    transform, _ = geom.create_transform(
+                        data.srs,
+                        self.srs.ExportToWkt(),
+                    )
+                    bounds = geom.reproject_bounds(bounds, transform)
+                    transform = None
+                    _reproject.append(suffix)
+                else:
+                    logger.info(
+                        f"Reprojecting '{path.name}' to '{get_srs_repr(self.srs)}'"
+                    )
+                    data = geom.reproject(
+                        data,
+                        self.srs.ExportToWkt(),
+                        threads=self.threads,
+                    )
+                    bounds = data.bounds
 
             # check if it falls within the extent of the hazard map
             check_geom_extent(
-                data.bounds,
+                bounds,
                 self.hazard_grid.bounds,
             )
 
@@ -332,6 +545,7 @@ the model spatial reference ('{get_srs_repr(self.srs)}')"
             self.cfg.set(f"exposure.geom.file{suffix}", path)
         # When all is done, add it
         self.exposure_geoms = _d
+        self.cfg.set("_exposure_reproject", _reproject)
 
     ## Run model method
     def run(
@@ -348,6 +562,9 @@ the model spatial reference ('{get_srs_repr(self.srs)}')"
 
         # Set the chunking
         self._set_chunking()
+        self._set_points()
+        self._set_prefilter()
+        self._set_order()
 
         # Create the output directory and files
         self.get_exposure_meta()
@@ -360,12 +577,31 @@ the model spatial reference ('{get_srs_repr(self.srs)}')"
         )
         logger.info("Starting the calculations")
 
+        # Track the progress of the workers
+        progress = self._setup_progress(
+            sum([gm.size for gm in self.exposure_geoms.values()]),
+            unit="features",
+        )
+        _receiver.set_progress(progress)
+
         # Start the receiver (which is in a seperate thread)
         _receiver.start()
 
         # Exposure fields get function
         field_func = EXPOSURE_FIELDS[self.exposure_data is None]
 
+        # Check the fields to aggregate the output by
+        group_fields = self.cfg.get("output.aggregate", [])
+        for gm in self.exposure_geoms.values():
+            columns = list(gm.fields)
+            if self.exposure_data is not None:
+                columns += list(self.exposure_data.columns)
+            check_exp_aggregate_fields(group_fields, columns)
+
+        # Share the vulnerability data with the workers instead of copying it
+        if self.threads != 1 and self.cfg.get("model.shared_memory", False):
+            self.vulnerability_data.share()
+
         # Setup the jobs
         # First setup the locks
         lock1, lock2 = (None, None)
@@ -381,27 +617,43 @@ the model spatial reference ('{get_srs_repr(self.srs)}')"
                 "exp_data": self.exposure_data,
                 "exp_geom": self.exposure_geoms,
                 "chunk": self.chunks,
+                "parts": [self._chunk_parts(item) for item in self.chunks],
                 "queue": self._queue,
                 "lock1": lock1,
                 "lock2": lock2,
             },
-            # tied=["idx", "lock"],
+            tied=["chunk", "parts"],
         )
 
+        # Divide the GDAL cache and cores over the actual worker processes
+        gdal_previous = self.set_gdal_config(min(self.threads, len(self.chunks)))
+
         # Execute the jobs in a multiprocessing pool
         # Wrap to prevent weird error propagation with the pipes
         try:
             _s = time.time()
             logger.info("Busy...")
-            execute_pool(
-                ctx=self._mp_ctx,
-                func=worker_geom.worker,
-                jobs=jobs,
-                threads=self.threads,
-            )
+            try:
+                res = execute_pool(
+                    ctx=self._mp_ctx,
+                    func=worker_geom.worker,
+                    jobs=jobs,
+                    threads=self.threads,
+                    profile=self.cfg.get("_profile"),
+                    profile_jobs=self.cfg.get("_profile_jobs"),
+                    initializer=set_gdal_config,
+                    initargs=(self.cfg.get("_gdal"),),
+                )
+            finally:
+                set_gdal_config(gdal_previous)
+                progress.stop()
+                self.vulnerability_data.release()
             _e = time.time() - _s
 
             logger.info(f"Calculations time: {round(_e, 2)} seconds")
+            self._log_worker_info(res)
+            if group_fields:
+                self._write_aggregates(res)
 
         except BaseException:
             exc_info = sys.exc_info()
@@ -1,25 +1,40 @@
 """The FIAT grid model."""
 
+import shutil
 import time
+from math import ceil
+from multiprocessing import Manager
 from pathlib import Path
 
+from numpy import logical_or
+
 from fiat.check import (
     check_exp_grid_dmfs,
     check_grid_exact,
     check_internal_srs,
     check_vs_srs,
 )
-from fiat.fio import open_grid
-from fiat.gis import grid
+from fiat.fio import SparseGrid, open_geom, open_grid, read_cache, write_cache
+from fiat.gis import geom, grid
 from fiat.job import execute_pool, generate_jobs
-from fiat.log import spawn_logger
+from fiat.log import Receiver, spawn_logger
+from fiat.methods.ead import risk_density
 from fiat.models import worker_grid
 from fiat.models.base import BaseModel
 from fiat.models.util import (
+    GRID_DEFAULT_BUDGET,
+    GRID_OUTPUT_DEFAULT,
     GRID_PREFER,
+    Aggregates,
     check_file_for_read,
+    set_gdal_config,
+)
+from fiat.util import (
+    GEOM_READ_DRIVER_MAP,
+    chunk_from_blocks,
+    generic_path_check,
+    get_srs_repr,
 )
-from fiat.util import get_srs_repr
 
 logger = spawn_logger("fiat.model.grid")
 
@@ -45,6 +60,8 @@ class GridModel(BaseModel):
 
         # Declare
         self.equal = True
+        self.sparse = None
+        self.zones = None
 
         # Setup the model
         self.read_exposure_grid()
@@ -52,6 +69,125 @@ class GridModel(BaseModel):
     def __del__(self):
         BaseModel.__del__(self)
 
+    def _set_chunking(self):
+        """Set the chunking size.
+
+        Only when not set by the user. The chunks are aligned to the blocks of the
+        hazard, exposure and (if tiled) output data and fitted to the memory budget.
+        """
+        if self.cfg.get("model.grid.chunk") is not None:
+            return
+        budget = self.cfg.get("_memory")
+        budget = GRID_DEFAULT_BUDGET if budget is None else budget["grid"]
+        # Bytes per cell; hazard, exposure and output bands, total damages
+        # and the indices of the cells
+        exp_size = self.exposure_grid.size
+        cell_size = (
+            self.hazard_grid[1].dtype_size // 8
+            + 2 * exp_size * self.exposure_grid[1].dtype_size // 8
+            + 8
+            + 16
+        )
+        blocks = [self.hazard_grid[1].block_size]
+        blocks += [self.exposure_grid[idx + 1].block_size for idx in range(exp_size)]
+        if self.cfg.get("output.grid.format", GRID_OUTPUT_DEFAULT) != "netcdf":
+            blocksize = self.cfg.get("output.grid.blocksize", 256)
+            blocks.append((blocksize, blocksize))
+        chunk = chunk_from_blocks(
+            self.exposure_grid.shape,
+            blocks,
+            cell_size,
+            budget,
+        )
+        logger.info(f"Using a chunk size (aligned to the data blocks) of: {chunk}")
+        self.hazard_grid.set_chunk_size(chunk)
+        self.exposure_grid.set_chunk_size(chunk)
+
+    def _set_occupancy(self):
+        """Determine which windows of the exposure data contain any data.
+
+        The workers skip the windows without exposure data. The index is cached
+        when caching is enabled (`model.cache`).
+        """
+        if not self.cfg.get("model.grid.skip_empty", True) or self.sparse:
+            return
+        chunk = tuple(self.exposure_grid.chunk)
+        cache_dir = None if self.cache is True else self.cache
+        path = self.exposure_grid.path
+        occupancy = []
+        for idx in range(1, self.exposure_grid.size + 1):
+            cache_kw = {
+                "occupancy": idx,
+                "chunk": chunk,
+                "subset": self.exposure_grid.subset,
+            }
+            occ = None
+            if self.cache:
+                occ = read_cache(path, cache_dir, **cache_kw)
+            if occ is None:
+                occ = self.exposure_grid[idx].occupancy(chunk)
+                if self.cache:
+                    write_cache(occ, path, cache_dir, **cache_kw)
+            occupancy.append(occ)
+        empty = int((~logical_or.reduce(occupancy)).sum())
+        logger.info(
+            f"Skipping {empty} of {occupancy[0].size} windows without exposure data"
+        )
+        self.cfg.set("_exposure_occupancy", (chunk, occupancy))
+
+    def _set_sparse(self):
+        """Store only the cells of the exposure data that contain data.
+
+        The data is memory mapped (`model.grid.sparse_mmap`, by default when
+        there are multiple workers), so the workers do not receive a copy.
+        """
+        if not self.cfg.get("model.grid.sparse", False):
+            return
+        logger.info("Reading the exposure data as sparse data")
+        self.sparse = SparseGrid.from_grid(self.exposure_grid)
+        rows, cols = self.exposure_grid.shape
+        share = len(self.sparse) / (rows * cols * self.exposure_grid.size)
+        logger.info(
+            f"Exposure data contains {len(self.sparse)} cells \
+({round(share * 100, 2)}%)"
+        )
+        pcount = min(self.threads, self.hazard_grid.size)
+        if self.cfg.get("model.grid.sparse_mmap", pcount > 1):
+            self.sparse.save(Path(self.cfg.get("output.path"), ".sparse"))
+        self.cfg.set("_exposure_sparse", self.sparse)
+
+    def _write_zones(
+        self,
+        res: list,
+    ):
+        """Merge the aggregates of the workers and write them to a csv file."""
+        aggregates = Aggregates()
+        for item in res:
+            if isinstance(item, dict) and item.get("zones") is not None:
+                aggregates.merge(item["zones"])
+
+        # The ead is linear in the damages per return period
+        if self.risk:
+            coefs = risk_density(self.cfg.get("hazard.return_periods"))
+            bands = self.cfg.get("hazard.band_names")
+            names = [
+                self.exposure_grid.get_band_name(idx + 1) or f"band{idx + 1}"
+                for idx in range(self.exposure_grid.size)
+            ]
+            for name in names + ["total"]:
+                aggregates.add_linear(
+                    f"ead_{name}",
+                    [f"{name}_{band}" for band in bands],
+                    coefs,
+                )
+
+        path = Path(
+            self.cfg.get("output.path"),
+            self.cfg.get("output.zones.name", "zones.csv"),
+        )
+        aggregates.write(path, [self.cfg.get("output.zones.field", "zone")])
+        logger.info(f"Damages aggregated to {len(aggregates)} zones ('{path.name}')")
+
     def _setup_output_files(self):
         """Ensure that it's defined."""
         pass
@@ -82,11 +218,12 @@ class GridModel(BaseModel):
             f"Reprojecting {GRID_PREFER[not prefer_bool]} \
 data to {prefer} data"
         )
-        data_warped = grid.reproject(
+        data_warped = self._reproject_grid(
             data_warp,
             get_srs_repr(data.srs),
-            data.geotransform,
-            *data.shape_xy,
+            dst_gtf=data.geotransform,
+            dst_width=data.shape_xy[0],
+            dst_height=data.shape_xy[1],
         )
 
         # Set the output
@@ -154,13 +291,93 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
             )
             logger.info(f"Reprojecting '{path.name}' to '{get_srs_repr(self.srs)}'")
             _resalg = self.cfg.get("exposure.grid.resampling_method", 0)
-            data = grid.reproject(data, self.srs.ExportToWkt(), _resalg)
+            data = self._reproject_grid(
+                data,
+                self.srs.ExportToWkt(),
+                resample=_resalg,
+            )
 
         # Reset to ensure the entry is present
         self.cfg.set(file_entry, path)
         ## When all is done, add it
         self.exposure_grid = data
 
+    def read_zones(
+        self,
+        path: Path | str = None,
+        **kwargs: dict,
+    ):
+        """Read the zones to which the damages are aggregated.
+
+        Either a grid or a vector dataset, of which a field
+        (`output.zones.field`) is rasterized to the exposure grid.
+        If no path is provided the method tries to infer it from the model
+        configurations.
+
+        Parameters
+        ----------
+        path : Path | str, optional
+            Path to the zones, by default None
+        kwargs : dict, optional
+            Keyword arguments for reading. These are passed into [open_grid]\
+(/api/fio/open_grid.qmd) or [open_geom](/api/fio/open_geom.qmd).
+        """
+        file_entry = "output.zones.file"
+        path = check_file_for_read(self.cfg, file_entry, path)
+        if path is None:
+            return
+        path = generic_path_check(path, self.cfg.path)
+        logger.info(f"Reading zones ('{path.name}')")
+        exp = self.exposure_grid
+
+        # Rasterize the vector data once
+        if path.suffix in GEOM_READ_DRIVER_MAP:
+            field = self.cfg.get("output.zones.field")
+            if field is None:
+                raise ValueError("Field of the zones ('output.zones.field') not set")
+            gs = open_geom(path, **kwargs)
+            if not check_vs_srs(exp.srs, gs.srs):
+                logger.info(f"Reprojecting the zones to '{get_srs_repr(exp.srs)}'")
+                gs = geom.reproject(
+                    gs,
+                    exp.srs.ExportToWkt(),
+                    out_dir=self.cfg.get("output.path"),
+                    threads=self.threads,
+                )
+            logger.info(f"Rasterizing the zones ('{field}') to the exposure grid")
+            data = grid.rasterize(
+                gs,
+                field,
+                exp.srs.ExportToWkt(),
+                exp.geotransform,
+                *exp.shape_xy,
+                out_dir=self.cfg.get("output.path"),
+            )
+            gs.close()
+            gs = None
+        else:
+            data = open_grid(path, **kwargs)
+            if (
+                not check_vs_srs(exp.srs, data.srs)
+                or data.geotransform != exp.geotransform
+                or data.shape != exp.shape
+            ):
+                logger.info("Warping the zones to the exposure grid")
+                data = self._reproject_grid(
+                    data,
+                    get_srs_repr(exp.srs),
+                    dst_gtf=exp.geotransform,
+                    dst_width=exp.shape_xy[0],
+                    dst_height=exp.shape_xy[1],
+                    out_dir=self.cfg.get("output.path"),
+                )
+
+        # Reset to ensure the entry is present
+        self.cfg.set(file_entry, path)
+        self.cfg.set("_zones", data.path)
+        self.cfg.set("_write_grids", self.cfg.get("output.zones.grids", True))
+        self.zones = data
+
     def resolve(self):
         """Create EAD output from the outputs of different return periods.
 
@@ -169,7 +386,7 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
 
         - This method might become private.
         """
-        if self.risk:
+        if self.risk and self.cfg.get("_write_grids", True):
             logger.info("Setting up risk calculations..")
 
             # Time the function
@@ -189,6 +406,24 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
         # Check for equal hazard and exposure grids
         self.equal = check_grid_exact(self.hazard_grid, self.exposure_grid)
         self.create_equal_grids()
+        self._set_chunking()
+        self._set_sparse()
+        self._set_occupancy()
+        self.read_zones()
+
+        # Setup the manager and the receiver for the progress of the workers
+        if self._mp_manager is None:
+            self._mp_manager = Manager()
+        self._queue = self._mp_manager.Queue(maxsize=10000)
+        rows, cols = self.hazard_grid.shape
+        chunk = self.hazard_grid.chunk
+        progress = self._setup_progress(
+            ceil(rows / chunk[0]) * ceil(cols / chunk[1]) * self.hazard_grid.size,
+            unit="windows",
+        )
+        _receiver = Receiver(self._queue)
+        _receiver.set_progress(progress)
+        _receiver.start()
 
         # Setup the jobs
         jobs = generate_jobs(
@@ -198,6 +433,7 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
                 "idx": range(1, self.hazard_grid.size + 1),
                 "vul": self.vulnerability_data,
                 "exp": self.exposure_grid,
+                "queue": self._queue,
             }
         )
 
@@ -205,16 +441,38 @@ model spatial reference ('{get_srs_repr(self.srs)}')"
         _s = time.time()
         logger.info("Busy...")
         pcount = min(self.threads, self.hazard_grid.size)
-        execute_pool(
-            ctx=self._mp_ctx,
-            func=worker_grid.worker,
-            jobs=jobs,
-            threads=pcount,
-        )
+        # Divide the GDAL cache and cores over the actual worker processes
+        gdal_previous = self.set_gdal_config(pcount)
+        # Share the vulnerability data with the workers instead of copying it
+        if pcount != 1 and self.cfg.get("model.shared_memory", False):
+            self.vulnerability_data.share()
+        try:
+            res = execute_pool(
+                ctx=self._mp_ctx,
+                func=worker_grid.worker,
+                jobs=jobs,
+                threads=pcount,
+                profile=self.cfg.get("_profile"),
+                profile_jobs=self.cfg.get("_profile_jobs"),
+                initializer=set_gdal_config,
+                initargs=(self.cfg.get("_gdal"),),
+            )
+        finally:
+            set_gdal_config(gdal_previous)
+            progress.stop()
+            self.vulnerability_data.release()
+            if self.sparse is not None and self.sparse.path is not None:
+                shutil.rmtree(self.sparse.path, ignore_errors=True)
+            _receiver.close()
+            self._mp_manager.shutdown()
+            self._mp_manager = None
 
         # Last logging messages
         _e = time.time() - _s
         logger.info(f"Calculations time: {round(_e, 2)} seconds")
+        self._log_worker_info(res)
+        if self.zones is not None:
+            self._write_zones(res)
         self.resolve()
         logger.info(f"Output generated in: '{self.cfg.get('output.path')}'")
         logger.info("Grid calculation are done!")
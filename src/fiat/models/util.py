@@ -1,18 +1,225 @@
 """The FIAT model workers."""
 
+import os
+from numbers import Real
 from pathlib import Path
 
-from osgeo import ogr
+from numpy import bincount, full, inf, maximum, nan, ndarray, unique
+from osgeo import gdal, ogr
 
 from fiat.cfg import Configurations
 from fiat.fio import TableLazy
 from fiat.util import NEWLINE_CHAR, generic_path_check, replace_empty
 
+EXTRACT_AREA = ("area", "area_weighted")
+GDAL_CONFIG_OPTIONS = {
+    "disable_readdir": "GDAL_DISABLE_READDIR_ON_OPEN",
+    "vsi_cache": "VSI_CACHE",
+    "vsi_cache_size": "VSI_CACHE_SIZE",
+}
+GEOM_DEFAULT_BATCH = 1000
 GEOM_DEFAULT_CHUNK = 50000
+GEOM_ORDER = ("file", "hilbert")
+GEOM_PREFILTER_CHUNK = (256, 256)
+GEOM_REPROJECT = ("file", "worker")
+GRID_DEFAULT_BUDGET = 256 * 1024**2
+GRID_OUTPUT_DEFAULT = "gtiff"
+GRID_OUTPUT_FORMATS = {
+    "netcdf": ".nc",
+    "gtiff": ".tif",
+    "cog": ".tif",
+}
+GRID_OUTPUT_LEVEL = {
+    "DEFLATE": "ZLEVEL",
+    "LZMA": "LZMA_PRESET",
+    "ZSTD": "ZSTD_LEVEL",
+}
+GRID_REPROJECT = ("file", "lazy")
 GRID_PREFER = {
     False: "hazard",
     True: "exposure",
 }
+MEMORY_SHARES = {
+    "cache": 0.25,
+    "buffer": 0.25,
+    "grid": 0.5,
+}
+VULNERABILITY_ENGINES = ("upscale", "interp")
+
+_GDAL_DEFAULT_CACHE = None
+
+
+class Aggregates:
+    """Running sums, counts and maxima of values per group.
+
+    Used to aggregate the results within the workers, after which the partial
+    aggregates are merged (`merge`) and written to a csv file (`write`).
+
+    Parameters
+    ----------
+    columns : list | tuple, optional
+        The columns (e.g. types of damages) that are aggregated, by default None
+    """
+
+    def __init__(
+        self,
+        columns: list | tuple = None,
+    ):
+        self.columns = []
+        self._data = {}
+        for column in columns or []:
+            self._add_column(column)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} groups={len(self)} \
+columns={len(self.columns)}>"
+
+    def _add_column(self, column: str):
+        if column not in self._data:
+            self.columns.append(column)
+            self._data[column] = {}
+        return self._data[column]
+
+    def _update(self, column: str, key: object, total, count, maximum):
+        data = self._add_column(column)
+        if key not in data:
+            data[key] = [total, count, maximum]
+            return
+        item = data[key]
+        item[0] += total
+        item[1] += count
+        item[2] = max(item[2], maximum)
+
+    def add(
+        self,
+        column: str,
+        keys: ndarray,
+        values: ndarray,
+    ):
+        """Add multiple values of one column (vectorized).
+
+        Parameters
+        ----------
+        column : str
+            The column.
+        keys : ndarray
+            The group of every value.
+        values : ndarray
+            The values.
+        """
+        if len(keys) == 0:
+            return
+        ids, inv = unique(keys, return_inverse=True)
+        totals = bincount(inv, weights=values, minlength=ids.size)
+        counts = bincount(inv, minlength=ids.size)
+        maxima = full(ids.size, -inf)
+        maximum.at(maxima, inv, values)
+        for key, total, count, _max in zip(
+            ids.tolist(), totals.tolist(), counts.tolist(), maxima.tolist()
+        ):
+            self._update(column, key, total, count, _max)
+
+    def add_row(
+        self,
+        key: object,
+        values: list | tuple,
+    ):
+        """Add the values of one row (e.g. a feature) to a group.
+
+        Parameters
+        ----------
+        key : object
+            The group.
+        values : list | tuple
+            The values in the order of the columns, non numeric (e.g. None or
+            'nan') and NaN values are skipped.
+        """
+        for column, value in zip(self.columns, values):
+            if not isinstance(value, Real) or value != value:
+                continue
+            self._update(column, key, value, 1, value)
+
+    def add_linear(
+        self,
+        column: str,
+        columns: list | tuple,
+        coefs: list | tuple,
+    ):
+        """Add a column as linear combination of the totals of other columns.
+
+        E.g. the expected annual damages from the damages per return period.
+        The counts and maxima are not defined for this column.
+
+        Parameters
+        ----------
+        column : str
+            The new column.
+        columns : list | tuple
+            The columns to combine.
+        coefs : list | tuple
+            The coefficients of the columns.
+        """
+        data = self._add_column(column)
+        for key in self.keys():
+            total = 0
+            for _column, coef in zip(columns, coefs):
+                total += coef * self._data[_column].get(key, (0,))[0]
+            data[key] = [total, nan, nan]
+
+    def keys(self):
+        """Return the (sorted) groups of all columns."""
+        keys = set()
+        for data in self._data.values():
+            keys.update(data)
+        try:
+            return sorted(keys)
+        except TypeError:  # E.g. missing (None) values
+            return sorted(keys, key=str)
+
+    def merge(
+        self,
+        other: "Aggregates",
+    ):
+        """Merge other (partial) aggregates into these.
+
+        Parameters
+        ----------
+        other : Aggregates
+            The other aggregates.
+        """
+        for column in other.columns:
+            for key, item in other._data[column].items():
+                self._update(column, key, *item)
+
+    def write(
+        self,
+        path: Path | str,
+        key_names: list | tuple,
+    ):
+        """Write the aggregates to a csv file.
+
+        Per column the total, count and maximum are written.
+
+        Parameters
+        ----------
+        path : Path | str
+            Path to the csv file.
+        key_names : list | tuple
+            Names of the group fields.
+        """
+        header = list(key_names)
+        for column in self.columns:
+            header += [f"{column}_total", f"{column}_count", f"{column}_max"]
+        csv_def_file(path, header)
+        with open(path, "ab") as _w:
+            for key in self.keys():
+                row = list(key) if isinstance(key, tuple) else [key]
+                for column in self.columns:
+                    row += self._data[column].get(key, [0, 0, ""])
+                _w.write((",".join(map(str, row)) + NEWLINE_CHAR).encode())
 
 
 def check_file_for_read(
@@ -28,6 +235,220 @@ def check_file_for_read(
     return path
 
 
+def memory_budget(
+    limit: float | int,
+    threads: int,
+):
+    """Divide a global memory limit over the workers and their components.
+
+    Parameters
+    ----------
+    limit : float | int
+        The global memory limit in megabytes.
+    threads : int
+        Number of workers.
+
+    Returns
+    -------
+    dict
+        Per worker budget in bytes, in total ('worker') and per component \
+(GDAL cache, writer buffers and grid windows).
+    """
+    worker = int(limit * 1024**2 / threads)
+    budget = {"worker": worker}
+    for key, share in MEMORY_SHARES.items():
+        budget[key] = int(worker * share)
+    return budget
+
+
+def gdal_config(
+    cfg: Configurations,
+    threads: int,
+):
+    """Determine the GDAL configuration per worker.
+
+    Based on the `model.gdal` section of the settings. By default the block
+    cache (the memory budget or else the default cache of GDAL, see
+    `gdal_default_cache`) and the CPU cores are divided over the workers.
+
+    Parameters
+    ----------
+    cfg : Configurations
+        The configurations.
+    threads : int
+        Number of workers.
+
+    Returns
+    -------
+    dict
+        The cache size in bytes ('cache') and the configuration options
+        ('options').
+    """
+    # Divide the block cache between the workers
+    cache = cfg.get("model.gdal.cache")
+    budget = cfg.get("_memory")
+    if cache is not None:
+        cache = int(cache * 1024**2 / threads)
+    elif budget is not None:
+        cache = budget["cache"]
+    else:
+        cache = int(gdal_default_cache() / threads)
+
+    # And the cores
+    num_threads = cfg.get(
+        "model.gdal.num_threads",
+        max((os.cpu_count() or 1) // threads, 1),
+    )
+    options = {"GDAL_NUM_THREADS": str(num_threads).upper()}
+    for key, entry in GDAL_CONFIG_OPTIONS.items():
+        value = cfg.get(f"model.gdal.{key}")
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = "YES" if value else "NO"
+        elif key == "vsi_cache_size":
+            value = int(value * 1024**2)
+        options[entry] = str(value)
+    # Any other option
+    for key, value in cfg.generate_kwargs("model.gdal.options").items():
+        options[key.upper()] = str(value)
+    return {"cache": cache, "options": options}
+
+
+def gdal_default_cache():
+    """Return the default block cache of GDAL in bytes.
+
+    I.e. the cache before it was set by `set_gdal_config`, so that dividing it
+    over the workers does not compound over multiple runs.
+    """
+    global _GDAL_DEFAULT_CACHE
+    if _GDAL_DEFAULT_CACHE is None:
+        _GDAL_DEFAULT_CACHE = gdal.GetCacheMax()
+    return _GDAL_DEFAULT_CACHE
+
+
+def set_gdal_config(
+    config: dict,
+):
+    """Apply the GDAL configuration to the current process.
+
+    Used as initializer of the worker processes.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration, as returned by `gdal_config`.
+
+    Returns
+    -------
+    dict
+        The previous configuration, to restore it with this same function.
+    """
+    if config is None:
+        return None
+    gdal_default_cache()
+    previous = {
+        "cache": gdal.GetCacheMax(),
+        "options": {key: gdal.GetConfigOption(key) for key in config["options"]},
+    }
+    gdal.SetCacheMax(config["cache"])
+    for key, value in config["options"].items():
+        gdal.SetConfigOption(key, value)
+    return previous
+
+
+def grid_output_options(
+    cfg: Configurations,
+    dtype: int,
+    cog: bool = False,
+):
+    """Determine the file suffix and creation options of the gridded output.
+
+    Parameters
+    ----------
+    cfg : Configurations
+        The configurations.
+    dtype : int
+        The (GDAL) data type of the output.
+    cog : bool, optional
+        Whether the options are meant for the conversion to a cloud optimized
+        GeoTIFF, by default False
+
+    Returns
+    -------
+    tuple
+        The file suffix and the creation options.
+    """
+    fmt = cfg.get("output.grid.format", GRID_OUTPUT_DEFAULT)
+    if fmt not in GRID_OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown grid output format: '{fmt}', \
+choose from {tuple(GRID_OUTPUT_FORMATS)}"
+        )
+    level = cfg.get("output.grid.level")
+
+    # Netcdf only supports deflate, in one thread
+    if fmt == "netcdf":
+        compress = cfg.get("output.grid.compress", "deflate").upper()
+        options = ["FORMAT=NC4"]
+        if compress != "NONE":
+            options.append(f"COMPRESS={compress}")
+            if level is not None:
+                options.append(f"ZLEVEL={level}")
+        return GRID_OUTPUT_FORMATS[fmt], options + cfg.get("output.grid.options", [])
+
+    # Tiled (Big)tiff, compressed with the threads of a worker
+    config = cfg.get("_gdal") or gdal_config(cfg, cfg.get("model.threads", 1))
+    compress = cfg.get("output.grid.compress", "zstd").upper()
+    blocksize = cfg.get("output.grid.blocksize", 256)
+    options = [
+        "BIGTIFF=IF_SAFER",
+        f"NUM_THREADS={config['options']['GDAL_NUM_THREADS']}",
+    ]
+    if cog:
+        options.append(f"BLOCKSIZE={blocksize}")
+    else:
+        options += ["TILED=YES", f"BLOCKXSIZE={blocksize}", f"BLOCKYSIZE={blocksize}"]
+        # Blocks without data (e.g. skipped windows) are not written at all
+        options.append("SPARSE_OK=TRUE")
+    if compress != "NONE":
+        options.append(f"COMPRESS={compress}")
+        predictor = 3 if "Float" in gdal.GetDataTypeName(dtype) else 2
+        options.append(f"PREDICTOR={'YES' if cog else predictor}")
+        if level is not None and compress in GRID_OUTPUT_LEVEL:
+            options.append(f"{GRID_OUTPUT_LEVEL[compress]}={level}")
+    return GRID_OUTPUT_FORMATS[fmt], options + cfg.get("output.grid.options", [])
+
+
+def grid_output_finalize(
+    cfg: Configurations,
+    path: Path | str,
+    dtype: int,
+):
+    """Finalize a gridded output file.
+
+    In case of a cloud optimized GeoTIFF, the written (tiled) GeoTIFF is
+    converted. Otherwise nothing is done.
+
+    Parameters
+    ----------
+    cfg : Configurations
+        The configurations.
+    path : Path | str
+        Path to the output file.
+    dtype : int
+        The (GDAL) data type of the output.
+    """
+    if cfg.get("output.grid.format", GRID_OUTPUT_DEFAULT) != "cog":
+        return
+    path = Path(path)
+    tmp = path.with_name(f"{path.stem}_tmp{path.suffix}")
+    os.replace(path, tmp)
+    _, options = grid_output_options(cfg, dtype, cog=True)
+    gdal.Translate(str(path), str(tmp), format="COG", creationOptions=options)
+    os.unlink(tmp)
+
+
 def exposure_from_geom(
     ft: ogr.Feature,
     exp: TableLazy,
@@ -35,6 +456,7 @@ def exposure_from_geom(
     mid: int,
     idxs_haz: list | tuple,
     pattern: object,
+    raw: bytes = None,
 ):
     """Get exposure info from feature."""
     method = ft.GetField(mid)
@@ -49,9 +471,15 @@ def exposure_from_csv(
     mid: int,
     idxs_haz: list | tuple,
     pattern: object,
+    raw: bytes = None,
 ):
-    """Get exposure info from csv file."""
-    ft_info_raw = exp[ft.GetField(oid)]
+    """Get exposure info from csv file.
+
+    The row can be supplied directly (`raw`) when already read in a batch.
+    """
+    ft_info_raw = raw
+    if ft_info_raw is None:
+        ft_info_raw = exp[ft.GetField(oid)]
     if ft_info_raw is None:
         return None, None, None, None
 
@@ -1,23 +1,48 @@
 """Worker function for the geometry model (no csv)."""
 
 import importlib
+import os
 from math import nan
 from multiprocessing.queues import Queue
 from multiprocessing.synchronize import Lock
 from pathlib import Path
 from typing import Callable
 
+from numpy import array, zeros
+
 from fiat.fio import (
     BufferedGeomWriter,
     BufferedTextWriter,
+    CurveTable,
     GridSource,
     Table,
     TableLazy,
 )
 from fiat.gis import geom, overlay
-from fiat.log import LogItem, Sender
+from fiat.gis.util import world2pixel
+from fiat.log import LogItem, ProgressSender, Sender
 from fiat.methods.ead import calc_ead, risk_density
-from fiat.util import DummyWriter, regex_pattern
+from fiat.models.util import EXTRACT_AREA, Aggregates
+from fiat.util import DummyWriter, batched, peak_rss, regex_pattern
+
+
+def _is_wet(
+    envelope: tuple,
+    wet: tuple,
+    gtf: tuple,
+    shape_xy: tuple,
+) -> bool:
+    """Check whether the envelope of a feature touches any wet block."""
+    chunk, table = wet
+    ow, oh = shape_xy
+    minx, maxx, miny, maxy = envelope
+    ulx, uly = world2pixel(gtf, minx, maxy)
+    lrx, lry = world2pixel(gtf, maxx, miny)
+    if lrx < 0 or lry < 0 or ulx >= ow or uly >= oh:
+        return False
+    r0, c0 = max(uly, 0) // chunk[0], max(ulx, 0) // chunk[1]
+    r1, c1 = min(lry, oh - 1) // chunk[0] + 1, min(lrx, ow - 1) // chunk[1] + 1
+    return table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0] > 0
 
 
 def worker(
@@ -32,6 +57,7 @@ def worker(
     queue: Queue,
     lock1: Lock,
     lock2: Lock,
+    parts: dict = None,
 ):
     """Run the geometry model.
 
@@ -62,15 +88,36 @@ of the [GeomSource](/api/GeomSource.qmd) object.
         The lock for the csv output.
     lock2 : Lock
         The lock for the geometries output.
+    parts : dict, optional
+        Per exposure geometry file the meta data of the chunk, i.e. the feature
+        ids in spatial order ('order') and the representative points of its
+        features ('points').
+
+    Returns
+    -------
+    dict
+        Information about the worker, i.e. the process id and peak memory usage.
     """
     # Setup the hazard type module
     sender = Sender(queue=queue)
+    progress = ProgressSender(
+        queue=queue,
+        interval=cfg.get("model.progress.interval", 1),
+    )
     module = importlib.import_module(f"fiat.methods.{cfg.get('hazard.type')}")
     func_hazard = getattr(module, "calculate_hazard")
     func_damage = getattr(module, "calculate_damage")
     man_columns = getattr(module, "MANDATORY_COLUMNS")
     man_entries = getattr(module, "MANDATORY_ENTRIES")
 
+    # Set the memory related settings
+    text_buffer = 100000
+    geom_buffer = None
+    budget = cfg.get("_memory")
+    if budget is not None:
+        text_buffer = int(budget["buffer"] * 0.1)
+        geom_buffer = budget["buffer"] - text_buffer
+
     # Get the bands to prevent object creation while looping
     bands = [(haz[idx + 1], idx + 1) for idx in range(haz.size)]
 
@@ -78,8 +125,21 @@ of the [GeomSource](/api/GeomSource.qmd) object.
     cfg_entries = [cfg.get(item) for item in man_entries]
     index_col = cfg.get("exposure.geom.settings.index")
     rounding = cfg.get("vulnerability.round")
+    vul_round = rounding
+    if isinstance(vul, CurveTable):
+        vul_round = vul.decimals
     vul_min = min(vul.index)
     vul_max = max(vul.index)
+    batch_size = cfg.get("model.geom.batch", 1000)
+    bulk = cfg.get("model.geom.sampling", "feature") == "bulk"
+    upscale = cfg.get("model.geom.upscale", 5)
+
+    # Summed area table of the wet blocks of the hazard data
+    wet = cfg.get("_hazard_wet")
+    if wet is not None:
+        table = zeros((wet[1].shape[0] + 1, wet[1].shape[1] + 1), dtype=int)
+        table[1:, 1:] = wet[1].cumsum(0).cumsum(1)
+        wet = (wet[0], table)
 
     if risk:
         rp_coef = risk_density(cfg.get("hazard.return_periods"))
@@ -92,6 +152,10 @@ of the [GeomSource](/api/GeomSource.qmd) object.
         man_columns_idxs = [exp_data.columns.index(item) for item in man_columns]
         pattern = regex_pattern(exp_data.delimiter, nchar=exp_data.nchar)
 
+    # Aggregate the output per group, i.e. the values of (exposure) fields
+    group_fields = cfg.get("output.aggregate", [])
+    aggregates = None
+
     # Loop through the different files
     for idx, gm in exp_geom.items():
         # Check if there actually is data for this chunk
@@ -111,14 +175,48 @@ of the [GeomSource](/api/GeomSource.qmd) object.
             man_columns_idxs = [gm.fields.index(item) for item in man_columns]
             mid = gm.fields.index("extract_method")
 
+        # Transform the geometries on the fly (if needed)
+        transform = None
+        out_srs = gm.srs
+        if idx in cfg.get("_exposure_reproject", []):
+            transform, out_srs = geom.create_transform(
+                gm.srs,
+                cfg.get("model.srs.value"),
+            )
+
+        # The (cached) representative points of the features of the chunk
+        part = (parts or {}).get(idx, {})
+        points_tbl = part.get("points")
+
+        # The features of the chunk, either in file order or in spatial order
+        order = part.get("order")
+        missing = []
+        features = gm.reduced_iter(*chunk)
+        if order is not None:
+            features = gm.fid_iter(order, missing=missing)
+
+        # Where to find the group fields, in the csv row or in the feature
+        if group_fields and aggregates is None:
+            aggregates = Aggregates(field_meta["new_fields"])
+        group_idxs = [
+            (True, exp_data.columns.index(item))
+            if exp_data is not None and item in exp_data.columns
+            else (False, gm.fields.index(item))
+            for item in group_fields
+        ]
+
         # Setup the dataset buffer writer
-        out_geom = Path(cfg.get(f"output.geom.name{idx}"))
-        out_writer = BufferedGeomWriter(
-            Path(cfg.get("output.path"), out_geom),
-            gm.srs,
-            buffer_size=cfg.get("model.geom.chunk"),
-            lock=lock2,
-        )
+        out_writer = DummyWriter()
+        if cfg.get("output.geom.write", True):
+            out_geom = Path(cfg.get(f"output.geom.name{idx}"))
+            out_writer = BufferedGeomWriter(
+                Path(cfg.get("output.path"), out_geom),
+                out_srs,
+                buffer_size=cfg.get("model.geom.chunk"),
+                lock=lock2,
+                buffer_bytes=geom_buffer,
+                keep_fid=order is not None,
+            )
 
         # Check for the csv writer
         out_text_writer = DummyWriter()
@@ -127,87 +225,198 @@ of the [GeomSource](/api/GeomSource.qmd) object.
             out_text_writer = BufferedTextWriter(
                 Path(cfg.get("output.path"), out_csv),
                 mode="ab",
-                buffer_size=100000,
+                buffer_size=text_buffer,
                 lock=lock1,
             )
 
-        # Loop over all the geometries in a reduced manner
-        for ft in gm.reduced_iter(*chunk):
-            out = []
-            in_info, out_info, method, haz_kwargs = exp_func(
-                ft,
-                exp_data,
-                oid,
-                mid,
-                man_columns_idxs,
-                pattern,
-            )
-            if in_info is None:
-                sender.emit(
-                    LogItem(
-                        2,
-                        f"Object with ID: {ft.GetField(oid)} -> \
-No data found in exposure database",
+        # Loop over all the geometries in a reduced manner, in batches
+        for batch in batched(features, batch_size):
+            # Join the batch with the exposure data in one (sorted) read
+            raws = [None] * len(batch)
+            if exp_data is not None:
+                raws = exp_data.get_many([ft.GetField(oid) for ft in batch])
+
+            infos = []
+            for ft, raw in zip(batch, raws):
+                if transform is not None:
+                    ft.GetGeometryRef().Transform(transform)
+                infos.append(
+                    exp_func(
+                        ft,
+                        exp_data,
+                        oid,
+                        mid,
+                        man_columns_idxs,
+                        pattern,
+                        raw,
                     )
                 )
-                continue
-            for band, bn in bands:
-                # How to get the hazard data
-                if method == "area":
-                    res = overlay.clip(
-                        ft,
-                        band,
+
+            # Look up the representative points of the batch
+            pts = [None] * len(batch)
+            envs = [None] * len(batch)
+            if points_tbl is not None:
+                rows = points_tbl["index"].get_many([ft.GetFID() for ft in batch])
+                xy = points_tbl["points"][rows].tolist()
+                pts = [
+                    tuple(item) if row >= 0 else None
+                    for item, row in zip(xy, rows.tolist())
+                ]
+                env = points_tbl["envelope"][rows].tolist()
+                envs = [
+                    tuple(item) if row >= 0 else None
+                    for item, row in zip(env, rows.tolist())
+                ]
+
+            # Skip the hazard of the features that only touch dry blocks
+            dry = [False] * len(batch)
+            if wet is not None:
+                dry = [
+                    not _is_wet(
+                        env or ft.GetGeometryRef().GetEnvelope(),
+                        wet,
                         haz.geotransform,
+                        haz.shape_xy,
+                    )
+                    for ft, env in zip(batch, envs)
+                ]
+
+            # Sample the hazard at the points of the whole batch at once
+            pos = {}
+            samples = None
+            if bulk:
+                for i, info in enumerate(infos):
+                    if info[0] is None or info[2] in EXTRACT_AREA or dry[i]:
+                        continue
+                    pos[i] = len(pos)
+                points = array(
+                    [pts[i] or geom.point_in_geom(batch[i]) for i in pos],
+                    dtype=float,
+                ).reshape(-1, 2)
+                samples = [
+                    overlay.pin_many(points, band, haz.geotransform)
+                    for band, _ in bands
+                ]
+
+            for i, (ft, info) in enumerate(zip(batch, infos)):
+                out = []
+                in_info, out_info, method, haz_kwargs = info
+                if in_info is None:
+                    sender.emit(
+                        LogItem(
+                            2,
+                            f"Object with ID: {ft.GetField(oid)} -> \
+No data found in exposure database",
+                        )
                     )
-                else:
-                    res = overlay.pin(
-                        geom.point_in_geom(ft),
-                        band,
+                    progress.add()
+                    continue
+                # The covered area of the cells is the same for all bands
+                cover = None
+                if method == "area_weighted" and not dry[i]:
+                    cover = overlay.coverage(
+                        ft,
                         haz.geotransform,
+                        haz.shape_xy,
+                        upscale=upscale,
                     )
 
-                res[res == band.nodata] = nan
+                for bi, (band, bn) in enumerate(bands):
+                    # How to get the hazard data
+                    weights = None
+                    if dry[i]:
+                        res = zeros(0)
+                    elif method == "area_weighted":
+                        res, weights = overlay.clip_area_weighted(
+                            ft,
+                            band,
+                            haz.geotransform,
+                            cover=cover,
+                        )
+                    elif method == "area":
+                        res = overlay.clip(
+                            ft,
+                            band,
+                            haz.geotransform,
+                        )
+                    elif samples is not None:
+                        values, inside = samples[bi]
+                        p = pos[i]
+                        res = values[p : p + int(inside[p])]
+                    else:
+                        res = overlay.pin(
+                            pts[i] or geom.point_in_geom(ft),
+                            band,
+                            haz.geotransform,
+                        )
 
-                haz_value, red_fact = func_hazard(
-                    res.tolist(),
-                    *cfg_entries,
-                    *haz_kwargs,
-                )
-                out += [haz_value, red_fact]
-                for _, item in types.items():
-                    out += func_damage(
-                        haz_value,
-                        red_fact,
-                        in_info,
-                        item,
-                        vul,
-                        vul_min,
-                        vul_max,
-                        rounding,
+                    res[res == band.nodata] = nan
+
+                    kw = {}
+                    if weights is not None:
+                        kw["weights"] = weights.tolist()
+                    haz_value, red_fact = func_hazard(
+                        res.tolist(),
+                        *cfg_entries,
+                        *haz_kwargs,
+                        **kw,
                     )
+                    out += [haz_value, red_fact]
+                    for _, item in types.items():
+                        out += func_damage(
+                            haz_value,
+                            red_fact,
+                            in_info,
+                            item,
+                            vul,
+                            vul_min,
+                            vul_max,
+                            vul_round,
+                        )
 
-            # At last do (if set) risk calculation
-            if risk:
-                i = 0
-                for ti in total_idx:
-                    ead = round(
-                        calc_ead(rp_coef, out[ti - i :: -slen]),
-                        rounding,
+                # At last do (if set) risk calculation
+                if risk:
+                    for shift, ti in enumerate(total_idx):
+                        ead = round(
+                            calc_ead(rp_coef, out[ti - shift :: -slen]),
+                            rounding,
+                        )
+                        out.append(ead)
+
+                # Write the feature to the in memory dataset
+                out_writer.add_feature_with_map(
+                    ft,
+                    zip(
+                        idxs,
+                        out,
+                    ),
+                )
+                out_text_writer.write_iterable(out_info, out)
+                if aggregates is not None:
+                    key = tuple(
+                        in_info[item] if row else ft.GetField(item)
+                        for row, item in group_idxs
                     )
-                    out.append(ead)
-                    i += 1
-
-            # Write the feature to the in memory dataset
-            out_writer.add_feature_with_map(
-                ft,
-                zip(
-                    idxs,
-                    out,
-                ),
+                    aggregates.add_row(key, out)
+                progress.add()
+
+        # Features of the spatial order that were not found in the layer
+        for fid in missing:
+            sender.emit(
+                LogItem(
+                    2,
+                    f"Feature with FID: {fid} -> Not found in '{gm.path.name}'",
+                )
             )
-            out_text_writer.write_iterable(out_info, out)
+            progress.add()
 
         out_writer.close()
         out_writer = None
+        transform = None
         out_text_writer.close()
         out_text_writer = None
+
+    # Let the main process know this worker is done
+    progress.finish()
+
+    return {"pid": os.getpid(), "peak_rss": peak_rss(), "aggregates": aggregates}
@@ -1,17 +1,72 @@
 """Worker functions for grid model."""
 
+import os
+from functools import partial
 from math import floor
+from multiprocessing.queues import Queue
 from pathlib import Path
 
 from numpy import full, ravel, unravel_index, where
+from osgeo import gdal
 
 from fiat.fio import (
+    AsyncWriter,
+    CurveTable,
+    Grid,
     GridSource,
+    SparseGrid,
     Table,
     open_grid,
+    read_ahead,
 )
+from fiat.log import ProgressSender
 from fiat.methods.ead import calc_ead, risk_density
-from fiat.util import create_windows
+from fiat.models.util import (
+    Aggregates,
+    grid_output_finalize,
+    grid_output_options,
+)
+from fiat.util import create_windows, peak_rss
+
+
+def _create_output(
+    path: Path,
+    exp: GridSource,
+    size: int,
+    options: list,
+):
+    """Create an outgoing grid like the exposure grid."""
+    out_src = open_grid(
+        path,
+        mode="w",
+    )
+    out_src.create(
+        exp.shape_xy,
+        size,
+        exp.dtype,
+        options=options,
+    )
+    out_src.set_srs(exp.srs)
+    out_src.set_geotransform(exp.geotransform)
+    return out_src
+
+
+def _read_window(
+    item: tuple,
+    haz: Grid,
+    exp: list,
+    sparse: SparseGrid = None,
+    zones: Grid = None,
+):
+    """Read the hazard, exposure and zones data of a window."""
+    _w, occupied = item
+    e_chs = [None] * len(exp)
+    if sparse is None:
+        e_chs = [band[_w] if occ else None for band, occ in zip(exp, occupied)]
+    z_ch = None
+    if zones is not None:
+        z_ch = zones[_w]
+    return haz[_w], e_chs, z_ch
 
 
 def worker(
@@ -20,6 +75,7 @@ def worker(
     idx: int,
     vul: Table,
     exp: GridSource,
+    queue: Queue,
 ):
     """Run the geometry model.
 
@@ -38,7 +94,20 @@ of the [GridSource](/api/GeomSource.qmd) object.
         The vulnerability data.
     exp : GridSource
         The exposure data.
+    queue : Queue
+        A Queue for reporting the progress back to the main thread.
+
+    Returns
+    -------
+    dict
+        Information about the worker, i.e. the process id and peak memory usage.
     """
+    # Setup the progress reporting
+    progress = ProgressSender(
+        queue=queue,
+        interval=cfg.get("model.progress.interval", 1),
+    )
+
     # Set some variables for the calculations
     exp_bands = []
     write_bands = []
@@ -57,88 +126,137 @@ of the [GridSource](/api/GeomSource.qmd) object.
     if cfg.get("model.risk"):
         _out = cfg.get("output.damages.path")
 
-    # Create the outgoing netcdf containing every exposure damages
-    out_src = open_grid(
-        Path(_out, f"output{band_n}.nc"),
-        mode="w",
-    )
-    out_src.create(
-        exp.shape_xy,
-        exp.size,
-        exp.dtype,
-        options=["FORMAT=NC4", "COMPRESS=DEFLATE"],
-    )
-    out_src.set_srs(exp.srs)
-    out_src.set_geotransform(exp.geotransform)
-    # Create the outgoing total damage grid
-    td_out = open_grid(
-        Path(
-            _out,
-            f"total_damages{band_n}.nc",
-        ),
-        mode="w",
-    )
-    td_out.create(
-        exp.shape_xy,
-        1,
-        exp.dtype,
-        options=["FORMAT=NC4", "COMPRESS=DEFLATE"],
-    )
-    # Set the neccesary attributes
-    td_out.set_geotransform(exp.geotransform)
-    td_out.set_srs(exp.srs)
-    td_band = td_out[1]
-    td_noval = -0.5 * 2**128
-    td_band.src.SetNoDataValue(td_noval)
-
-    # Prepare some stuff for looping
+    # Set the names and the data of the exposure bands
+    names = []
     for idx in range(exp.size):
         exp_bands.append(exp[idx + 1])
-        write_bands.append(out_src[idx + 1])
         exp_nds.append(exp_bands[idx].nodata)
-        write_bands[idx].src.SetNoDataValue(exp_nds[idx])
         dmfs.append(exp_bands[idx].get_metadata_item("fn_damage"))
+        names.append(exp.get_band_name(idx + 1) or f"band{idx + 1}")
+    td_noval = -0.5 * 2**128
 
-    # Going trough the chunks
-    for _w, h_ch in haz_band:
-        td_ch = td_band[_w]
+    # Aggregate the damages per zone
+    zones = None
+    aggregates = None
+    if cfg.get("_zones") is not None:
+        zones_src = open_grid(cfg.get("_zones"))
+        zones = zones_src[1]
+        aggregates = Aggregates([f"{item}{band_n}" for item in names])
+
+    # Create the outgoing files, the blocks that are not written are nodata
+    write_grids = cfg.get("_write_grids", True)
+    sparse_ok = False
+    written = [set() for _ in range(exp.size)]
+    if write_grids:
+        suffix, options = grid_output_options(cfg, exp.dtype)
+        sparse_ok = "SPARSE_OK=TRUE" in options
+        out_path = Path(_out, f"output{band_n}{suffix}")
+        out_src = _create_output(out_path, exp, exp.size, options)
+        for idx in range(exp.size):
+            write_bands.append(out_src[idx + 1])
+            write_bands[idx].src.SetNoDataValue(exp_nds[idx])
+        # Create the outgoing total damage grid
+        td_path = Path(
+            _out,
+            f"total_damages{band_n}{suffix}",
+        )
+        td_out = _create_output(td_path, exp, 1, options)
+        td_band = td_out[1]
+        td_band.src.SetNoDataValue(td_noval)
+
+    # Windows without any exposure data (per band) are skipped entirely
+    chunk = haz_band.chunk
+    occupancy = cfg.get("_exposure_occupancy")
+    if occupancy is not None:
+        chunk, occupancy = occupancy
+    # Only the cells with exposure data when stored sparse
+    sparse = cfg.get("_exposure_sparse")
+    if sparse is not None:
+        chunk = sparse.chunk
+
+    # Gather the windows to calculate
+    windows = []
+    for _w in create_windows(haz_band.shape_xy, chunk[::-1]):
+        occupied = [True] * exp.size
+        if occupancy is not None:
+            pos = (_w[1] // chunk[0], _w[0] // chunk[1])
+            occupied = [bool(occ[pos]) for occ in occupancy]
+        elif sparse is not None:
+            occupied = [sparse.count(idx + 1, _w) > 0 for idx in range(exp.size)]
+        if not any(occupied):
+            progress.add()
+            continue
+        windows.append((_w, occupied))
+
+    # Write in the background, one thread for all the output
+    writer = None
+    if write_grids and cfg.get("model.grid.write_behind", 0) > 0:
+        writer = AsyncWriter(cfg.get("model.grid.write_behind"))
+        for band in write_bands + [td_band]:
+            band.set_writer(writer)
+
+    # Going trough the chunks, optionally reading ahead in the background
+    for (_w, occupied), (h_ch, e_chs, z_ch) in read_ahead(
+        partial(
+            _read_window,
+            haz=haz_band,
+            exp=exp_bands,
+            sparse=sparse,
+            zones=zones,
+        ),
+        windows,
+        cfg.get("model.grid.prefetch", 0),
+    ):
+        td_ch = full(h_ch.shape, td_noval)
 
         # Per exposure band
-        for idx, exp_band in enumerate(exp_bands):
-            e_ch = exp_band[_w]
-
-            # See if there is any exposure data
-            out_ch = full(e_ch.shape, exp_nds[idx])
-            e_ch = ravel(e_ch)
-            _coords = where(e_ch != exp_nds[idx])[0]
-            if len(_coords) == 0:
-                write_bands[idx].src.WriteArray(out_ch, *_w[:2])
+        for idx in range(exp.size):
+            if not occupied[idx]:
                 continue
 
+            # Get the cells with exposure data
+            if sparse is not None:
+                *idx2d, e_ch = sparse.cells(idx + 1, _w)
+            else:
+                e_ch = ravel(e_chs[idx])
+                _coords = where(e_ch != exp_nds[idx])[0]
+                if len(_coords) == 0:
+                    continue
+                idx2d = unravel_index(_coords, h_ch.shape)
+                e_ch = e_ch[_coords]
+
             # See if there is overlap with the hazard data
-            e_ch = e_ch[_coords]
-            h_1d = ravel(h_ch)
-            h_1d = h_1d[_coords]
+            h_1d = h_ch[tuple(idx2d)]
             _hcoords = where(h_1d != haz_band.nodata)[0]
 
             if len(_hcoords) == 0:
-                write_bands[idx].src.WriteArray(out_ch, *_w[:2])
                 continue
 
             # Do the calculations
-            _coords = _coords[_hcoords]
+            idx2d = tuple([item[_hcoords] for item in idx2d])
             e_ch = e_ch[_hcoords]
             h_1d = h_1d[_hcoords]
             h_1d = h_1d.clip(min(vul.index), max(vul.index))
 
-            dmm = [vul[round(float(n), 2), dmfs[idx]] for n in h_1d]
+            # Vectorized for the curves, a lookup per cell for the upscaled table
+            if isinstance(vul, CurveTable):
+                dmm = vul.interp(h_1d, dmfs[idx])
+            else:
+                dmm = [vul[round(float(n), 2), dmfs[idx]] for n in h_1d]
             e_ch = e_ch * dmm
 
-            idx2d = unravel_index(_coords, *[exp._chunk])
-            out_ch[idx2d] = e_ch
-
             # Write it to the band in the outgoing file
-            write_bands[idx].write_chunk(out_ch, _w[:2])
+            if write_grids:
+                out_ch = full(h_ch.shape, exp_nds[idx])
+                out_ch[idx2d] = e_ch
+                write_bands[idx].write_chunk(out_ch, _w[:2])
+                written[idx].add(_w[:2])
+
+            # Add it to the zones
+            if zones is not None:
+                z_1d = z_ch[idx2d]
+                _zcoords = where(z_1d != zones.nodata)[0]
+                aggregates.add(names[idx] + band_n, z_1d[_zcoords], e_ch[_zcoords])
 
             # Doing the total damages part
             # Checking whether it has values or not
@@ -147,25 +265,57 @@ of the [GridSource](/api/GeomSource.qmd) object.
             td_1d += e_ch
             td_ch[idx2d] = td_1d
 
-        # Write the total damages chunk
-        td_band.write_chunk(td_ch, _w[:2])
+        # Add the total damages to the zones
+        if zones is not None:
+            _coords = where((td_ch != td_noval) & (z_ch != zones.nodata))
+            aggregates.add(f"total{band_n}", z_ch[_coords], td_ch[_coords])
 
-    # Flush the cache and dereference
-    for _w in write_bands[:]:
-        write_bands.remove(_w)
-        _w.close()
-        _w = None
+        # Write the total damages chunk
+        if write_grids:
+            td_band.write_chunk(td_ch, _w[:2])
+        progress.add()
+
+    # Without sparse files, write nodata to the windows that were not written
+    if write_grids and not sparse_ok:
+        done = {item[0][:2] for item in windows}
+        for _w in create_windows(haz_band.shape_xy, chunk[::-1]):
+            for idx in range(exp.size):
+                if _w[:2] not in written[idx]:
+                    out_ch = full((_w[3], _w[2]), exp_nds[idx])
+                    write_bands[idx].write_chunk(out_ch, _w[:2])
+            if _w[:2] not in done:
+                td_band.write_chunk(full((_w[3], _w[2]), td_noval), _w[:2])
 
-    # Flush and close all
     exp_bands = None
-    td_band.close()
-    td_band = None
-    td_out = None
+    haz_band = None
+    if zones is not None:
+        zones = None
+        zones_src.close()
+        zones_src = None
 
-    out_src.close()
-    out_src = None
+    # Flush the cache, dereference and close all
+    if write_grids:
+        for _w in write_bands[:]:
+            write_bands.remove(_w)
+            _w.close()
+            _w = None
+        td_band.close()
+        td_band = None
+        td_out = None
+        if writer is not None:
+            writer.close()
 
-    haz_band = None
+        out_src.close()
+        out_src = None
+
+        # Convert if needed, e.g. to a cloud optimized GeoTIFF
+        grid_output_finalize(cfg, out_path, exp.dtype)
+        grid_output_finalize(cfg, td_path, exp.dtype)
+
+    # Let the main process know this worker is done
+    progress.finish()
+
+    return {"pid": os.getpid(), "peak_rss": peak_rss(), "zones": aggregates}
 
 
 def worker_ead(
@@ -178,20 +328,21 @@ def worker_ead(
     _chunk = [floor(_n / len(_rp_coef)) for _n in chunk]
     td = []
     rp = []
+    suffix, _ = grid_output_options(cfg, gdal.GDT_Float64)
 
     # TODO this is really fucking bad; fix in the future
     # Read the data from the calculations
     for _name in cfg.get("hazard.band_names"):
         td.append(
             open_grid(
-                Path(cfg.get("output.damages.path"), f"total_damages_{_name}.nc"),
+                Path(cfg.get("output.damages.path"), f"total_damages_{_name}{suffix}"),
                 chunk=_chunk,
                 mode="r",
             )
         )
         rp.append(
             open_grid(
-                Path(cfg.get("output.damages.path"), f"total_damages_{_name}.nc"),
+                Path(cfg.get("output.damages.path"), f"total_damages_{_name}{suffix}"),
                 chunk=_chunk,
                 mode="r",
             )
@@ -201,15 +352,17 @@ def worker_ead(
     exp_bands = {}
     write_bands = []
     exp_nds = []
+    _, options = grid_output_options(cfg, rp[0].dtype)
+    ead_path = Path(_out, f"ead{suffix}")
     ead_src = open_grid(
-        Path(_out, "ead.nc"),
+        ead_path,
         mode="w",
     )
     ead_src.create(
         rp[0].shape_xy,
         rp[0].size,
         rp[0].dtype,
-        options=["FORMAT=NC4", "COMPRESS=DEFLATE"],
+        options=options,
     )
     ead_src.set_srs(rp[0].srs)
     ead_src.set_geotransform(rp[0].geotransform)
@@ -223,7 +376,7 @@ def worker_ead(
 
     # Do the calculation for the EAD
     for idx, rpx in exp_bands.items():
-        for _w in create_windows(rp[0].shape, _chunk):
+        for _w in create_windows(rp[0].shape_xy, _chunk[::-1]):
             ead_ch = write_bands[idx][_w]
             # check for one
             d_ch = rpx[0][_w]
@@ -237,7 +390,7 @@ def worker_ead(
             data = [_data[_w] for _data in rpx]
             data = [ravel(_data)[_coords] for _data in data]
             data = calc_ead(_rp_coef, data)
-            idx2d = unravel_index(_coords, *[_chunk])
+            idx2d = unravel_index(_coords, d_ch.shape)
             ead_ch[idx2d] = data
             write_bands[idx].write_chunk(ead_ch, _w[:2])
 
@@ -253,15 +406,17 @@ def worker_ead(
     ead_src = None
 
     # Create ead total outgoing dataset
+    _, options = grid_output_options(cfg, td[0].dtype)
+    td_path = Path(_out, f"ead_total{suffix}")
     td_src = open_grid(
-        Path(_out, "ead_total.nc"),
+        td_path,
         mode="w",
     )
     td_src.create(
         td[0].shape_xy,
         1,
         td[0].dtype,
-        options=["FORMAT=NC4", "COMPRESS=DEFLATE"],
+        options=options,
     )
     td_src.set_srs(td[0].srs)
     td_src.set_geotransform(td[0].geotransform)
@@ -270,7 +425,7 @@ def worker_ead(
     td_band.src.SetNoDataValue(td_noval)
 
     # Do the calculations for total damages
-    for _w in create_windows(td[0].shape, _chunk):
+    for _w in create_windows(td[0].shape_xy, _chunk[::-1]):
         # Get the data
         td_ch = td_band[_w]
         data = [_data[1][_w] for _data in td]
@@ -284,7 +439,7 @@ def worker_ead(
         # Get data, calc risk and write it.
         data = [ravel(_i)[_coords] for _i in data]
         data = calc_ead(_rp_coef, data)
-        idx2d = unravel_index(_coords, *[_chunk])
+        idx2d = unravel_index(_coords, td_ch.shape)
         td_ch[idx2d] = data
         td_band.write_chunk(td_ch, _w[:2])
 
@@ -294,3 +449,7 @@ def worker_ead(
     td_band = None
     td_src.close()
     td_src = None
+
+    # Convert if needed, e.g. to a cloud optimized GeoTIFF
+    grid_output_finalize(cfg, ead_path, rp[0].dtype)
+    grid_output_finalize(cfg, td_path, rp[0].dtype)
@@ -7,11 +7,28 @@ import re
 import sys
 from collections.abc import MutableMapping
 from gc import get_referents
-from itertools import product
+from itertools import islice, product
 from pathlib import Path
 from types import FunctionType, ModuleType
 
 import regex
+from numpy import (
+    array,
+    ascontiguousarray,
+    bytes_,
+    char,
+    concatenate,
+    empty,
+    flatnonzero,
+    float64,
+    frombuffer,
+    int64,
+    isin,
+    ndarray,
+    uint8,
+    where,
+    zeros,
+)
 from osgeo import gdal, ogr, osr
 
 # Define the variables for FIAT
@@ -51,6 +68,40 @@ _dtypes_from_string = {
     "str": str,
 }
 
+# State machine mirroring the (numeric) patterns of deter_type
+# Character classes: 0: padding, 1: digit, 2: '-', 3: '.', 4: 'e' or 'E', 5: '+'
+# and 6: anything else
+_char_classes = zeros(256, dtype=uint8) + 6
+_char_classes[0] = 0
+_char_classes[ord("0") : ord("9") + 1] = 1
+_char_classes[ord("-")] = 2
+_char_classes[ord(".")] = 3
+_char_classes[[ord("e"), ord("E")]] = 4
+_char_classes[ord("+")] = 5
+
+# States: 0: start, 1: sign, 2: integer part, 3: decimal part,
+# 4/5: exponent character, 6/7: exponent sign, 8/9: exponent (integer/ decimal)
+# and 10: not a number
+_type_states = array(
+    [
+        [0, 2, 1, 10, 10, 10, 10],
+        [1, 2, 10, 10, 10, 10, 10],
+        [2, 2, 10, 3, 4, 10, 10],
+        [3, 3, 10, 10, 5, 10, 10],
+        [4, 8, 6, 10, 10, 6, 10],
+        [5, 9, 7, 10, 10, 7, 10],
+        [6, 8, 10, 10, 10, 10, 10],
+        [7, 9, 10, 10, 10, 10, 10],
+        [8, 8, 10, 10, 10, 10, 10],
+        [9, 9, 10, 10, 10, 10, 10],
+        [10, 10, 10, 10, 10, 10, 10],
+    ],
+    dtype=uint8,
+)
+_type_states_flat = _type_states.ravel()
+_int_states = (2, 8)
+_float_states = (0, 2, 3, 8, 9)
+
 _fields_type_map = {
     "int": ogr.OFTInteger64,
     "float": ogr.OFTReal,
@@ -131,6 +182,66 @@ def text_chunk_gen(
         yield _nlines, sd
 
 
+def find_newlines(
+    buffer: object,
+    nchar: bytes = b"\n",
+    block_size: int = 2**26,
+):
+    """Find the offsets directly after the newline characters.
+
+    Parameters
+    ----------
+    buffer : object
+        An object supporting the buffer protocol, e.g. a memory mapped file.
+    nchar : bytes, optional
+        The newline character, by default b"\n"
+    block_size : int, optional
+        Size of the blocks (in bytes) that are scanned at once, by default 2**26
+
+    Returns
+    -------
+    ndarray
+        The offsets (int64).
+    """
+    data = frombuffer(buffer, dtype=uint8)
+    block = None
+    offsets = [empty(0, dtype=int64)]
+    for start in range(0, data.size, block_size):
+        block = data[start : start + block_size]
+        offsets.append(flatnonzero(block == nchar[-1]).astype(int64) + start + 1)
+    # Release the buffer
+    data = block = None
+    return concatenate(offsets)
+
+
+def batched(
+    iterable: object,
+    n: int,
+):
+    """Batch the items of an iterable.
+
+    Parameters
+    ----------
+    iterable : object
+        The iterable.
+    n : int
+        Size of the batches.
+
+    Yields
+    ------
+    tuple
+        A batch of (at most) n items.
+    """
+    if n < 1:
+        raise ValueError("n must be at least one")
+    it = iter(iterable)
+    while True:
+        batch = tuple(islice(it, n))
+        if not batch:
+            break
+        yield batch
+
+
 def create_windows(
     shape: tuple,
     chunk: tuple,
@@ -167,6 +278,56 @@ def create_windows(
         )
 
 
+def chunk_from_blocks(
+    shape: tuple,
+    blocks: list | tuple,
+    cell_size: int,
+    budget: int,
+):
+    """Determine a chunk size that is aligned to the blocks of the data.
+
+    The chunk size is a multiple of the block sizes of all the data (in both
+    directions), so that blocks are never read twice. Within that constraint the
+    chunk is fitted to the memory budget, but it is never smaller than one block.
+    When such a combined block does not fit the budget (mismatched block sizes),
+    the chunk is a multiple of the largest block instead, accepting that some
+    blocks are read more than once.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the grid (rows, columns).
+    blocks : list | tuple
+        The block sizes (rows, columns) of the data.
+    cell_size : int
+        Number of bytes needed per cell (for all the data that is in memory).
+    budget : int
+        The memory budget in bytes.
+
+    Returns
+    -------
+    tuple
+        The chunk size (rows, columns).
+    """
+    # A block size that fits all data, no larger than the grid itself
+    brows = min(math.lcm(*[int(item[0]) for item in blocks]), shape[0])
+    bcols = min(math.lcm(*[int(item[1]) for item in blocks]), shape[1])
+    cells = int(budget / cell_size)
+
+    # Otherwise the largest block, when the combined block exceeds the budget
+    if brows * bcols > cells:
+        brows = min(max([int(item[0]) for item in blocks]), shape[0])
+        bcols = min(max([int(item[1]) for item in blocks]), shape[1])
+
+    cells = max(cells, brows * bcols)
+    side = math.sqrt(cells)
+    cols = min(max(int(side / bcols), 1) * bcols, shape[1])
+    rows = min(max(int(cells / (cols * brows)), 1) * brows, shape[0])
+    # Give the leftover budget to the columns when the grid is narrow
+    cols = min(max(int(cells / (rows * bcols)), 1) * bcols, shape[1])
+    return rows, cols
+
+
 def create_1d_chunk(
     length: int,
     parts: int,
@@ -562,6 +723,25 @@ def object_size(obj):
     return size
 
 
+def peak_rss():
+    """Return the peak resident set size (memory) of the current process.
+
+    Returns
+    -------
+    int | None
+        Peak memory usage in bytes, None if it cannot be determined on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports in kilobytes, macOS in bytes
+    if sys.platform == "darwin":
+        return rss
+    return rss * 1024
+
+
 # Objects for dummy usage
 class DummyLock:
     """Mimic Lock functionality while doing nothing."""
@@ -581,6 +761,10 @@ class DummyWriter:
     def __init__(self, *args, **kwargs):
         pass
 
+    def add_feature_with_map(self, *args):
+        """Call dummy add feature with map."""
+        pass
+
     def close(self):
         """Call dummy close."""
         pass
@@ -626,6 +810,41 @@ def deter_type(
     return _dtypes[sum(l)]
 
 
+def deter_type_array(
+    e: ndarray,
+):
+    """Detemine the type of a column of text in a vectorized manner.
+
+    Gives the same result as [deter_type](/api/util/deter_type.qmd).
+
+    Parameters
+    ----------
+    e : ndarray
+        Array of bytes (numpy dtype 'S') containing the values of the column.
+
+    Returns
+    -------
+    int
+        Type of the column expressed by an integer.
+    """
+    if e.size == 0:
+        return 0
+    # View every value as a row of characters
+    e = ascontiguousarray(e)
+    classes = _char_classes[e.view(uint8).reshape(e.size, e.itemsize)]
+    state = zeros(e.size, dtype=uint8)
+    for idx in range(e.itemsize):
+        state = _type_states_flat[state * 7 + classes[:, idx]]
+        # Stop when none of the values can be a number anymore
+        if idx % 4 == 3 and (state == 10).all():
+            return 3
+    if isin(state, _int_states).all():
+        return 1
+    if isin(state, _float_states).all():
+        return 2
+    return 3
+
+
 def deter_dec(
     e: float,
     base: float = 10.0,
@@ -638,3 +857,192 @@ def deter_dec(
 def replace_empty(l: list):
     """Replace empty values by None in a string (i.e. between delimiters)."""
     return ["nan" if not e else e.decode() for e in l]
+
+
+def convert_array(
+    e: ndarray,
+    dtype: type,
+    fill: bytes | None = b"nan",
+):
+    """Convert an array of bytes to an array of a certain type.
+
+    Parameters
+    ----------
+    e : ndarray
+        Array of bytes (numpy dtype 'S').
+    dtype : type
+        The python type, i.e. int, float or str.
+    fill : bytes | None, optional
+        Value for the empty entries, by default b"nan"
+
+    Returns
+    -------
+    ndarray
+        The converted array.
+    """
+    if fill is not None:
+        e = where(e == b"", fill, e)
+    if dtype is int:
+        return e.astype(int64)
+    if dtype is float:
+        return e.astype(float64)
+    if e.size == 0:
+        return e.astype(str)
+    # Plain ascii text can be converted directly (much faster than decoding)
+    if ascontiguousarray(e).view(uint8).max() < 128:
+        e = e.astype(str)
+    else:
+        e = char.decode(e, "utf-8")
+    # Trim to the longest string, like creating an array from a list would
+    return e.astype(f"U{max(int(char.str_len(e).max()), 1)}")
+
+
+def split_text_array(
+    text: bytes,
+    delimiter: str,
+    ncol: int,
+    nchar: bytes = b"\n",
+):
+    """Split text into an array of fields.
+
+    Parameters
+    ----------
+    text : bytes
+        The text.
+    delimiter : str
+        The delimiter of the text.
+    ncol : int
+        Number of columns.
+    nchar : bytes, optional
+        The newline character, by default b"\n"
+
+    Returns
+    -------
+    ndarray
+        Array of bytes (numpy dtype 'S') with the shape rows, columns.
+    """
+    text = text.rstrip(b"\r\n")
+    if not text:
+        return empty((0, ncol), dtype="S1")
+    # Only fall back on the (slower) regex split when quotes are present
+    if b'"' in text:
+        sd = regex_pattern(delimiter, multi=True, nchar=nchar).split(text)
+    else:
+        _d = delimiter.encode()
+        sd = text.replace(nchar, _d).split(_d)
+    if len(sd) % ncol != 0:
+        raise ValueError(
+            f"Number of fields ({len(sd)}) does not match \
+the number of columns ({ncol})"
+        )
+    return array(sd, dtype=bytes_).reshape(-1, ncol)
+
+
+def parse_text_chunk(
+    path: Path | str,
+    start: int,
+    end: int,
+    delimiter: str,
+    ncol: int,
+    nchar: bytes = b"\n",
+):
+    """Parse a part of a text file.
+
+    Parameters
+    ----------
+    path : Path | str
+        Path to the text file.
+    start : int
+        Start of the part in bytes.
+    end : int
+        End of the part in bytes.
+    delimiter : str
+        The delimiter of the text.
+    ncol : int
+        Number of columns.
+    nchar : bytes, optional
+        The newline character, by default b"\n"
+
+    Returns
+    -------
+    tuple
+        Array of fields (rows, columns), types of the columns
+    """
+    with open(path, "rb") as _r:
+        _r.seek(start)
+        text = _r.read(end - start)
+    fields = split_text_array(text, delimiter, ncol, nchar=nchar)
+    types = [deter_type_array(fields[:, idx]) for idx in range(ncol)]
+    return fields, types
+
+
+def scan_text_chunk(
+    path: Path | str,
+    start: int,
+    end: int,
+    delimiter: str,
+    ncol: int,
+    nchar: bytes = b"\n",
+    idcol: int = None,
+    chunk_size: int = 2**24,
+):
+    """Scan a part of a text file for the column types and the index.
+
+    Unlike `parse_text_chunk`, the part is read
+    in chunks and the fields are not kept, i.e. for a lazy read.
+
+    Parameters
+    ----------
+    path : Path | str
+        Path to the text file.
+    start : int
+        Start of the part in bytes.
+    end : int
+        End of the part in bytes.
+    delimiter : str
+        The delimiter of the text.
+    ncol : int
+        Number of columns.
+    nchar : bytes, optional
+        The newline character, by default b"\n"
+    idcol : int, optional
+        The index column, by default None
+    chunk_size : int, optional
+        The size of the chunks in bytes, by default 2**24 (16 MB)
+
+    Returns
+    -------
+    tuple
+        Array of the index fields (or None), types of the columns
+    """
+    index = []
+    types = [0] * ncol
+    _res = b""
+    with open(path, "rb") as _r:
+        _r.seek(start)
+        pos = start
+        while pos < end:
+            t = _r.read(min(chunk_size, end - pos))
+            if not t:
+                break
+            pos += len(t)
+            t = _res + t
+            if pos < end:
+                t, _, _res = t.rpartition(nchar)
+            else:
+                _res = b""
+            fields = split_text_array(t, delimiter, ncol, nchar=nchar)
+            del t
+            if fields.size == 0:
+                continue
+            types = [
+                max(deter_type_array(fields[:, idx]), types[idx]) for idx in range(ncol)
+            ]
+            if idcol is not None:
+                index.append(fields[:, idcol].copy())
+            del fields
+    if idcol is None:
+        return None, types
+    if not index:
+        return empty(0, dtype="S1"), types
+    return concatenate(index), types
@@ -25,6 +25,10 @@ def test_parse_run(mocker, cli_parser):
     assert len(args.set_entry) == 2
     assert "output.path" in args.set_entry
 
+    args = parser.parse_args(args=["run", "-p", "--profile-jobs", "2"])
+    assert args.profile == "profile"
+    assert args.profile_jobs == 2
+
 
 def test_cli_main():
     p = subprocess.run(["fiat"], check=True, capture_output=True, text=True)
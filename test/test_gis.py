@@ -1,8 +1,8 @@
 import sys
 
-from numpy import mean
+from numpy import array, mean
 
-from fiat.gis import geom, grid, overlay
+from fiat.gis import geom, grid, overlay, util
 from fiat.util import get_srs_repr
 
 
@@ -74,6 +74,42 @@ def test_clip_weighted(geom_data, grid_event_data):
     assert int(weights[0, 0] * 100) == 81
 
 
+def test_clip_area_weighted(geom_data, grid_event_data):
+    ft = geom_data[3]
+    hazard, weights = overlay.clip_area_weighted(
+        ft,
+        grid_event_data[1],
+        grid_event_data.geotransform,
+        upscale=100,
+    )
+    ft = None
+
+    assert len(hazard) == len(weights)
+    assert len(hazard) <= 6  # Never more than the touched cells
+    assert abs(weights[0] - 0.81) < 0.01  # Like 'clip_weighted'
+    assert weights.max() <= 1
+
+
+def test_representative_points(geom_data):
+    points = geom.representative_points(geom_data)
+    assert points["points"].shape == (4, 2)
+    assert points["envelope"].shape == (4, 4)
+
+    # The same points as determined per feature
+    for ft in geom_data:
+        row = points["index"][ft.GetFID()]
+        assert tuple(points["points"][row]) == geom.point_in_geom(ft)
+
+
+def test_spatial_order(geom_data):
+    fids = geom.spatial_order(geom_data)
+    assert sorted(fids.tolist()) == sorted([ft.GetFID() for ft in geom_data])
+
+    # Neighbouring points are next to each other along the curve
+    keys = util.hilbert_keys([0, 1, 3, 2], [0, 0, 0, 0], (0, 3, 0, 3), level=2)
+    assert keys.tolist() == [0, 1, 15, 14]
+
+
 def test_pin(geom_data, grid_event_data):
     for ft in geom_data:
         XY = geom.point_in_geom(ft)
@@ -87,6 +123,28 @@ def test_pin(geom_data, grid_event_data):
     assert int(round(hazard[0] * 100, 0)) == 160
 
 
+def test_pin_many(geom_outside_data, grid_event_data):
+    points = array([geom.point_in_geom(ft) for ft in geom_outside_data])
+    values, inside = overlay.pin_many(
+        points,
+        grid_event_data[1],
+        grid_event_data.geotransform,
+    )
+
+    # The same as pinning them one by one
+    for point, value, ins in zip(points, values, inside):
+        hazard = overlay.pin(
+            point,
+            grid_event_data[1],
+            grid_event_data.geotransform,
+        )
+        assert len(hazard) == int(ins)
+        if ins:
+            assert hazard[0] == value
+    assert not inside[0]
+    assert int(round(values[2] * 100, 0)) == 200
+
+
 def test_pin_outside(geom_outside_data, grid_event_data):
     ft = geom_outside_data[0]
     XY = geom.point_in_geom(ft)
@@ -123,6 +181,24 @@ def test_geom_reproject(tmp_path, geom_data):
     assert new_gm.srs.GetAuthorityCode(None) == "3857"
 
 
+def test_geom_reproject_parallel(tmp_path, geom_data):
+    dst_crs = "EPSG:3857"
+    transform, _ = geom.create_transform(geom_data.srs, dst_crs)
+    bounds = geom.reproject_bounds(geom_data.bounds, transform)
+    new_gm = geom.reproject(
+        geom_data,
+        dst_crs,
+        out_dir=str(tmp_path),
+        threads=2,
+    )
+
+    assert new_gm.srs.GetAuthorityCode(None) == "3857"
+    assert new_gm.size == 4
+    assert len(list(tmp_path.glob("*_repr_*"))) == 0  # Parts are removed
+    assert bounds[0] <= new_gm.bounds[0] + 1e-6
+    assert bounds[1] >= new_gm.bounds[1] - 1e-6
+
+
 def test_geom_reproject_single(geom_data):
     ft = geom_data[1]
     geometry = ft.GetGeometryRef()
@@ -151,6 +227,21 @@ def test_grid_reproject(tmp_path, grid_event_data):
     assert new_gr.srs.GetAuthorityCode(None) == "3857"
 
 
+def test_grid_reproject_lazy(tmp_path, grid_event_data):
+    dst_crs = "EPSG:3857"
+    new_gr = grid.reproject(
+        grid_event_data,
+        dst_crs,
+        out_dir=str(tmp_path),
+        lazy=True,
+        threads=2,
+    )
+
+    assert new_gr.path.suffix == ".vrt"
+    assert new_gr.srs.GetAuthorityCode(None) == "3857"
+    assert new_gr[1][0, 0, 2, 2].shape == (2, 2)
+
+
 def test_grid_reproject_gtf(tmp_path, grid_event_data, grid_event_highres_data):
     assert grid_event_highres_data.shape == (100, 100)
     new_gr = grid.reproject(
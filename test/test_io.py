@@ -1,6 +1,31 @@
+import os
+import pickle
+import shutil
 from pathlib import Path
 
-from fiat.fio import BufferedGeomWriter, BufferedTextWriter
+import numpy as np
+from osgeo import gdal
+
+from fiat.fio import (
+    AsyncWriter,
+    BufferedGeomWriter,
+    BufferedTextWriter,
+    BufferHandler,
+    MmapHandler,
+    open_csv,
+    open_geom,
+    read_ahead,
+    read_cache,
+)
+
+
+def test_asyncwriter():
+    src = gdal.GetDriverByName("MEM").Create("", 4, 4, 1, gdal.GDT_Float32)
+    band = src.GetRasterBand(1)
+    with AsyncWriter(depth=2) as writer:
+        for row in range(4):
+            writer.write(band, np.full((1, 4), row), (0, row))
+    assert band.ReadAsArray()[:, 0].tolist() == [0, 1, 2, 3]
 
 
 def test_bufferedgeom(tmp_path, geom_data):
@@ -32,7 +57,22 @@ def test_bufferedgeom(tmp_path, geom_data):
     assert writer.size == 1
 
     writer.close()
-    pass
+
+    # Keeping the feature ids, over multiple flushes of the buffer
+    writer = BufferedGeomWriter(
+        Path(out_path, "bufferedgeoms_fid.gpkg"),
+        geom_data.srs,
+        geom_data.layer.GetLayerDefn(),
+        buffer_size=1,
+        keep_fid=True,
+    )
+    for fid in [3, 1, 2]:
+        writer.add_feature_with_map(geom_data.layer.GetFeature(fid), {})
+    writer.close()
+    writer = None
+    gm = open_geom(Path(out_path, "bufferedgeoms_fid.gpkg"))
+    assert [ft.GetFID() for ft in gm] == [1, 2, 3]
+    gm.close()
 
 
 def test_bufferedtext(tmp_path):
@@ -57,3 +97,66 @@ def test_bufferedtext(tmp_path):
         text = reader.read()
 
     assert len(text) == 25
+
+
+def test_cache(tmp_path, vul_path):
+    path = Path(tmp_path, vul_path.name)
+    shutil.copy2(vul_path, path)
+    options = {
+        "delimiter": ",",
+        "header": True,
+        "index": "water depth",
+        "lazy": False,
+        "memory_map": False,
+    }
+    assert read_cache(path, **options) is None
+
+    tb = open_csv(path, index="water depth", cache=True)
+    files = list(Path(tmp_path, ".fiat_cache").glob("*.pkl"))
+    assert len(files) == 1
+    cached = read_cache(path, **options)
+    assert cached.index == tb.index
+    assert (cached.data == tb.data).all()
+
+    # Changing the file invalidates the cache
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert read_cache(path, **options) is None
+    _ = open_csv(path, index="water depth", cache=True)
+    new_files = list(Path(tmp_path, ".fiat_cache").glob("*.pkl"))
+    assert len(new_files) == 1
+    assert new_files != files
+
+    # A corrupt (truncated) cache file is discarded
+    new_files[0].write_bytes(b"")
+    assert read_cache(path, **options) is None
+
+    # Not being able to write the cache is not fatal
+    blocked = Path(tmp_path, "blocked")
+    blocked.write_text("")
+    tb = open_csv(path, index="water depth", cache=blocked)
+    assert len(tb.index) == len(cached.index)
+
+
+def test_mmaphandler(tmp_path, vul_path):
+    handler = MmapHandler(vul_path, skip=59)
+    ref = BufferHandler(vul_path, skip=59)
+    assert handler.size == ref.size
+    assert list(handler.row_offsets(21)) == ref.row_offsets(21)
+
+    # The offsets are carried along when pickling
+    rebuild = pickle.loads(pickle.dumps(handler))
+    assert (rebuild.offsets == handler.offsets).all()
+
+    # Or can be stored and loaded
+    handler.save_offsets(Path(tmp_path, "offsets.npy"))
+    handler = MmapHandler(vul_path, offsets=Path(tmp_path, "offsets.npy"))
+    assert handler.size == ref.size
+
+
+def test_read_ahead():
+    items = list(read_ahead(lambda x: x * 2, range(5), depth=2))
+    assert items == [(0, 0), (1, 2), (2, 4), (3, 6), (4, 8)]
+    # Without reading ahead
+    items = list(read_ahead(lambda x: x * 2, range(2), depth=0))
+    assert items == [(0, 0), (1, 2)]
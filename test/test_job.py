@@ -1,7 +1,11 @@
 from multiprocessing import get_context
+from pathlib import Path
 from typing import Generator
 
+from fiat.cfg import Configurations
+from fiat.cli.util import run_profiler
 from fiat.job import execute_pool, generate_jobs
+from fiat.log import spawn_logger
 
 
 def test_generate_jobs_simple():
@@ -86,3 +90,46 @@ def test_execute_pool_multi_thread():
     )
 
     assert res == [8, 10, 16, 20]
+
+
+def test_execute_pool_profile(tmp_path):
+    # Setup the context
+    ctx = get_context("spawn")
+
+    # Execute the pool while profiling only the first two jobs
+    res = execute_pool(
+        ctx=ctx,
+        func=multiply,
+        jobs=generate_jobs({"x": [2, 4], "y": [4, 5]}),
+        threads=2,
+        profile=Path(tmp_path, "profile"),
+        profile_jobs=2,
+    )
+
+    # Assert the output and the profiling files
+    assert res == [8, 10, 16, 20]
+    files = list(tmp_path.glob("profile_job*.prof"))
+    assert len(files) == 2
+    assert sorted([item.name.split("_")[1] for item in files]) == ["job1", "job2"]
+
+
+def test_run_profiler(tmp_path):
+    cfg = Configurations(_root=tmp_path)
+    cfg.setup_output_dir(str(tmp_path))
+
+    def run():
+        return execute_pool(
+            ctx=get_context("spawn"),
+            func=multiply,
+            jobs=generate_jobs({"x": [2, 4], "y": [4, 5]}),
+            threads=2,
+            profile=cfg.get("_profile"),
+        )
+
+    # The stats of the worker jobs are merged into a single profile
+    run_profiler(run, "profile", cfg, spawn_logger("fiat.test"))
+    assert Path(tmp_path, "profile").is_file()
+    assert Path(tmp_path, "profile.txt").is_file()
+    assert len(list(tmp_path.glob("profile_job*.prof"))) == 0
+    with open(Path(tmp_path, "profile.txt")) as _r:
+        assert "multiply" in _r.read()
@@ -1,7 +1,17 @@
 import io
+import json
+import queue
 from pathlib import Path
 
-from fiat.log import CHandler, Logger, MessageFormatter, spawn_logger
+from fiat.log import (
+    CHandler,
+    Logger,
+    MessageFormatter,
+    Progress,
+    ProgressSender,
+    Receiver,
+    spawn_logger,
+)
 
 
 def test_stream(log1, log2):
@@ -42,3 +52,30 @@ def test_log(tmp_path):
     fh = open(Path(str(tmp_path), "test_log.log"), mode="r")
 
     assert sum(1 for _ in fh) == 5
+
+
+def test_progress(tmp_path):
+    q = queue.Queue()
+    progress = Progress(10, show=False, dst=Path(tmp_path, "progress.json"))
+    receiver = Receiver(q)
+    receiver.set_progress(progress)
+    receiver.start()
+
+    sender = ProgressSender(q, interval=0)
+    sender.add(4)
+    sender.add()
+    sender.finish()
+    receiver.close()
+    progress.stop()
+
+    # Progress items are not counted as logged records
+    assert receiver.count == 0
+    assert progress.count == 5
+
+    with open(Path(tmp_path, "progress.json")) as _r:
+        info = json.load(_r)
+    assert info["total"] == 10
+    assert info["processed"] == 5
+    assert info["done"]
+    assert len(info["workers"]) == 1
+    assert list(info["workers"].values())[0]["done"]
@@ -43,6 +43,18 @@ def test_calc_haz():
     assert int(dmg * 100) == 350
     assert int(red_f * 100) == 75
 
+    # Weighted, e.g. by the covered area
+    dmg, red_f = calculate_hazard(
+        [0, 2.5, 5, 10],
+        reference="dem",
+        ground_flht=1.0,
+        ground_elevtn=0,
+        method="mean",
+        weights=[1, 0.5, 0.5, 1],
+    )
+    assert int(dmg * 1000) == 5875
+    assert int(red_f * 100) == 66
+
 
 def test_calc_risk():
     rps = [1, 2, 5, 25, 50, 100]
@@ -1,4 +1,64 @@
+import pickle
+
+import numpy as np
+from osgeo import gdal
+
 from fiat import Configurations, GeomModel, GridModel
+from fiat.models.util import (
+    Aggregates,
+    gdal_config,
+    gdal_default_cache,
+    grid_output_options,
+    set_gdal_config,
+)
+
+
+def test_aggregates(tmp_path):
+    agg = Aggregates()
+    agg.add("damage", np.array([1, 2, 1]), np.array([1.0, 2.0, 3.0]))
+    assert agg.keys() == [1, 2]
+
+    # Merge partial aggregates, e.g. of another worker
+    other = Aggregates(["damage"])
+    other.add_row(1, [5.0])
+    other.add_row(3, [None])
+    other.add_row(3, ["nan"])  # I.e. the damage of a dry object
+    agg.merge(pickle.loads(pickle.dumps(other)))
+    assert agg._data["damage"][1] == [9.0, 3, 5.0]
+
+    agg.add_linear("ead", ["damage"], [0.5])
+    agg.write(tmp_path / "zones.csv", ["zone"])
+    with open(tmp_path / "zones.csv") as _r:
+        lines = _r.read().splitlines()
+    assert lines[0].startswith("zone,damage_total,damage_count,damage_max")
+    assert lines[1].startswith("1,9.0,3,5.0,4.5")
+
+
+def test_gdal_config(tmp_path):
+    cfg = Configurations(
+        _root=tmp_path,
+        **{
+            "model.gdal.cache": 100,
+            "model.gdal.num_threads": 2,
+            "model.gdal.disable_readdir": True,
+            "model.gdal.options.gdal_http_max_retry": 3,
+        },
+    )
+    config = gdal_config(cfg, threads=2)
+    assert config["cache"] == 50 * 1024**2
+    assert config["options"]["GDAL_NUM_THREADS"] == "2"
+    assert config["options"]["GDAL_DISABLE_READDIR_ON_OPEN"] == "YES"
+    assert config["options"]["GDAL_HTTP_MAX_RETRY"] == "3"
+
+    # The default cache of GDAL is divided, also after setting the cache
+    set_gdal_config(config)
+    assert gdal.GetCacheMax() == 50 * 1024**2
+    default = Configurations(_root=tmp_path)
+    cache = gdal_config(default, threads=4)["cache"]
+    assert cache == int(gdal_default_cache() / 4)
+    set_gdal_config(gdal_config(default, threads=4))
+    assert gdal_config(default, threads=4)["cache"] == cache
+    gdal.SetCacheMax(gdal_default_cache())
 
 
 def test_geommodel(tmp_path, settings_files):
@@ -29,6 +89,32 @@ def test_geommodel(tmp_path, settings_files):
     assert model.exposure_data is None
     assert model.threads == 4
 
+    # Set a memory limit (in MB) that is divided over the threads
+    cfg.set("model.memory_limit", 400)
+    model = GeomModel(cfg)
+    assert model.cfg.get("_memory")["worker"] == 100 * 1024**2
+    assert model.cfg.get("_memory")["cache"] == 25 * 1024**2
+
+
+def test_geommodel_parts(tmp_path, settings_files):
+    cfg = Configurations.from_file(settings_files["geom_event"])
+    path = tmp_path / "spatial.gpkg"
+    src = str(cfg.get("exposure.geom.file1"))
+    gdal.VectorTranslate(str(path), src, format="GPKG")
+    cfg.set("exposure.geom.file1", path)
+    cfg.set("model.geom.points", True)
+    cfg.set("model.geom.order", "hilbert")
+    model = GeomModel(cfg)
+    model._set_points()
+    model._set_order()
+    assert cfg.get("_exposure_points") is None
+
+    # A chunk only carries the feature ids and points of its own features
+    part = model._chunk_parts((3, 4))[1]
+    assert part["order"].tolist() == model.exposure_order[1][2:4].tolist()
+    assert sorted(part["points"]["fid"].tolist()) == sorted(part["order"].tolist())
+    assert part["points"]["points"].shape == (2, 2)
+
 
 def test_gridmodel(tmp_path, settings_files):
     cfg = Configurations.from_file(settings_files["grid_event"])
@@ -46,3 +132,27 @@ def test_gridmodel(tmp_path, settings_files):
     model = GridModel(cfg)
     assert model.exposure_grid is not None
     assert model.vulnerability_data is not None
+
+
+def test_grid_output_options(tmp_path):
+    cfg = Configurations(_root=tmp_path)
+    cfg.set("output.grid.format", "netcdf")
+    suffix, options = grid_output_options(cfg, gdal.GDT_Float32)
+    assert suffix == ".nc"
+    assert options == ["FORMAT=NC4", "COMPRESS=DEFLATE"]
+
+    # By default a tiled geotiff, compressed with the threads of a worker
+    cfg.pop("output.grid.format")
+    cfg.set("output.grid.level", 9)
+    cfg.set("model.gdal.num_threads", 2)
+    suffix, options = grid_output_options(cfg, gdal.GDT_Float32)
+    assert suffix == ".tif"
+    assert "TILED=YES" in options
+    assert "SPARSE_OK=TRUE" in options
+    assert "NUM_THREADS=2" in options
+    assert "PREDICTOR=3" in options
+    assert "ZSTD_LEVEL=9" in options
+
+    _, options = grid_output_options(cfg, gdal.GDT_Int32, cog=True)
+    assert "BLOCKSIZE=256" in options
+    assert "PREDICTOR=YES" in options
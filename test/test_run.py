@@ -1,10 +1,12 @@
 import copy
 from pathlib import Path
 
-from osgeo import gdal
+import numpy as np
+from osgeo import gdal, ogr, osr
 
-from fiat.fio import open_csv, open_grid
+from fiat.fio import open_csv, open_geom, open_grid, read_cache
 from fiat.models import GeomModel, GridModel
+from fiat.models.worker_geom import _is_wet
 
 
 def run_model(cfg, p):
@@ -28,6 +30,35 @@ def test_geom_event(tmp_path, configs):
     assert int(float(out[3, "total_damage"])) == 1038
 
 
+def test_geom_aggregate(tmp_path, configs):
+    # Run the model, only writing the csv and the aggregates
+    cfg = copy.deepcopy(configs["geom_event"])
+    cfg.set("output.aggregate", ["object_name"])
+    cfg.set("output.geom.write", False)
+    run_model(cfg, tmp_path)
+    assert not Path(str(tmp_path), "spatial.gpkg").exists()
+
+    # The totals of the groups add up to the total of the objects
+    out = open_csv(Path(str(tmp_path), "output.csv"), index="object_id")
+    agg = open_csv(Path(str(tmp_path), "aggregate.csv"), index="object_name")
+    total = sum([float(out[oid, "total_damage"]) for oid in out.index])
+    total_agg = sum([float(agg[key, "total_damage_total"]) for key in agg.index])
+    assert int(total_agg) == int(total)
+
+    # Groups with both wet and dry (nan) objects
+    cfg = copy.deepcopy(configs["geom_event_outside"])
+    cfg.set("output.aggregate", ["fn_damage_structure"])
+    run_model(cfg, Path(str(tmp_path), "outside"))
+    out = open_csv(Path(str(tmp_path), "outside", "output.csv"), index="object_id")
+    agg = open_csv(
+        Path(str(tmp_path), "outside", "aggregate.csv"),
+        index="fn_damage_structure",
+    )
+    total = sum([float(out[oid, "total_damage"]) for oid in out.index])
+    total_agg = sum([float(agg[key, "total_damage_total"]) for key in agg.index])
+    assert int(total_agg) == int(total)
+
+
 def test_geom_missing(tmp_path, configs):
     # run the model
     run_model(configs["geom_event_missing"], tmp_path)
@@ -38,6 +69,74 @@ def test_geom_missing(tmp_path, configs):
     assert sum(1 for _ in missing) == 1
 
 
+def test_geom_null_id(tmp_path, configs):
+    # A copy of the exposure geometries with one feature without an id
+    cfg = copy.deepcopy(configs["geom_event"])
+    src = gdal.OpenEx(str(cfg.get("exposure.geom.file1")), gdal.OF_VECTOR)
+    path = Path(tmp_path, "spatial_null.gpkg")
+    gdal.VectorTranslate(str(path), src, format="GPKG")
+    src = None
+    ds = ogr.Open(str(path), update=1)
+    layer = ds.GetLayer()
+    for ft in layer:
+        if ft.GetField("object_id") == 1:
+            ft.SetFieldNull("object_id")
+            layer.SetFeature(ft)
+    ds = None
+    cfg.set("exposure.geom.file1", path)
+    run_model(cfg, Path(tmp_path, "output"))
+
+    # Only the feature without an id is skipped
+    missing = open(Path(tmp_path, "output", "missing.log"), "r")
+    assert sum(1 for _ in missing) == 1
+    out = open_csv(Path(tmp_path, "output", "output.csv"), index="object_id")
+    assert len(out.index) == 3
+    assert int(float(out[2, "total_damage"])) == 740
+    assert int(float(out[3, "total_damage"])) == 1038
+
+
+def test_geom_order(tmp_path, configs):
+    # Run the model, processing the features in spatial order
+    cfg = copy.deepcopy(configs["geom_event"])
+    cfg.set("model.geom.order", "hilbert")
+    run_model(cfg, tmp_path)
+
+    # The same output, in the same order
+    out = open_csv(Path(str(tmp_path), "output.csv"), index="object_id")
+    assert int(float(out[2, "total_damage"])) == 740
+    assert int(float(out[3, "total_damage"])) == 1038
+    gm = open_geom(Path(str(tmp_path), "spatial.gpkg"))
+    oids = [ft.GetField("object_id") for ft in gm]
+    assert oids == sorted(oids)
+    gm.close()
+
+    # Also with multiple chunks (and buffers) in spatial order
+    cfg = copy.deepcopy(configs["geom_event"])
+    cfg.set("model.geom.order", "hilbert")
+    cfg.set("model.geom.chunk", 2)
+    run_model(cfg, Path(tmp_path, "chunked"))
+    gm = open_geom(Path(tmp_path, "chunked", "spatial.gpkg"))
+    assert gm.size == 4
+    assert [ft.GetField("object_id") for ft in gm] == oids
+    gm.close()
+
+    # Cached on the source file when reprojecting to a new file
+    cfg = copy.deepcopy(configs["geom_event"])
+    path = Path(tmp_path, "spatial_3857.gpkg")
+    gdal.VectorTranslate(
+        str(path),
+        str(cfg.get("exposure.geom.file1")),
+        format="GPKG",
+        dstSRS="EPSG:3857",
+    )
+    cfg.set("exposure.geom.file1", path)
+    cfg.set("model.geom.order", "hilbert")
+    cfg.set("model.cache", str(Path(tmp_path, "cache")))
+    run_model(cfg, Path(tmp_path, "reprojected"))
+    fids = read_cache(path, Path(tmp_path, "cache"), order="hilbert", srs="EPSG:4326")
+    assert len(fids) == 4
+
+
 def test_geom_outside(tmp_path, configs):
     # run the model
     run_model(configs["geom_event_outside"], tmp_path)
@@ -50,6 +149,87 @@ def test_geom_outside(tmp_path, configs):
     assert float(data[1, "damage_structure"]) == 1804.0
 
 
+def test_geom_points(tmp_path, configs):
+    # Determine the points once, without caching them
+    cfg = copy.deepcopy(configs["geom_event"])
+    cfg.set("model.geom.points", True)
+    exp_cache = Path(cfg.get("exposure.geom.file1")).parent / ".fiat_cache"
+    before = sorted(exp_cache.glob("*.pkl"))
+    run_model(cfg, Path(tmp_path, "plain"))
+    assert sorted(exp_cache.glob("*.pkl")) == before
+    out = open_csv(Path(tmp_path, "plain", "output.csv"), index="object_id")
+    assert int(float(out[2, "total_damage"])) == 740
+
+    # Cached in the directory of the model cache
+    cfg = copy.deepcopy(configs["geom_event"])
+    cfg.set("model.geom.points", True)
+    cfg.set("model.cache", str(Path(tmp_path, "cache")))
+    run_model(cfg, Path(tmp_path, "cached"))
+    path = cfg.get("exposure.geom.file1")
+    points = read_cache(path, Path(tmp_path, "cache"), points=True, srs="EPSG:4326")
+    assert points["points"].shape == (4, 2)
+
+    # Keyed on the source file when reprojecting to a new file
+    cfg = copy.deepcopy(configs["geom_event"])
+    path = Path(tmp_path, "spatial_3857.gpkg")
+    gdal.VectorTranslate(
+        str(path),
+        str(cfg.get("exposure.geom.file1")),
+        format="GPKG",
+        dstSRS="EPSG:3857",
+    )
+    cfg.set("exposure.geom.file1", path)
+    cfg.set("model.geom.points", True)
+    cfg.set("model.cache", str(Path(tmp_path, "cache")))
+    run_model(cfg, Path(tmp_path, "reprojected"))
+    points = read_cache(path, Path(tmp_path, "cache"), points=True, srs="EPSG:4326")
+    assert points["points"].shape == (4, 2)
+
+
+def test_geom_prefilter(tmp_path, configs):
+    # Hazard data that is dry in the upper right block (the third feature)
+    cfg = copy.deepcopy(configs["geom_event_outside"])
+    path = Path(tmp_path, "hazard.tif")
+    gdal.Translate(str(path), str(cfg.get("hazard.file")), format="GTiff")
+    src = gdal.OpenEx(str(path), gdal.OF_RASTER | gdal.OF_UPDATE)
+    src.GetRasterBand(1).WriteArray(np.zeros((2, 2)), 8, 0)
+    src = None
+    cfg.set("hazard.file", path)
+    ref = copy.deepcopy(cfg)
+    run_model(ref, Path(tmp_path, "ref"))
+
+    # Run the model, skipping the hazard of the features in dry blocks
+    cfg.set("model.geom.prefilter", True)
+    cfg.set("model.geom.prefilter_chunk", [2, 2])
+    run_model(cfg, Path(tmp_path, "filtered"))
+    chunk, wet = cfg.get("_hazard_wet")
+    assert chunk == (2, 2)
+    assert not wet[0, 4]
+    assert wet.sum() == wet.size - 1
+
+    # The same output as without the filter
+    data = open_csv(Path(tmp_path, "filtered", "output.csv"), index="object_id")
+    data_ref = open_csv(Path(tmp_path, "ref", "output.csv"), index="object_id")
+    for oid in data_ref.index:
+        assert data[oid, "total_damage"] == data_ref[oid, "total_damage"]
+    assert float(data[2, "damage_structure"]) == 1804.0
+
+
+def test_geom_prefilter_is_wet():
+    # Only the upper left block (of 2 by 2 cells) is wet
+    wet = np.zeros((2, 2), dtype=bool)
+    wet[0, 0] = True
+    table = np.zeros((3, 3), dtype=int)
+    table[1:, 1:] = wet.cumsum(0).cumsum(1)
+    gtf = (0.0, 1.0, 0.0, 4.0, 0.0, -1.0)
+
+    # Envelopes as minx, maxx, miny, maxy
+    assert _is_wet((0.5, 1.5, 2.5, 3.5), ((2, 2), table), gtf, (4, 4))
+    assert _is_wet((1.5, 2.5, 1.5, 2.5), ((2, 2), table), gtf, (4, 4))
+    assert not _is_wet((2.5, 3.5, 0.5, 1.5), ((2, 2), table), gtf, (4, 4))
+    assert not _is_wet((5.0, 6.0, 5.0, 6.0), ((2, 2), table), gtf, (4, 4))
+
+
 def test_geom_risk(tmp_path, configs):
     # run the model
     run_model(configs["geom_risk"], tmp_path)
@@ -67,7 +247,7 @@ def test_grid_event(tmp_path, configs):
 
     # Check the output for this specific case
     src = gdal.OpenEx(
-        str(Path(str(tmp_path), "output.nc")),
+        str(Path(str(tmp_path), "output.tif")),
     )
     arr = src.ReadAsArray()
     src = None
@@ -75,7 +255,7 @@ def test_grid_event(tmp_path, configs):
     assert int(arr[7, 3] * 10) == 8700
 
     src = gdal.OpenEx(
-        str(Path(str(tmp_path), "total_damages.nc")),
+        str(Path(str(tmp_path), "total_damages.tif")),
     )
     arr = src.ReadAsArray()
     src = None
@@ -83,12 +263,203 @@ def test_grid_event(tmp_path, configs):
     assert int(arr[7, 3] * 10) == 8700
 
 
+def test_grid_gdal_config(tmp_path, configs):
+    # One band, so one worker process gets all of the cache
+    cfg = copy.deepcopy(configs["grid_event"])
+    cfg.set("model.threads", 2)
+    cfg.set("model.gdal.cache", 64)
+    cache = gdal.GetCacheMax()
+    run_model(cfg, tmp_path)
+    assert cfg.get("_gdal")["cache"] == 64 * 1024**2
+
+    # The configuration of the current process is restored
+    assert gdal.GetCacheMax() == cache
+
+
+def _read_grids(path):
+    arrs = []
+    for name in ["output.tif", "total_damages.tif"]:
+        src = gdal.OpenEx(str(Path(path, name)))
+        arrs.append(src.ReadAsArray())
+        src = None
+    return arrs
+
+
+def test_grid_background(tmp_path, configs):
+    # The default run, in windows of 4 by 4 cells
+    cfg = copy.deepcopy(configs["grid_event"])
+    cfg.set("model.grid.chunk", [4, 4])
+    run_model(cfg, Path(tmp_path, "default"))
+
+    # Reading ahead and writing behind in background threads
+    cfg = copy.deepcopy(configs["grid_event"])
+    cfg.set("model.grid.chunk", [4, 4])
+    cfg.set("model.grid.prefetch", 2)
+    cfg.set("model.grid.write_behind", 2)
+    run_model(cfg, Path(tmp_path, "background"))
+
+    for arr, ref in zip(
+        _read_grids(Path(tmp_path, "background")),
+        _read_grids(Path(tmp_path, "default")),
+    ):
+        np.testing.assert_array_equal(arr, ref)
+
+
+def test_grid_sparse(tmp_path, configs):
+    # The dense run
+    cfg = copy.deepcopy(configs["grid_event"])
+    run_model(cfg, Path(tmp_path, "dense"))
+
+    # Only the exposed cells, also memory mapped
+    for mmap in [False, True]:
+        cfg = copy.deepcopy(configs["grid_event"])
+        cfg.set("model.grid.sparse", True)
+        cfg.set("model.grid.sparse_mmap", mmap)
+        run_model(cfg, Path(tmp_path, f"sparse_{mmap}"))
+        assert not Path(tmp_path, f"sparse_{mmap}", ".sparse").exists()
+
+        for arr, ref in zip(
+            _read_grids(Path(tmp_path, f"sparse_{mmap}")),
+            _read_grids(Path(tmp_path, "dense")),
+        ):
+            np.testing.assert_array_equal(arr, ref)
+
+
+def test_grid_skip_empty(tmp_path, configs):
+    # Exposure data without data in the upper left window
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    src = gdal.GetDriverByName("netCDF").Create(
+        str(Path(tmp_path, "exposure.nc")), 10, 10, 1, gdal.GDT_Float32
+    )
+    src.SetSpatialRef(srs)
+    src.SetGeoTransform((4.35, 0.01, 0, 52.05, 0, -0.01))
+    band = src.GetRasterBand(1)
+    band.SetNoDataValue(-9999)
+    data = 2000 + np.add.outer(np.arange(10), np.arange(10)) * 100.0
+    data[:4, :4] = -9999
+    band.WriteArray(data)
+    band.SetMetadataItem("fn_damage", "struct_1")
+    band = None
+    src = None
+
+    # The window is reported as empty
+    gs = open_grid(Path(tmp_path, "exposure.nc"))
+    occ = gs[1].occupancy((4, 4))
+    gs.close()
+    gs = None
+    assert not occ[0, 0]
+    assert occ.sum() == occ.size - 1
+
+    # Run the model with and without skipping the empty windows
+    for skip in [True, False]:
+        cfg = copy.deepcopy(configs["grid_event"])
+        cfg.set("exposure.grid.file", Path(tmp_path, "exposure.nc"))
+        cfg.set("model.grid.chunk", [4, 4])
+        cfg.set("model.grid.skip_empty", skip)
+        run_model(cfg, Path(tmp_path, f"skip_{skip}"))
+
+    # The empty window stays nodata
+    src = gdal.OpenEx(str(Path(tmp_path, "skip_True", "output.tif")))
+    nodata = src.GetRasterBand(1).GetNoDataValue()
+    arr = src.ReadAsArray()
+    src = None
+    assert (arr[:4, :4] == nodata).all()
+    assert (arr[4:, 4:] != nodata).all()
+    for arr, ref in zip(
+        _read_grids(Path(tmp_path, "skip_True")),
+        _read_grids(Path(tmp_path, "skip_False")),
+    ):
+        np.testing.assert_array_equal(arr, ref)
+
+    # Also without sparse files, i.e. netcdf
+    cfg = copy.deepcopy(configs["grid_event"])
+    cfg.set("exposure.grid.file", Path(tmp_path, "exposure.nc"))
+    cfg.set("model.grid.chunk", [4, 4])
+    cfg.set("output.grid.format", "netcdf")
+    run_model(cfg, Path(tmp_path, "netcdf"))
+    for name in ["output.nc", "total_damages.nc"]:
+        src = gdal.OpenEx(str(Path(tmp_path, "netcdf", name)))
+        nodata = src.GetRasterBand(1).GetNoDataValue()
+        arr = src.ReadAsArray()
+        src = None
+        assert (arr[:4, :4] == nodata).all()
+        assert (arr[4:, 4:] != nodata).all()
+
+
+def _zone_totals(path, field="zone"):
+    out = open_csv(path, index=field)
+    return {int(z): float(out[z, "total_total"]) for z in out.index}
+
+
+def test_grid_zones(tmp_path, configs):
+    # Zones as a grid, the upper and lower half of the exposure grid
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    src = gdal.GetDriverByName("GTiff").Create(
+        str(Path(tmp_path, "zones.tif")), 10, 10, 1, gdal.GDT_Int32
+    )
+    src.SetGeoTransform((4.35, 0.01, 0, 52.05, 0, -0.01))
+    src.SetSpatialRef(srs)
+    band = src.GetRasterBand(1)
+    band.SetNoDataValue(-9999)
+    band.WriteArray(np.repeat([[1], [2]], 5, axis=0).repeat(10, axis=1))
+    band = None
+    src = None
+
+    cfg = copy.deepcopy(configs["grid_event"])
+    cfg.set("output.zones.file", str(Path(tmp_path, "zones.tif")))
+    run_model(cfg, Path(tmp_path, "grid"))
+    totals = _zone_totals(Path(tmp_path, "grid", "zones.csv"))
+    assert sorted(totals) == [1, 2]
+
+    # The zones add up to the total damages
+    gs = open_grid(Path(tmp_path, "grid", "total_damages.tif"))
+    arr = gs[1][:]
+    arr = arr[arr != gs[1].nodata]
+    gs.close()
+    gs = None
+    assert round(sum(totals.values()), 2) == round(float(np.nansum(arr)), 2)
+
+    # The same zones as polygons in another projection
+    out_srs = osr.SpatialReference()
+    out_srs.ImportFromEPSG(3857)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    out_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(srs, out_srs)
+    ds = ogr.GetDriverByName("GeoJSON").CreateDataSource(
+        str(Path(tmp_path, "zones.geojson"))
+    )
+    layer = ds.CreateLayer("zones", out_srs, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn("zone_id", ogr.OFTInteger))
+    for zone, (bottom, top) in enumerate([(52.0, 52.05), (51.95, 52.0)], start=1):
+        geom = ogr.CreateGeometryFromWkt(
+            f"POLYGON ((4.35 {bottom}, 4.45 {bottom}, 4.45 {top}, 4.35 {top}, \
+4.35 {bottom}))"
+        )
+        geom.Transform(transform)
+        ft = ogr.Feature(layer.GetLayerDefn())
+        ft.SetField("zone_id", zone)
+        ft.SetGeometry(geom)
+        layer.CreateFeature(ft)
+    ft = None
+    layer = None
+    ds = None
+
+    cfg = copy.deepcopy(configs["grid_event"])
+    cfg.set("output.zones.file", str(Path(tmp_path, "zones.geojson")))
+    cfg.set("output.zones.field", "zone_id")
+    run_model(cfg, Path(tmp_path, "geom"))
+    assert Path(tmp_path, "geom", "zones_repr_rasterized.tif").exists()
+    assert _zone_totals(Path(tmp_path, "geom", "zones.csv"), "zone_id") == totals
+
+
 def test_grid_unequal(tmp_path, configs):
     # Run the model
     cfg = copy.deepcopy(configs["grid_unequal"])
     run_model(cfg, tmp_path)
     # Assert the output
-    file = Path(tmp_path, "output.nc")
+    file = Path(tmp_path, "output.tif")
     assert file.is_file()
     # Check the output
     gs = open_grid(file)
@@ -112,7 +483,7 @@ def test_grid_risk(tmp_path, configs):
 
     # Check the output for this specific case
     src = gdal.OpenEx(
-        str(Path(str(tmp_path), "ead.nc")),
+        str(Path(str(tmp_path), "ead.tif")),
     )
     arr = src.ReadAsArray()
     src = None
@@ -120,7 +491,7 @@ def test_grid_risk(tmp_path, configs):
     assert int(arr[5, 6] * 10) == 8468
 
     src = gdal.OpenEx(
-        str(Path(str(tmp_path), "ead_total.nc")),
+        str(Path(str(tmp_path), "ead_total.tif")),
     )
     arr = src.ReadAsArray()
     src = None
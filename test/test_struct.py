@@ -2,6 +2,53 @@ import copy
 import math
 import pickle
 
+import numpy as np
+
+from fiat.fio import ArrayIndex, CurveTable, SparseGrid, TableLazy, open_csv
+
+
+def test_arrayindex():
+    index = ArrayIndex([3, 1, 2, 1], [10, 11, 12, 13])
+    assert index.keys() == (3, 1, 2)
+    assert index[1] == 13  # Last one of the duplicates, like a dict
+    assert 5 not in index
+    assert index.get_many([1, 5, 3]).tolist() == [13, -1, 10]
+
+    # A missing key only misses itself
+    assert index.get_many([1, None, 3]).tolist() == [13, -1, 10]
+    index = ArrayIndex(["a", "b"])
+    assert index.get_many(["b", None, 1, "a"]).tolist() == [1, -1, -1, 0]
+
+    # Without the dictionary for small indices
+    index._lookup = None
+    assert index[3] == 10
+    assert "a" not in index
+
+    # Pickle it
+    rebuild = pickle.loads(pickle.dumps(index))
+    assert rebuild[2] == 12
+
+
+def test_curvetable(vul_data):
+    tb = copy.deepcopy(vul_data)
+    ct = CurveTable.from_table(tb)
+    assert len(ct.index) == 21
+    assert int(ct[9, "struct_2"] * 100) == 74
+    assert int(ct[8.99, "struct_2"] * 10000) == 7389  # Interpolated
+    assert ct[99, "struct_2"] == ct[20, "struct_2"]  # Clipped to the range
+
+    # Vectorized and snapped to the step size, i.e. the same as upscaled
+    ct = CurveTable.from_table(tb, step=0.01)
+    tb.upscale(0.01, inplace=True)
+    values = np.array([0.004, 8.236, 8.99, 25.0])
+    res = ct.interp(values, "struct_2")
+    ref = [tb[round(min(n, 20), 2), "struct_2"] for n in values.tolist()]
+    assert np.allclose(res, ref)
+
+    # Stucture should be able to be pickled
+    rebuild = pickle.loads(pickle.dumps(ct))
+    assert rebuild[8.99, "struct_2"] == ct[8.99, "struct_2"]
+
 
 def test_geomsource(geom_data):
     # Do Attribute checks
@@ -16,6 +63,20 @@ def test_geomsource(geom_data):
     srs = geom_data.srs
     assert srs.GetAuthorityCode(None) == "4326"
 
+    # Only read the features of an interval
+    oids = [ft.GetField("object_id") for ft in geom_data.layer]
+    part = [ft.GetField("object_id") for ft in geom_data.reduced_iter(2, 3)]
+    assert part == oids[1:3]
+    part = [ft.GetField("object_id") for ft in geom_data.reduced_iter(4, 10)]
+    assert part == oids[3:]
+
+    # Features by their feature id, keeping track of the ones not found
+    fids = [ft.GetFID() for ft in geom_data.layer]
+    missing = []
+    part = [ft.GetFID() for ft in geom_data.fid_iter([fids[2], 999], missing)]
+    assert part == [fids[2]]
+    assert missing == [999]
+
     # Stucture should be able to be pickled
     reduced = pickle.dumps(geom_data)
     # Rebuild it
@@ -37,6 +98,14 @@ def test_gridsource(grid_event_data):
     srs = grid_event_data.srs
     assert srs.GetAuthorityCode(None) == "4326"
 
+    # Windows of a band, without empty ones at the edges
+    band = grid_event_data[1]
+    assert len(band.block_size) == 2
+    band.set_chunk_size((5, 5))
+    windows = [_w for _w, _ in band]
+    assert len(windows) == 4
+    assert windows[-1] == (5, 5, 5, 5)
+
     # Stucture should be able to be pickled
     reduced = pickle.dumps(grid_event_data)
     # Rebuild it
@@ -44,6 +113,31 @@ def test_gridsource(grid_event_data):
     assert rebuild.shape == (10, 10)
 
 
+def test_grid_occupancy(grid_exp_data):
+    band = grid_exp_data[1]
+    occ = band.occupancy((4, 4))
+    assert occ.shape == (3, 3)  # Smaller windows at the edges
+    assert occ.all()
+
+    # Nothing above a very high threshold
+    assert not band.occupancy((4, 4), threshold=1e12).any()
+
+
+def test_sparse_grid(tmp_path, grid_exp_data):
+    sg = SparseGrid.from_grid(grid_exp_data, (4, 4))
+    assert sg.size == 1
+    assert len(sg) == 100
+    assert sg.count(1, (8, 8, 2, 2)) == 4
+    rows, cols, values = sg.cells(1, (4, 0, 4, 4))
+    data = grid_exp_data[1][(4, 0, 4, 4)]
+    assert (data[rows, cols] == values).all()
+
+    # Memory mapped, only the path is pickled
+    sg.save(tmp_path)
+    rebuild = pickle.loads(pickle.dumps(sg))
+    assert rebuild.count(1, (4, 0, 4, 4)) == 16
+
+
 def test_tabel(vul_data, vul_data_win):
     tb = copy.deepcopy(vul_data)
     assert tb.nchar == b"\n"
@@ -73,3 +167,57 @@ def test_tabel(vul_data, vul_data_win):
     # Rebuild it
     rebuild = pickle.loads(reduced)
     assert int(rebuild[8.99, "struct_2"] * 10000) == 7389
+
+
+def test_tabel_columnar(vul_path, vul_data):
+    tb = open_csv(vul_path, index="water depth", columnar=True)
+    assert tb.columnar
+    assert tb.column("struct_2").dtype == np.float64
+    assert int(tb[2.25, "struct_2"] * 100) == 74
+    assert (tb.data == vul_data.data[:, 1:]).all()
+
+    # Columns are views, rows can be selected at once
+    assert np.shares_memory(tb.column("struct_1"), tb[:, "struct_1"])
+    sub = tb.take([2.25, 0.5])
+    assert sub.index == (2.25, 0.5)
+    assert int(sub[2.25, "struct_2"] * 100) == 74
+    assert len(tb.upscale(0.01)) == 501
+
+    # Shared memory, only the references are pickled
+    tb.share()
+    rebuild = pickle.loads(pickle.dumps(tb))
+    assert int(rebuild[2.25, "struct_2"] * 100) == 74
+    tb.column("struct_2")[9] = 1.0
+    assert rebuild[2.25, "struct_2"] == 1.0  # Same memory
+    tb.column("struct_2")[9] = 0.74
+    tb.release()
+    assert int(tb[2.25, "struct_2"] * 100) == 74
+
+
+def test_tabel_lazy(vul_path):
+    tb = open_csv(vul_path, index="water depth", lazy=True)
+    rows = tb.get_many([2.25, 0.5, 99.0, 1.0])
+    assert len(rows) == 4
+    assert rows[0] == tb[2.25]
+    assert rows[1] == tb[0.5]
+    assert rows[2] is None  # Not present
+    assert rows[3].startswith(b"1.0")
+
+
+def test_tabel_numpy(vul_path, vul_data):
+    tb = open_csv(vul_path, engine="numpy")
+    assert tb.meta["dtypes"] == vul_data.meta["dtypes"]
+    assert tb.columns == vul_data.columns
+    assert tb.index == vul_data.index
+    assert (tb.data == vul_data.data).all()
+
+    # Parsed in parallel
+    tb = open_csv(vul_path, index="water depth", engine="numpy", threads=2)
+    assert len(tb.index) == 21
+    assert int(tb[2.25, "struct_2"] * 100) == 74
+
+    # Lazy, only the index is parsed
+    lazy = open_csv(vul_path, index="water depth", lazy=True, engine="numpy")
+    assert isinstance(lazy, TableLazy)
+    assert lazy.index == tb.index
+    assert lazy[2.25] == open_csv(vul_path, index="water depth", lazy=True)[2.25]
@@ -9,11 +9,14 @@ from fiat.util import (
     GEOM_READ_DRIVER_MAP,
     GEOM_WRITE_DRIVER_MAP,
     GRID_DRIVER_MAP,
+    batched,
+    chunk_from_blocks,
     create_1d_chunk,
     create_dir,
     create_windows,
     deter_dec,
     deter_type,
+    deter_type_array,
     discover_exp_columns,
     find_duplicates,
     flatten_dict,
@@ -22,14 +25,55 @@ from fiat.util import (
     get_module_attr,
     mean,
     object_size,
+    peak_rss,
     re_filter,
     read_gridsource_info,
     read_gridsource_layers,
     regex_pattern,
     replace_empty,
+    scan_text_chunk,
 )
 
 
+def test_batched():
+    batches = list(batched(range(7), 3))
+    assert len(batches) == 3
+    assert batches[0] == (0, 1, 2)
+    assert batches[-1] == (6,)
+
+    batches = list(batched([], 3))
+    assert len(batches) == 0
+
+
+def test_chunk_from_blocks():
+    # Multiples of the (combined) block size
+    chunk = chunk_from_blocks(
+        (1000, 1000),
+        [(128, 128), (256, 256)],
+        cell_size=8,
+        budget=8 * 600 * 600,
+    )
+    assert chunk == (512, 512)
+
+    # Strips (full width blocks)
+    chunk = chunk_from_blocks((1000, 500), [(1, 500)], cell_size=8, budget=8 * 5000)
+    assert chunk == (10, 500)
+
+    # Never smaller than one block, never larger than the shape
+    chunk = chunk_from_blocks((100, 100), [(256, 256)], cell_size=8, budget=1)
+    assert chunk == (100, 100)
+
+    # Mismatched blocks, multiples of the largest block within the budget
+    chunk = chunk_from_blocks(
+        (100000, 100000),
+        [(1000, 1000), (256, 256), (256, 256)],
+        cell_size=32,
+        budget=256 * 1024**2,
+    )
+    assert chunk == (4000, 2000)
+    assert chunk[0] * chunk[1] * 32 <= 256 * 1024**2
+
+
 def test_create_1d_chunk():
     length = 500
     parts = 6
@@ -94,6 +138,23 @@ def test_deter_type():
     assert out == 3  # Cannot solve, default to string
 
 
+def test_deter_type_array():
+    out = deter_type_array(np.array([b"2", b"2", b"-2E+3"]))
+    assert out == 1  # Integers
+
+    out = deter_type_array(np.array([b"2.2", b"2", b"2."]))
+    assert out == 2  # Floating point number
+
+    out = deter_type_array(np.array([b"2", b"", b"2"]))
+    assert out == 2  # Floating point number (int cant have nan)
+
+    out = deter_type_array(np.array([b"2", b"2", b"text"]))
+    assert out == 3  # strings
+
+    out = deter_type_array(np.array([b"-", b".5", b"1e"]))
+    assert out == 3  # Not numbers according to deter_type
+
+
 def test_discover_columns(geom_partial_data):
     cols = copy.deepcopy(geom_partial_data._columns)
     dmg_suffix, dmg_idx, missing = discover_exp_columns(cols, type="damage")
@@ -234,6 +295,14 @@ def test_object_size():
     assert size == 136
 
 
+def test_peak_rss():
+    rss = peak_rss()
+    if sys.platform == "win32":
+        assert rss is None
+    else:
+        assert rss > 0
+
+
 def test_re_filter():
     # Set up testing vars
     pattern = r"^fn_damage(_\w+)?$"
@@ -273,6 +342,21 @@ def test_regex_pattern(vul_raw_data):
     assert len(elem) == 1
 
 
+def test_scan_text_chunk(tmp_path):
+    p = Path(tmp_path, "data.csv")
+    with open(p, "wb") as _w:
+        _w.write(b"".join([f"{idx},{idx / 2},a{idx}\n".encode() for idx in range(50)]))
+
+    # Read in chunks much smaller than the part, without keeping the fields
+    index, types = scan_text_chunk(
+        p, 0, p.stat().st_size, ",", 3, idcol=0, chunk_size=16
+    )
+    assert index.tolist() == [str(idx).encode() for idx in range(50)]
+    assert types == [1, 2, 3]
+    index, _ = scan_text_chunk(p, 0, p.stat().st_size, ",", 3)
+    assert index is None
+
+
 def test_replace_emptry():
     data = [b"1", b"2", b"3"]
     out = replace_empty(data)